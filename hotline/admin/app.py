@@ -1,14 +1,60 @@
-import os
-from fastapi import FastAPI, Depends, HTTPException, Query, Request, Form
-from fastapi.responses import HTMLResponse, RedirectResponse
+import os, asyncio, datetime
+from contextlib import asynccontextmanager
+from email.utils import format_datetime, parsedate_to_datetime
+from urllib.parse import urlencode
+
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, Form, Body
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, StreamingResponse
 from fastapi.security import HTTPBasic, HTTPBasicCredentials, HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.templating import Jinja2Templates
-from bot.db import (
-    list_complaints, list_users, list_blocked,
-    block_user, unblock_user, set_status, stats_counts
+from sqlalchemy.exc import DBAPIError
+from brotli_asgi import BrotliMiddleware
+from bot.db import STATS_GROUPS, LANGS, SEARCH_WINDOW
+from bot.adb import (
+    wait_db, dispose_engine, shutdown_executor,
+    list_complaints_page, search_complaints_page, list_users_page, list_blocked_page,
+    block_user, unblock_user, set_status, stats_counts, stats_range,
+    block_users, unblock_users, set_statuses, close_stale, ticket_authors,
+    media_job_stats, list_media_jobs, retry_media_jobs, media_dedupe_stats,
+    data_version, invalidate_stats, outbox_stats, list_outbox_failed, retry_outbox,
+    create_broadcast, cancel_broadcast, get_broadcast, list_broadcasts
 )
+from bot import export, metrics, db
+
+# Пул и таймауты админки отдельно от бота (общий .env): движок и пул потоков adb
+# создаются лениво и берут размеры из configure_engine
+db.configure_engine(pool_size=int(os.getenv("ADMIN_DB_POOL_SIZE", "8")),
+                    max_overflow=int(os.getenv("ADMIN_DB_MAX_OVERFLOW", "0")),
+                    statement_timeout_ms=int(os.getenv("ADMIN_DB_STATEMENT_TIMEOUT_MS", "5000")))
+
+# Обработчики асинхронные: запросы к БД идут через bot/adb.py в пул потоков
+# размером с пул соединений, event loop не блокируется. Движок и пул потоков
+# создаются и закрываются здесь.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await wait_db()
+    yield
+    await dispose_engine()
+    shutdown_executor()
+
+app = FastAPI(title="Hotline Admin", lifespan=lifespan)
+
+@app.exception_handler(DBAPIError)
+async def db_error(request: Request, exc: DBAPIError):
+    # 57014 query_canceled — сработал statement_timeout: запрос слишком тяжёлый, а не сбой
+    if getattr(exc.orig, "pgcode", None) == "57014":
+        return JSONResponse({"detail": "Query timeout"}, status_code=503)
+    raise exc
+
+# Сжатие ответов: brotli, если клиент его принимает, иначе gzip. Выгрузка
+# /api/export не трогается: она либо уже сжата (gzip=1, parquet), либо идёт
+# длинным потоком, и сжимать её на лету — лишний CPU админки.
+COMPRESS_MIN_SIZE = int(os.getenv("ADMIN_COMPRESS_MIN_SIZE", "1000"))
+app.add_middleware(BrotliMiddleware, minimum_size=COMPRESS_MIN_SIZE, gzip_fallback=True,
+                   excluded_handlers=["^/api/export"])
+# снаружи сжатия: в метрику попадает полное время ответа (bot/metrics.py, отдаются на /metrics)
+app.add_middleware(metrics.HttpMetrics)
 
-app = FastAPI(title="Hotline Admin")
 templates = Jinja2Templates(directory="admin/templates")
 
 # API token (для программного доступа /api/*)
@@ -20,85 +66,357 @@ ADMIN_WEB_USER = os.getenv("ADMIN_WEB_USER", "admin")
 ADMIN_WEB_PASS = os.getenv("ADMIN_WEB_PASS", "change_this")
 basic = HTTPBasic()
 
-def auth_web(creds: HTTPBasicCredentials = Depends(basic)):
+async def auth_web(creds: HTTPBasicCredentials = Depends(basic)):
     if creds.username != ADMIN_WEB_USER or creds.password != ADMIN_WEB_PASS:
         raise HTTPException(401, "Unauthorized", headers={"WWW-Authenticate": "Basic"})
     return True
 
-def auth_api(creds: HTTPAuthorizationCredentials = Depends(bearer)):
+async def auth_api(creds: HTTPAuthorizationCredentials = Depends(bearer)):
     if not creds or creds.credentials != ADMIN_TOKEN:
         raise HTTPException(401, "Unauthorized")
     return True
 
+async def fetch_page(fn, *args, **kwargs):
+    # Курсоры приходят от клиента: битый токен — это 400, а не 500
+    try:
+        return await fn(*args, **kwargs)
+    except ValueError:
+        raise HTTPException(400, "Bad cursor")
+
+# Условные ответы /api/*: ETag и Last-Modified из data_versions. Версия читается
+# до данных — если запись успела пройти между двумя запросами, ответ новее ETag
+# и клиент просто перечитает его на следующем опросе. ADMIN_API_MAX_AGE > 0
+# позволяет клиенту не спрашивать сервер вовсе в течение этого времени.
+API_MAX_AGE = int(os.getenv("ADMIN_API_MAX_AGE", "0"))
+
+def _etag_match(header: str, etag: str) -> bool:
+    # Слабое сравнение (RFC 9110, 13.1.2): W/ не учитывается
+    if header.strip() == "*":
+        return True
+    return etag.removeprefix("W/") in {t.strip().removeprefix("W/") for t in header.split(",")}
+
+async def not_modified(request: Request, response: Response, name: str, daily: bool = False) -> Response | None:
+    version, changed_at, day_start = await data_version(name)
+    modified = max(changed_at, day_start) if daily else changed_at
+    headers = {
+        "ETag": f'W/"{name}-{version}' + (f'-{day_start:%Y%m%d}' if daily else "") + '"',
+        "Last-Modified": format_datetime(modified.astimezone(datetime.timezone.utc), usegmt=True),
+        "Cache-Control": f"private, max-age={API_MAX_AGE}, must-revalidate",
+    }
+    response.headers.update(headers)
+    inm, ims = request.headers.get("if-none-match"), request.headers.get("if-modified-since")
+    if inm is not None:
+        fresh = _etag_match(inm, headers["ETag"])
+    else:
+        try:
+            fresh = bool(ims) and modified.replace(microsecond=0) <= parsedate_to_datetime(ims)
+        except (TypeError, ValueError):
+            fresh = False
+    return Response(status_code=304, headers=headers) if fresh else None
+
+def page_links(path: str, pg, **params) -> dict:
+    params = {k: v for k, v in params.items() if v}
+    return {
+        "next_url": f"{path}?{urlencode(dict(params, after=pg.next))}" if pg.next else None,
+        "prev_url": f"{path}?{urlencode(dict(params, before=pg.prev))}" if pg.prev else None,
+    }
+
+def complaints_url(**params) -> str:
+    # POST-формы списка заявок возвращают на ту же выборку и страницу
+    params = {k: v for k, v in params.items() if v}
+    return f"/admin/complaints?{urlencode(params)}" if params else "/admin/complaints"
+
+def set_page_headers(response: Response, request: Request, pg):
+    links = []
+    for rel, key, token in (("next", "after", pg.next), ("prev", "before", pg.prev)):
+        if token:
+            response.headers[f"X-{rel.capitalize()}-Cursor"] = token
+            q = {k: v for k, v in request.query_params.items() if k not in ("after", "before", "offset")}
+            q[key] = token
+            links.append(f'<{request.url.path}?{urlencode(q)}>; rel="{rel}"')
+    if links:
+        response.headers["Link"] = ", ".join(links)
+
 # ----- HTML pages -----
 @app.get("/", response_class=HTMLResponse)
 @app.get("/admin", response_class=HTMLResponse)
-def admin_dashboard(request: Request, _: bool = Depends(auth_web)):
-    stats = stats_counts()
-    return templates.TemplateResponse("dashboard.html", {"request": request, "stats": stats})
+async def admin_dashboard(request: Request, _: bool = Depends(auth_web)):
+    stats, media = await asyncio.gather(stats_counts(), media_job_stats())
+    return templates.TemplateResponse("dashboard.html", {"request": request, "stats": stats, "media": media})
 
 @app.get("/admin/complaints", response_class=HTMLResponse)
-def admin_complaints(request: Request, category: str | None = Query(None), page: int = 1, _: bool = Depends(auth_web)):
+async def admin_complaints(request: Request, category: str | None = Query(None), q: str | None = None, page: int = 1,
+                           after: str | None = None, before: str | None = None, _: bool = Depends(auth_web)):
     page = max(1, page)
     limit = 30
     offset = (page-1)*limit
     if category not in (None, "complaint", "suggestion"):
         category = None
-    rows = list_complaints(category, limit=limit, offset=offset)
-    return templates.TemplateResponse("complaints.html", {"request": request, "rows": rows, "category": category, "page": page})
+    q = (q or "").strip() or None
+    if q:
+        pg = await fetch_page(search_complaints_page, q, category, limit=limit, after=after, before=before)
+    else:
+        pg = await fetch_page(list_complaints_page, category, limit=limit, offset=offset, after=after, before=before)
+    back = {k: v for k, v in dict(category=category, q=q, page=page if page > 1 else None,
+                                  after=after, before=before).items() if v}
+    return templates.TemplateResponse("complaints.html", {"request": request, "rows": pg.rows, "category": category,
+                                                          "q": q or "", "truncated": pg.truncated,
+                                                          "search_window": SEARCH_WINDOW, "back": back,
+                                                          **page_links("/admin/complaints", pg, category=category, q=q)})
 
 @app.post("/admin/complaints/status")
-def admin_set_status(ticket_no: str = Form(...), status: str = Form(...), _: bool = Depends(auth_web)):
+async def admin_set_status(ticket_no: str = Form(...), status: str = Form(...), category: str = Form(""),
+                           q: str = Form(""), page: int | None = Form(None), after: str = Form(""),
+                           before: str = Form(""), _: bool = Depends(auth_web)):
     if status not in ("new","in_progress","done"):
         raise HTTPException(400, "Bad status")
-    set_status(ticket_no, status)
-    return RedirectResponse(url="/admin/complaints", status_code=303)
+    await set_status(ticket_no, status)
+    return RedirectResponse(url=complaints_url(category=category, q=q, page=page, after=after, before=before),
+                            status_code=303)
+
+# Массовые операции: список заявок в одном операторе, уведомления авторам
+# уходят из бота пачкой (status_notices). BULK_MAX — предел на один запрос.
+BULK_MAX = int(os.getenv("ADMIN_BULK_MAX", "10000"))
+STATUSES = ("new", "in_progress", "done")
+
+def check_bulk(items: list, name: str):
+    if not items:
+        raise HTTPException(400, f"{name}: empty")
+    if len(items) > BULK_MAX:
+        raise HTTPException(400, f"{name}: at most {BULK_MAX}")
+
+def stale_before(days: int | None, before: datetime.datetime | None) -> datetime.datetime:
+    if before is None and days is None:
+        raise HTTPException(400, "older_than_days or before is required")
+    return before or datetime.datetime.now() - datetime.timedelta(days=days)
+
+@app.post("/admin/complaints/bulk")
+async def admin_bulk(tickets: list[str] = Form([]), action: str = Form(...), status: str = Form("done"),
+                     reason: str = Form(""), category: str = Form(""), q: str = Form(""),
+                     page: int | None = Form(None), after: str = Form(""), before: str = Form(""),
+                     _: bool = Depends(auth_web)):
+    check_bulk(tickets, "tickets")
+    if action == "status":
+        if status not in STATUSES:
+            raise HTTPException(400, "Bad status")
+        await set_statuses(tickets, status)
+    elif action == "block":
+        await block_users(await ticket_authors(tickets), reason or None)
+    else:
+        raise HTTPException(400, "action: status|block")
+    return RedirectResponse(url=complaints_url(category=category, q=q, page=page, after=after, before=before),
+                            status_code=303)
+
+@app.post("/admin/complaints/close")
+async def admin_close_stale(days: int = Form(..., ge=1), category: str = Form(""), q: str = Form(""),
+                            page: int | None = Form(None), after: str = Form(""), before: str = Form(""),
+                            _: bool = Depends(auth_web)):
+    await close_stale(stale_before(days, None), category or None)
+    return RedirectResponse(url=complaints_url(category=category, q=q, page=page, after=after, before=before),
+                            status_code=303)
 
 @app.get("/admin/users", response_class=HTMLResponse)
-def admin_users(request: Request, page: int = 1, _: bool = Depends(auth_web)):
+async def admin_users(request: Request, page: int = 1, after: str | None = None, before: str | None = None,
+                      _: bool = Depends(auth_web)):
     page = max(1, page)
     limit = 50
     offset = (page-1)*limit
-    rows = list_users(limit=limit, offset=offset)
-    return templates.TemplateResponse("users.html", {"request": request, "rows": rows, "page": page})
+    pg = await fetch_page(list_users_page, limit=limit, offset=offset, after=after, before=before)
+    return templates.TemplateResponse("users.html", {"request": request, "rows": pg.rows,
+                                                     **page_links("/admin/users", pg)})
 
 @app.post("/admin/block")
-def admin_block(user_id: int = Form(...), reason: str = Form(""), _: bool = Depends(auth_web)):
-    block_user(user_id, reason or None)
+async def admin_block(user_id: int = Form(...), reason: str = Form(""), _: bool = Depends(auth_web)):
+    await block_user(user_id, reason or None)
     return RedirectResponse(url="/admin/blocked", status_code=303)
 
 @app.post("/admin/unblock")
-def admin_unblock(user_id: int = Form(...), _: bool = Depends(auth_web)):
-    unblock_user(user_id)
+async def admin_unblock(user_id: int = Form(...), _: bool = Depends(auth_web)):
+    await unblock_user(user_id)
     return RedirectResponse(url="/admin/blocked", status_code=303)
 
 @app.get("/admin/blocked", response_class=HTMLResponse)
-def admin_blocked(request: Request, page: int = 1, _: bool = Depends(auth_web)):
+async def admin_blocked(request: Request, page: int = 1, after: str | None = None, before: str | None = None,
+                        _: bool = Depends(auth_web)):
     page = max(1, page)
     limit = 50
     offset = (page-1)*limit
-    rows = list_blocked(limit=limit, offset=offset)
-    return templates.TemplateResponse("blocked.html", {"request": request, "rows": rows, "page": page})
+    pg = await fetch_page(list_blocked_page, limit=limit, offset=offset, after=after, before=before)
+    return templates.TemplateResponse("blocked.html", {"request": request, "rows": pg.rows,
+                                                       **page_links("/admin/blocked", pg)})
 
 # ----- JSON API (с Bearer токеном) -----
+# Кэш stats_counts живёт STATS_CACHE_TTL секунд; при смене версии он
+# сбрасывается, чтобы под новым ETag не ушли старые цифры
+_stats_version = {"value": None}
+
 @app.get("/api/stats", dependencies=[Depends(auth_api)])
-def api_stats():
-    return stats_counts()
+async def api_stats(request: Request, response: Response):
+    if (nm := await not_modified(request, response, "complaints", daily=True)):
+        return nm
+    if _stats_version["value"] != response.headers["ETag"]:
+        invalidate_stats()
+        _stats_version["value"] = response.headers["ETag"]
+    return await stats_counts()
+
+@app.get("/api/stats/range", dependencies=[Depends(auth_api)])
+async def api_stats_range(date_from: datetime.date = Query(..., alias="from"), date_to: datetime.date = Query(..., alias="to"),
+                          group_by: str = "day", category: str | None = Query(None)):
+    groups = tuple(g for g in group_by.split(",") if g)
+    if not set(groups) <= set(STATS_GROUPS):
+        raise HTTPException(400, "group_by: day,category,status")
+    return [dict(r, day=str(r["day"])) if "day" in r else r
+            for r in await stats_range(date_from, date_to, groups, category)]
+
+# Потоковая выгрузка без лимита строк: серверный курсор, куски отдаются по мере чтения
+@app.get("/api/export", dependencies=[Depends(auth_api)])
+async def api_export(what: str = "complaints", format: str = "csv", gzip: bool = False,
+                     date_from: datetime.date | None = Query(None, alias="from"),
+                     date_to: datetime.date | None = Query(None, alias="to")):
+    if what not in export.EXPORTS:
+        raise HTTPException(400, "what: " + "|".join(export.EXPORTS))
+    if format not in export.FORMATS:
+        raise HTTPException(400, "format: " + "|".join(export.FORMATS))
+    if format == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise HTTPException(400, "parquet export needs pyarrow")
+    name = export.filename(what, format, gzip)
+    return StreamingResponse(export.export_chunks(what, format, gzip, date_from, date_to),
+                             media_type=export.media_type(format, gzip),
+                             headers={"Content-Disposition": f'attachment; filename="{name}"'})
+
+# Prometheus: запросы админки, SQL и пул этого процесса (токен — как у /api/*)
+@app.get("/metrics", dependencies=[Depends(auth_api)])
+async def prom_metrics():
+    body, content_type = metrics.render()
+    return Response(body, media_type=content_type)
+
+# Очередь загрузки вложений: счётчики и последние упавшие задания
+@app.get("/api/media", dependencies=[Depends(auth_api)])
+async def api_media(status: str = "failed", limit: int = 50):
+    if status not in ("pending", "running", "failed", "done"):
+        raise HTTPException(400, "status: pending|running|failed|done")
+    return dict(await media_job_stats(), dedupe=await media_dedupe_stats(), jobs=[
+        dict(id=jid, ticket_no=ticket, user_id=uid, file_type=ftype, attempts=attempts,
+             created_at=str(created), run_after=str(run_after), last_error=err, updated_at=str(updated))
+        for jid, ticket, uid, ftype, _fid, _fuid, attempts, created, _st, run_after, err, updated
+        in await list_media_jobs(status, limit)
+    ])
+
+@app.post("/api/media/retry", dependencies=[Depends(auth_api)])
+async def api_media_retry(ids: list[int] | None = None):
+    return {"retried": await retry_media_jobs(ids)}
+
+# Исходящие сообщения бота: глубина очереди, возраст самой старой строки, упавшие
+@app.get("/api/outbox", dependencies=[Depends(auth_api)])
+async def api_outbox(limit: int = 50):
+    return dict(await outbox_stats(), failed_rows=[
+        dict(id=mid, chat_id=chat, kind=kind, attempts=attempts, created_at=str(created), last_error=err)
+        for mid, chat, kind, attempts, created, err in await list_outbox_failed(limit)
+    ])
+
+@app.post("/api/outbox/retry", dependencies=[Depends(auth_api)])
+async def api_outbox_retry(ids: list[int] | None = None):
+    return {"retried": await retry_outbox(ids)}
+
+# Рассылки: texts — {"ru": ..., "uz": ...} (недостающий язык получает ru),
+# текст уходит без разметки. Отправляет бот (bot/broadcast.py), здесь — только
+# постановка, прогресс и отмена.
+def broadcast_dict(row) -> dict:
+    return dict(id=row.id, texts=row.texts, status=row.status, last_user_id=row.last_user_id, queued=row.queued,
+                delivered=row.delivered, failed=row.failed, last_error=row.last_error, created_by=row.created_by,
+                created_at=str(row.created_at), finished_at=str(row.finished_at) if row.finished_at else None)
 
+@app.post("/api/broadcasts", dependencies=[Depends(auth_api)])
+async def api_broadcast_create(texts: dict[str, str] = Body(..., embed=True)):
+    if not set(texts) <= set(LANGS):
+        raise HTTPException(400, "texts: " + "|".join(LANGS))
+    try:
+        bid = await create_broadcast(texts)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    return broadcast_dict(await get_broadcast(bid))
+
+@app.get("/api/broadcasts", dependencies=[Depends(auth_api)])
+async def api_broadcasts(limit: int = 20):
+    return [broadcast_dict(r) for r in await list_broadcasts(limit)]
+
+@app.get("/api/broadcasts/{broadcast_id}", dependencies=[Depends(auth_api)])
+async def api_broadcast(broadcast_id: int):
+    row = await get_broadcast(broadcast_id)
+    if row is None:
+        raise HTTPException(404, "Not found")
+    return broadcast_dict(row)
+
+@app.post("/api/broadcasts/{broadcast_id}/cancel", dependencies=[Depends(auth_api)])
+async def api_broadcast_cancel(broadcast_id: int):
+    if not await cancel_broadcast(broadcast_id):
+        raise HTTPException(409, "Broadcast is not running")
+    return broadcast_dict(await get_broadcast(broadcast_id))
+
+# Пагинация: курсоры after/before (заголовки X-Next-Cursor / X-Prev-Cursor и Link),
+# offset оставлен для совместимости со старыми клиентами.
+# q — полнотекстовый поиск: порядок по релевантности (поле rank), offset не поддерживается.
+# Ранжируются только SEARCH_WINDOW самых свежих совпадений; если их больше,
+# в ответе заголовок X-Search-Truncated: <окно>.
 @app.get("/api/complaints", dependencies=[Depends(auth_api)])
-def api_complaints(category: str | None = Query(None), limit: int = 100, offset: int = 0):
+async def api_complaints(request: Request, response: Response, category: str | None = Query(None), q: str | None = None,
+                         limit: int = 100, offset: int = 0, after: str | None = None, before: str | None = None):
+    if (nm := await not_modified(request, response, "complaints")):
+        return nm
+    category = category if category in ("complaint","suggestion") else None
+    q = (q or "").strip()
+    if q:
+        pg = await fetch_page(search_complaints_page, q, category, limit=limit, after=after, before=before)
+    else:
+        pg = await fetch_page(list_complaints_page, category, limit=limit, offset=offset, after=after, before=before)
+    set_page_headers(response, request, pg)
+    if pg.truncated:
+        response.headers["X-Search-Truncated"] = str(SEARCH_WINDOW)
     return [
         dict(
             ticket_no=ticket, user_id=uid, username=un, full_name=fn,
             category=cat, status=status, created_at=str(created),
-            message_text=textval, file_type=ftype
+            message_text=textval, file_type=ftype, **({"rank": round(rank[0], 4)} if rank else {})
         )
-        for _id, ticket, uid, un, fn, cat, textval, ftype, status, created
-        in list_complaints(category if category in ("complaint","suggestion") else None, limit=limit, offset=offset)
+        for _id, ticket, uid, un, fn, cat, textval, ftype, status, created, *rank
+        in pg.rows
     ]
 
+@app.post("/api/complaints/status", dependencies=[Depends(auth_api)])
+async def api_bulk_status(tickets: list[str] = Body(...), status: str = Body(...), notify: bool = Body(True)):
+    check_bulk(tickets, "tickets")
+    if status not in STATUSES:
+        raise HTTPException(400, "status: new|in_progress|done")
+    changed = await set_statuses(tickets, status, notify)
+    return {"updated": len(changed), "tickets": changed}
+
+# Закрыть всё старше older_than_days дней (или созданное до before); пачками по BULK_BATCH
+@app.post("/api/complaints/close", dependencies=[Depends(auth_api)])
+async def api_close_stale(older_than_days: int | None = Body(None, ge=1), before: datetime.datetime | None = Body(None),
+                          category: str | None = Body(None), status: str = Body("done"), notify: bool = Body(True)):
+    if status not in STATUSES:
+        raise HTTPException(400, "status: new|in_progress|done")
+    return {"updated": await close_stale(stale_before(older_than_days, before), category, status, notify)}
+
+@app.post("/api/users/block", dependencies=[Depends(auth_api)])
+async def api_bulk_block(user_ids: list[int] = Body(...), reason: str | None = Body(None)):
+    check_bulk(user_ids, "user_ids")
+    return {"blocked": await block_users(user_ids, reason)}
+
+@app.post("/api/users/unblock", dependencies=[Depends(auth_api)])
+async def api_bulk_unblock(user_ids: list[int] = Body(..., embed=True)):
+    check_bulk(user_ids, "user_ids")
+    return {"unblocked": await unblock_users(user_ids)}
+
 @app.get("/api/users", dependencies=[Depends(auth_api)])
-def api_users(limit: int = 100, offset: int = 0):
-    rows = list_users(limit=limit, offset=offset)
+async def api_users(request: Request, response: Response, limit: int = 100, offset: int = 0,
+                    after: str | None = None, before: str | None = None):
+    if (nm := await not_modified(request, response, "users")):
+        return nm
+    pg = await fetch_page(list_users_page, limit=limit, offset=offset, after=after, before=before)
+    set_page_headers(response, request, pg)
     return [dict(user_id=uid, username=un, full_name=fn, last_activity=str(last), total_messages=total)
-            for uid, un, fn, last, total in rows]
+            for uid, un, fn, last, total in pg.rows]
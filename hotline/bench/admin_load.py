@@ -0,0 +1,166 @@
+"""Нагрузка на админку: поднимает uvicorn с admin.app (один процесс, как в
+docker-compose) из каталога --root и гоняет httpx-клиентами дашборд, список
+обращений и /api/complaints. Кроме задержек и req/s пишется CPU процесса
+сервера на запрос: на машине с парой ядер клиент сам съедает заметную долю
+процессора, и req/s упирается в него. Для сравнения до/после --root
+указывает на рабочую копию другого коммита (git worktree), результаты — в --json.
+С --conditional клиенты опрашивают как мониторинг: шлют If-None-Match с
+последним ETag и Accept-Encoding: br, gzip; в отчёте доля 304 и байты на запрос.
+Перед прогоном в complaints засевается --seed строк (триггеры отключены
+через session_replication_role, нужен суперпользователь).
+
+    DATABASE_URL=postgresql://... python bench/admin_load.py --concurrency 32 --duration 10 --json after.json
+    git worktree add /tmp/before HEAD~1
+    DATABASE_URL=postgresql://... python bench/admin_load.py --root /tmp/before/hotline --json before.json
+    DATABASE_URL=postgresql://... python bench/admin_load.py --endpoints api_complaints,api_users,api_stats --conditional
+"""
+import os, sys, time, asyncio, argparse, datetime, subprocess
+
+import common
+import httpx
+from sqlalchemy import text
+
+import db
+
+BASE_UID = 9_900_000_000
+PORT = 8765
+WEB_AUTH = ("bench", "bench")
+TOKEN = "bench-token"
+
+ENDPOINTS = {
+    "dashboard": ("/admin", "web"),
+    "complaints": ("/admin/complaints", "web"),
+    "complaints_page2": (None, "web"),  # курсор берётся с первой страницы
+    "api_complaints": ("/api/complaints?limit=50", "api"),
+    "api_stats": ("/api/stats", "api"),
+    "api_users": ("/api/users?limit=100", "api"),
+}
+
+def seed(rows: int):
+    common.ensure_partitions(datetime.date.today() - datetime.timedelta(seconds=rows * 30))
+    with db.get_engine().begin() as conn:
+        conn.execute(text("SET LOCAL session_replication_role = replica"))
+        conn.execute(text("""
+            INSERT INTO complaints(ticket_no, user_id, username, full_name, category, message_text, status, created_at)
+            SELECT 'LOAD-' || g, :base + g % 20000, 'bench', 'Bench',
+                   CASE WHEN g % 3 = 0 THEN 'suggestion' ELSE 'complaint' END,
+                   'admin load row ' || g || ' ' || repeat('x', 60 + g % 100),
+                   (ARRAY['new','in_progress','done'])[1 + g % 3], NOW() - make_interval(secs => g * 30)
+            FROM generate_series(1, :rows) g
+        """), dict(base=BASE_UID, rows=rows))
+    with db.get_engine().begin() as conn:
+        conn.execute(text("ANALYZE complaints"))
+
+def unseed():
+    with db.get_engine().begin() as conn:
+        conn.execute(text("SET LOCAL session_replication_role = replica"))
+        conn.execute(text("DELETE FROM complaints WHERE user_id >= :base AND ticket_no LIKE 'LOAD-%'"),
+                     dict(base=BASE_UID))
+
+def cpu_seconds(pid: int) -> float | None:
+    # utime + stime процесса сервера: CPU на запрос не зависит от того, сколько съел сам клиент
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+def start_server(root: str):
+    env = dict(os.environ, ADMIN_WEB_USER=WEB_AUTH[0], ADMIN_WEB_PASS=WEB_AUTH[1], ADMIN_TOKEN=TOKEN)
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "admin.app:app", "--port", str(PORT),
+                             "--log-level", "warning"], cwd=root, env=env)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{PORT}/api/stats", headers={"Authorization": f"Bearer {TOKEN}"}).status_code == 200:
+                return proc
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    proc.terminate()
+    raise SystemExit("admin app did not start")
+
+async def hammer(client, path, kind, concurrency, duration, conditional=False):
+    kw = {"auth": WEB_AUTH} if kind == "web" else {"headers": {"Authorization": f"Bearer {TOKEN}"}}
+    latencies, errors = [], 0
+    stats = {"not_modified": 0, "bytes": 0}
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        nonlocal errors
+        headers, etag = dict(kw.get("headers", {})), None
+        if conditional:
+            headers["Accept-Encoding"] = "br, gzip"
+        while time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            try:
+                r = await client.get(path, auth=kw.get("auth"), headers=dict(headers, **{"If-None-Match": etag} if etag else {}))
+                ok = r.status_code in (200, 304)
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - t0)
+                stats["not_modified"] += r.status_code == 304
+                stats["bytes"] += r.num_bytes_downloaded  # на проводе, до распаковки
+                if conditional:
+                    etag = r.headers.get("etag", etag)
+            else:
+                errors += 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - t0, errors, stats
+
+async def run(args, pid):
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{PORT}", limits=limits, timeout=30) as client:
+        first = await client.get("/admin/complaints", auth=WEB_AUTH)
+        after = first.text.split("after=", 1)[1].split('"', 1)[0] if "after=" in first.text else ""
+        results = []
+        for name in args.endpoints.split(","):
+            path, kind = ENDPOINTS[name]
+            path = path or f"/admin/complaints?after={after}"
+            await hammer(client, path, kind, args.concurrency, 1)  # прогрев
+            cpu0 = cpu_seconds(pid)
+            latencies, elapsed, errors, stats = await hammer(client, path, kind, args.concurrency, args.duration,
+                                                             args.conditional)
+            cpu1 = cpu_seconds(pid)
+            cpu_ms = round((cpu1 - cpu0) * 1000 / len(latencies), 2) if cpu0 is not None and latencies else None
+            extra = dict(not_modified_pct=round(100 * stats["not_modified"] / len(latencies), 1) if latencies else None,
+                         bytes_per_req=round(stats["bytes"] / len(latencies)) if latencies else None)
+            results.append(common.summarize(f"admin[{name}]", latencies, elapsed, concurrency=args.concurrency,
+                                            errors=errors, server_cpu_ms_per_req=cpu_ms, root=os.path.abspath(args.root),
+                                            **(extra if args.conditional else {})))
+        return results
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--root", default=common.ROOT, help="каталог hotline/, из которого запускается admin.app")
+    ap.add_argument("--endpoints", default="dashboard,complaints,complaints_page2,api_complaints,api_stats")
+    ap.add_argument("--concurrency", type=int, default=32)
+    ap.add_argument("--duration", type=float, default=10)
+    ap.add_argument("--seed", type=int, default=200_000)
+    ap.add_argument("--conditional", action="store_true", help="If-None-Match и сжатие, как у опрашивающих клиентов")
+    ap.add_argument("--keep", action="store_true", help="не удалять засеянные строки")
+    ap.add_argument("--json", default=None)
+    args = ap.parse_args()
+
+    common.require_db()
+    db.wait_db()
+    db.init_db()
+    unseed()  # остатки прерванного прогона
+    if args.seed:
+        seed(args.seed)
+    server = start_server(args.root)
+    try:
+        results = asyncio.run(run(args, server.pid))
+    finally:
+        server.terminate()
+        server.wait()
+        if not args.keep:
+            unseed()
+    common.report(results, args.json)
+
+if __name__ == "__main__":
+    main()
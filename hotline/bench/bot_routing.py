@@ -0,0 +1,100 @@
+"""Микробенчмарк обработки апдейтов ботом: синтетический поток Update
+(кнопки закреплённой клавиатуры на обоих языках, /start, /menu, inline-меню)
+прогоняется через dp.feed_update в одном процессе, Bot работает через
+подменённую сессию без сети. Пишется CPU процесса (process_time) и время на
+апдейт. Язык пользователей берётся из засеянного user_profile через обычный
+кэш, поэтому после прогрева в замер попадает в основном маршрутизация,
+клавиатуры и сериализация ответа. Для сравнения до/после --root указывает на
+рабочую копию другого коммита (git worktree).
+
+    DATABASE_URL=postgresql://... python bench/bot_routing.py --updates 20000
+    git worktree add /tmp/before HEAD~1
+    DATABASE_URL=postgresql://... python bench/bot_routing.py --root /tmp/before/hotline
+"""
+import os, sys, time, asyncio, argparse, datetime, itertools
+
+import common
+
+BASE_UID = 9_970_000_000
+USERS = 1000
+
+# (вид, текст/данные); кнопки — подписи закреплённой клавиатуры на обоих языках.
+# «Мои обращения» и текст обращения не входят: там время уходит на запросы к БД
+STREAM = [
+    ("text", "ℹ️ О сервисе"), ("text", "ℹ️ Xizmat haqida"), ("text", "🌐 Язык"), ("text", "🌐 Til"),
+    ("text", "/start"), ("text", "/menu"), ("text", "/about"), ("callback", "menu:about"),
+]
+
+def build_updates(count: int):
+    from aiogram.types import Update, Message, CallbackQuery, Chat, User
+    now = datetime.datetime.now()
+    out = []
+    for i, (kind, value) in zip(range(count), itertools.cycle(STREAM)):
+        uid = BASE_UID + i % USERS
+        user, chat = User(id=uid, is_bot=False, first_name="Bench"), Chat(id=uid, type="private")
+        msg = Message(message_id=i + 1, date=now, chat=chat, from_user=user, text=value if kind == "text" else "menu")
+        if kind == "callback":
+            out.append(Update(update_id=i + 1, callback_query=CallbackQuery(id=str(i), from_user=user, chat_instance="b",
+                                                                             message=msg, data=value)))
+        else:
+            out.append(Update(update_id=i + 1, message=msg))
+    return out
+
+def seed():
+    from sqlalchemy import text
+    import db
+    with db.get_engine().begin() as conn:
+        conn.execute(text("""
+            INSERT INTO user_profile(user_id, lang)
+            SELECT :base + g, CASE WHEN g % 2 = 0 THEN 'ru' ELSE 'uz' END FROM generate_series(0, :n - 1) g
+            ON CONFLICT (user_id) DO NOTHING
+        """), dict(base=BASE_UID, n=USERS))
+
+def unseed():
+    from sqlalchemy import text
+    import db
+    with db.get_engine().begin() as conn:
+        conn.execute(text("DELETE FROM user_profile WHERE user_id BETWEEN :a AND :b"),
+                     dict(a=BASE_UID, b=BASE_UID + USERS))
+
+async def run(main, updates, warmup: int):
+    for u in updates[:warmup]:
+        await main.dp.feed_update(main.bot, u)
+    latencies, cpu = [], []
+    t0, c0 = time.perf_counter(), time.process_time()
+    for u in updates[warmup:]:
+        w, c = time.perf_counter(), time.process_time()
+        await main.dp.feed_update(main.bot, u)
+        cpu.append(time.process_time() - c)
+        latencies.append(time.perf_counter() - w)
+    return latencies, cpu, time.perf_counter() - t0, time.process_time() - c0
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--root", default=common.ROOT, help="каталог hotline/, из которого импортируется bot/main.py")
+    ap.add_argument("--updates", type=int, default=20_000)
+    ap.add_argument("--warmup", type=int, default=2_000)
+    ap.add_argument("--json", default=None)
+    args = ap.parse_args()
+
+    common.require_db()
+    os.environ.setdefault("BOT_TOKEN", "1:bench")
+    sys.path.insert(0, os.path.join(os.path.abspath(args.root), "bot"))
+    import main as bot_main
+    bot_main.bot.session = common.offline_session()
+    import db
+    db.wait_db()
+    db.init_db()
+    seed()
+    try:
+        updates = build_updates(args.updates + args.warmup)
+        latencies, cpu, elapsed, cpu_total = asyncio.run(run(bot_main, updates, args.warmup))
+    finally:
+        unseed()
+    common.report([common.summarize("bot_routing", latencies, elapsed, root=os.path.abspath(args.root),
+                                    cpu_us_per_update=round(cpu_total / len(cpu) * 1e6, 1),
+                                    cpu_p50_us=round(common.percentile(cpu, 50) * 1e6, 1),
+                                    cpu_p95_us=round(common.percentile(cpu, 95) * 1e6, 1))], args.json)
+
+if __name__ == "__main__":
+    main()
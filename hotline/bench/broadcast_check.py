@@ -0,0 +1,205 @@
+"""Проверка рассылки (broadcast.py) без Telegram: в user_profile засевается
+--users пользователей (ru, uz и без языка), часть — в blocked_users, часть
+чатов отвечает Forbidden. Рассылка идёт через BroadcastRunner и
+OutboxDispatcher с подменённой сессией Bot; посередине оба обрываются, как
+при падении процесса, и запускаются заново — рассылка должна продолжиться с
+чекпоинта. Проверяется: каждый незаблокированный получил ровно одно
+сообщение на своём языке, заблокированные — ни одного, счётчики delivered и
+failed сходятся с тем, что видела сессия, темп не выше --rate, автору пришёл
+итог. Код возврата 1, если что-то не так.
+
+    DATABASE_URL=postgresql://... python bench/broadcast_check.py --users 20000 --rate 1000
+    DATABASE_URL=postgresql://... python bench/broadcast_check.py --users 500000 --rate 5000 --timeout 900
+"""
+import os, sys, time, asyncio, argparse, datetime, resource
+from collections import Counter
+
+os.environ.setdefault("OUTBOX_LEASE_SEC", "3")
+
+import common
+from sqlalchemy import text
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.exceptions import TelegramForbiddenError
+from aiogram.methods import SendMessage
+from aiogram.types import Message, Chat
+
+import db, outbox, broadcast
+
+BASE_UID = 9_960_000_000
+AUTHOR = BASE_UID - 1  # не в user_profile: итог ему уходит на ru
+TEXTS = {"ru": "Объявление для всех", "uz": "Hammaga e'lon"}
+
+def lang_of(i: int):
+    return (None, "ru", "uz")[i % 3]
+
+def is_blocked(i: int) -> bool:
+    return i % 97 == 0
+
+def is_forbidden(i: int) -> bool:
+    return i % 53 == 0
+
+class FakeSession(BaseSession):
+    def __init__(self, latency: float):
+        super().__init__()
+        self.latency = latency
+        self.got = Counter()        # (chat_id, text) -> сколько раз; без времени отправок — память не растёт с числом получателей
+        self.per_sec = Counter()    # целая секунда -> отправок
+        self.forbidden = 0
+
+    async def make_request(self, bot, method, timeout=None):
+        await asyncio.sleep(self.latency)
+        assert isinstance(method, SendMessage)
+        i = method.chat_id - BASE_UID
+        if 0 <= i and is_forbidden(i):
+            self.forbidden += 1
+            raise TelegramForbiddenError(method=method, message="Forbidden: bot was blocked by the user")
+        self.got[method.chat_id, method.text] += 1
+        self.per_sec[int(time.monotonic())] += 1
+        return Message(message_id=1, date=datetime.datetime.now(), chat=Chat(id=method.chat_id, type="private"),
+                       text=method.text)
+
+    async def stream_content(self, *args, **kwargs):
+        raise NotImplementedError
+        yield b""
+
+    async def close(self):
+        pass
+
+def seed(users: int):
+    with db.get_engine().begin() as conn:
+        conn.execute(text("SET LOCAL session_replication_role = replica"))
+        conn.execute(text("""
+            INSERT INTO user_profile(user_id, lang)
+            SELECT :base + g, (ARRAY[NULL, 'ru', 'uz'])[1 + g % 3] FROM generate_series(0, :n - 1) g
+        """), dict(base=BASE_UID, n=users))
+        conn.execute(text("""
+            INSERT INTO blocked_users(user_id, reason)
+            SELECT :base + g, 'bench' FROM generate_series(0, :n - 1) g WHERE g % 97 = 0
+        """), dict(base=BASE_UID, n=users))
+    with db.get_engine().begin() as conn:
+        conn.execute(text("ANALYZE user_profile"))
+
+def unseed():
+    with db.get_engine().begin() as conn:
+        conn.execute(text("SET LOCAL session_replication_role = replica"))
+        params = dict(a=AUTHOR, b=BASE_UID + 10_000_000)
+        conn.execute(text("DELETE FROM outbox WHERE chat_id BETWEEN :a AND :b"), params)
+        conn.execute(text("DELETE FROM blocked_users WHERE user_id BETWEEN :a AND :b"), params)
+        conn.execute(text("DELETE FROM user_profile WHERE user_id BETWEEN :a AND :b"), params)
+        conn.execute(text("DELETE FROM broadcasts WHERE created_by = :a"), params)
+
+def others_running() -> int:
+    with db.get_engine().connect() as conn:
+        return conn.execute(text("SELECT COUNT(*) FROM broadcasts WHERE status = 'running'")).scalar()
+
+async def wait_done(bid: int, timeout: float):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        row = db.get_broadcast(bid)
+        if row.status != "running":
+            return row
+        await asyncio.sleep(0.5)
+    return db.get_broadcast(bid)
+
+async def run(args, session):
+    bot = Bot("1:bench", session=session)
+    bid = db.create_broadcast(TEXTS, AUTHOR)
+    t0 = time.monotonic()
+    disp = outbox.OutboxDispatcher(bot, rate=args.rate, burst=args.burst, batch=args.batch, poll_sec=0.1)
+    runner = broadcast.BroadcastRunner(lambda lang, row: f"done {row.id}: {row.delivered}/{row.failed}", disp,
+                                       batch=args.feed_batch, window=args.window, poll_sec=0.2)
+    await disp.start()
+    await runner.start()
+    await asyncio.sleep(args.crash_after)
+    # обрыв: задачи снимаются посреди пачки, как при падении процесса
+    runner._task.cancel()
+    await disp.stop(timeout=0)
+    checkpoint = db.get_broadcast(bid).last_user_id - BASE_UID
+    sent_before = sum(session.got.values())
+    disp2 = outbox.OutboxDispatcher(bot, rate=args.rate, burst=args.burst, batch=args.batch, poll_sec=0.1)
+    runner2 = broadcast.BroadcastRunner(runner.render_done, disp2, batch=args.feed_batch, window=args.window,
+                                        poll_sec=0.2)
+    await disp2.start()
+    await runner2.start()
+    row = await wait_done(bid, args.timeout)
+    # итог автору уходит после done — даём ему уйти
+    for _ in range(50):
+        if any(chat == AUTHOR for chat, _ in session.got):
+            break
+        await asyncio.sleep(0.1)
+    await runner2.stop()
+    await disp2.stop()
+    return row, time.monotonic() - t0, checkpoint, sent_before
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=20_000)
+    ap.add_argument("--rate", type=float, default=1000)
+    ap.add_argument("--burst", type=int, default=outbox.OUTBOX_BURST)
+    ap.add_argument("--batch", type=int, default=200, help="OUTBOX_BATCH диспетчера")
+    ap.add_argument("--feed-batch", type=int, default=broadcast.BROADCAST_BATCH)
+    ap.add_argument("--window", type=int, default=broadcast.BROADCAST_WINDOW)
+    ap.add_argument("--latency", type=float, default=0.005, help="задержка ответа подменённого Telegram, сек")
+    ap.add_argument("--crash-after", type=float, default=3)
+    ap.add_argument("--timeout", type=float, default=300)
+    ap.add_argument("--json", default=None)
+    args = ap.parse_args()
+
+    common.require_db()
+    db.wait_db()
+    db.init_db()
+    unseed()
+    if others_running():
+        raise SystemExit("there are running broadcasts in this database, finish or cancel them first")
+    seed(args.users)
+    session = FakeSession(args.latency)
+    try:
+        with db.get_engine().connect() as conn:
+            # получатели — все незаблокированные в user_profile, не только засеянные
+            expected_all = conn.execute(text("""
+                SELECT COUNT(*) FROM user_profile p
+                WHERE NOT EXISTS (SELECT 1 FROM blocked_users b WHERE b.user_id = p.user_id)
+            """)).scalar()
+        rss0 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        row, elapsed, checkpoint, sent_before = asyncio.run(run(args, session))
+        rss1 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    finally:
+        unseed()
+
+    problems = []
+    if row.status != "done":
+        problems.append(f"broadcast {row.status} after {args.timeout}s")
+    seeded = {c: n for (c, _), n in session.got.items() if BASE_UID <= c < BASE_UID + args.users}
+    dupes = sum(n - 1 for n in seeded.values() if n > 1)
+    if dupes:
+        problems.append(f"duplicates {dupes}")
+    wrong_lang = sum(1 for (c, body) in session.got if BASE_UID <= c < BASE_UID + args.users
+                     and body != TEXTS[lang_of(c - BASE_UID) or "ru"])
+    if wrong_lang:
+        problems.append(f"wrong language {wrong_lang}")
+    expected = {BASE_UID + i for i in range(args.users) if not is_blocked(i) and not is_forbidden(i)}
+    if set(seeded) != expected:
+        problems.append(f"missing {len(expected - set(seeded))}, unexpected {len(set(seeded) - expected)}")
+    delivered_seen = sum(n for (c, _), n in session.got.items() if c != AUTHOR)
+    if (row.queued, row.delivered, row.failed) != (expected_all, delivered_seen, session.forbidden):
+        problems.append(f"counters queued/delivered/failed {row.queued}/{row.delivered}/{row.failed}, "
+                        f"expected {expected_all}/{delivered_seen}/{session.forbidden}")
+    if not any(chat == AUTHOR for chat, _ in session.got):
+        problems.append("no summary for the author")
+    if not 0 < checkpoint < args.users:
+        problems.append(f"crash did not land mid-broadcast (checkpoint {checkpoint})")
+    per_sec = session.per_sec
+    max_per_sec = max(per_sec.values(), default=0)
+    if max_per_sec > args.rate + args.burst:
+        problems.append(f"rate: {max_per_sec} sends in a second > {args.rate + args.burst}")
+
+    common.report([dict(name="broadcast", users=args.users, recipients=row.queued, delivered=row.delivered,
+                        failed=row.failed, elapsed_sec=round(elapsed, 2), per_sec=round(delivered_seen / elapsed, 1),
+                        rate=args.rate, max_per_sec=max_per_sec, checkpoint_at_crash=checkpoint,
+                        sent_before_crash=sent_before, window=args.window, rss_growth_mb=round((rss1 - rss0) / 1024, 1),
+                        problems=problems)], args.json)
+    sys.exit(1 if problems else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Проверка кэша блокировок: процесс бота кэширует is_blocked = False с
+большим TTL, затем отдельный процесс (как админка) вызывает block_user.
+Блокировка должна стать видна через LISTEN/NOTIFY за доли секунды, а не
+по истечении TTL. Код возврата 1, если этого не произошло.
+
+    DATABASE_URL=postgresql://... python bench/cache_notify_check.py
+"""
+import os, sys, json, time, subprocess
+
+os.environ.setdefault("USER_CACHE_TTL", "3600")
+
+import common
+from sqlalchemy import text
+
+import db
+
+UID = 9_300_000_001
+DEADLINE = 3.0
+
+def other_process(code: str):
+    subprocess.run([sys.executable, "-c", f"import sys; sys.path.insert(0, {common.BOT_DIR!r}); import db; {code}"],
+                   check=True, env=os.environ)
+
+def wait_for(expected: bool) -> float | None:
+    t0 = time.perf_counter()
+    while time.perf_counter() - t0 < DEADLINE:
+        if db.is_blocked(UID) is expected:
+            return time.perf_counter() - t0
+        time.sleep(0.01)
+    return None
+
+def main():
+    common.require_db()
+    db.wait_db()
+    db.init_db()
+    db.unblock_user(UID)
+    db.start_cache_listener()
+    time.sleep(0.5)  # слушатель успевает выполнить LISTEN
+
+    results = {}
+    assert db.is_blocked(UID) is False
+    assert db.is_blocked(UID) is False   # второй вызов — из кэша
+    hits_before = db.blocked_cache.hits
+
+    other_process(f"db.block_user({UID}, 'cache check')")
+    results["block_visible_sec"] = wait_for(True)
+    other_process(f"db.unblock_user({UID})")
+    results["unblock_visible_sec"] = wait_for(False)
+
+    results["cache_ttl_sec"] = db.blocked_cache.ttl
+    results["hits_before_block"] = hits_before
+    results["stats"] = db.cache_stats()
+    db.stop_cache_listener()
+    with db.get_engine().begin() as conn:
+        conn.execute(text("DELETE FROM blocked_users WHERE user_id = :uid"), dict(uid=UID))
+
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+    ok = results["block_visible_sec"] is not None and results["unblock_visible_sec"] is not None
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
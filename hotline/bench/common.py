@@ -0,0 +1,103 @@
+import os, sys, time, json, datetime, statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BOT_DIR = os.path.join(ROOT, "bot")
+
+# бенчмарки запускаются как `python bench/<name>.py` из каталога hotline/,
+# модули бота импортируются так же, как в контейнере бота (из bot/)
+if BOT_DIR not in sys.path:
+    sys.path.insert(0, BOT_DIR)
+if ROOT not in sys.path:
+    sys.path.insert(1, ROOT)
+
+def require_db():
+    if not os.getenv("DATABASE_URL"):
+        raise SystemExit("DATABASE_URL is not set (нужен локальный Postgres)")
+
+def ensure_partitions(since: datetime.date, until: datetime.date | None = None) -> list[str]:
+    # complaints секционирована по месяцам (миграция 0016): засеву строк в прошлом
+    # нужны секции этих месяцев — от since до текущего (сутки запаса — часы БД)
+    # или, с until, только [since, until] для засева в далёком прошлом.
+    # -> созданные секции (их удаляет drop_partitions). В рабочих копиях до
+    # секционирования (--root) делать нечего
+    import db
+    from sqlalchemy import text
+    if not hasattr(db, "ensure_partitions"):
+        return []
+    if until is None:
+        return db.ensure_partitions(since=since - datetime.timedelta(days=1))
+    with db.get_engine().begin() as conn:
+        return [n for n in conn.execute(text("""
+            SELECT hotline_complaints_partition(m::date)
+            FROM generate_series(date_trunc('month', CAST(:a AS date)), CAST(:b AS date), interval '1 month') m
+        """), dict(a=since, b=until)).scalars() if n]
+
+def drop_partitions(names: list[str]):
+    import db
+    from sqlalchemy import text
+    with db.get_engine().begin() as conn:
+        for name in names:
+            # DROP TABLE триггеров не вызывает: номера заявок секции освобождаются здесь
+            if conn.execute(text("SELECT to_regclass(:n)"), dict(n=name)).scalar():
+                conn.execute(text(f"DELETE FROM complaint_tickets WHERE ticket_no IN (SELECT ticket_no FROM {name})"))
+            conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = max(0, min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1)))))
+    return values[k]
+
+def summarize(name, latencies, elapsed, **extra):
+    out = {
+        "name": name,
+        "count": len(latencies),
+        "elapsed_sec": round(elapsed, 3),
+        "per_sec": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+    }
+    out.update(extra)
+    return out
+
+def report(results, json_path=None):
+    for r in results:
+        print(json.dumps(r, ensure_ascii=False))
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump({"ts": time.time(), "results": results}, f, ensure_ascii=False, indent=2)
+
+def offline_session():
+    # Сессия Bot без сети для прогона Update через настоящий Dispatcher: запрос
+    # сериализуется, как в AiohttpSession, ответ — Message в тот же чат (True
+    # для методов без чата: answerCallbackQuery и т.п.)
+    import datetime
+    from aiogram.client.session.base import BaseSession
+    from aiogram.types import Message, Chat
+
+    class OfflineSession(BaseSession):
+        def __init__(self):
+            super().__init__()
+            self.calls = 0
+
+        async def make_request(self, bot, method, timeout=None):
+            self.calls += 1
+            files = {}
+            for value in method.model_dump(warnings=False).values():
+                self.prepare_value(value, bot=bot, files=files)
+            chat_id = getattr(method, "chat_id", None)
+            if chat_id is None:
+                return True
+            return Message(message_id=1, date=datetime.datetime.now(), chat=Chat(id=chat_id, type="private"),
+                           text=getattr(method, "text", None))
+
+        async def stream_content(self, *args, **kwargs):
+            raise NotImplementedError
+            yield b""
+
+        async def close(self):
+            pass
+    return OfflineSession()
@@ -0,0 +1,81 @@
+"""Нагрузка на слой БД: N конкурентных «пользователей» повторяют цепочку
+запросов handle_payload. Сравнивает синхронные вызовы db.py прямо в event
+loop (как было), await через adb.py по-отдельности и одну хранимую
+функцию submit_complaint.
+
+    DATABASE_URL=postgresql://... python bench/db_load.py --users 200 --updates 10
+"""
+import argparse, asyncio, time, datetime
+
+import common
+from sqlalchemy import text
+
+import db, adb
+
+BASE_UID = 9_000_000_000
+
+async def fake_update_sync(uid):
+    db.get_user_lang(uid)
+    db.is_blocked(uid)
+    cat = db.get_user_category(uid)
+    db.last_submit_time(uid)
+    db.insert_complaint(uid, f"bench{uid}", "Bench User", cat, "bench message", None, None)
+    db.touch_rate_limit(uid, datetime.datetime.utcnow())
+
+async def fake_update_async(uid):
+    await adb.get_user_lang(uid)
+    await adb.is_blocked(uid)
+    cat = await adb.get_user_category(uid)
+    await adb.last_submit_time(uid)
+    await adb.insert_complaint(uid, f"bench{uid}", "Bench User", cat, "bench message", None, None)
+    await adb.touch_rate_limit(uid, datetime.datetime.utcnow())
+
+async def fake_update_submit(uid):
+    await adb.get_user_lang(uid)
+    await adb.submit_complaint(uid, f"bench{uid}", "Bench User", "bench message")
+
+MODES = {"sync": fake_update_sync, "async": fake_update_async, "submit": fake_update_submit}
+
+async def run_mode(mode, users, updates):
+    step = MODES[mode]
+    latencies = []
+
+    async def user(uid):
+        for _ in range(updates):
+            t0 = time.perf_counter()
+            await step(uid)
+            latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(user(BASE_UID + i) for i in range(users)))
+    return common.summarize(f"db_load[{mode}]", latencies, time.perf_counter() - t0, users=users)
+
+def cleanup():
+    with db.get_engine().begin() as conn:
+        for table in ("complaints", "user_summary", "user_state", "rate_limiter"):
+            conn.execute(text(f"DELETE FROM {table} WHERE user_id >= :base"), dict(base=BASE_UID))
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=100)
+    ap.add_argument("--updates", type=int, default=10, help="обновлений на пользователя")
+    ap.add_argument("--modes", default="sync,async,submit")
+    ap.add_argument("--json", default=None)
+    args = ap.parse_args()
+
+    common.require_db()
+    db.wait_db()
+    db.init_db()
+    for i in range(args.users):
+        db.set_user_category(BASE_UID + i, "complaint")
+    results = []
+    try:
+        for mode in args.modes.split(","):
+            results.append(await run_mode(mode.strip(), args.users, args.updates))
+    finally:
+        cleanup()
+        adb.shutdown_executor()
+    common.report(results, args.json)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,324 @@
+"""Сквозной прогон бота и админки на засеянной базе. В Postgres засевается
+--users пользователей (язык, категория), --blocked заблокированных и
+--complaints обращений; затем синтетические Update по сценариям (кнопки,
+inline-меню, «Мои обращения», отправка текста и фото, отказы по блокировке и
+ссылке, команды администратора) идут через настоящий Dispatcher из
+bot/main.py с сессией Bot без сети — по --concurrency апдейтов одновременно,
+как воркеры webhook. Потом поднимается admin.app (как в admin_load.py) и
+эндпоинты гоняются конкурентными httpx-клиентами.
+
+По каждому сценарию и эндпоинту: пропускная способность, p50/p95/p99, CPU на
+апдейт, SQL-запросов на апдейт (события движка SQLAlchemy в процессе бота;
+для админки — по её /metrics) и какие обработчики сработали. Результаты — в
+--json; --compare сравнивает два таких файла и возвращает 1, если что-то
+просело больше --threshold процентов. --root — рабочая копия другого коммита
+(git worktree), с которой запускаются бот и админка.
+
+    DATABASE_URL=postgresql://... python bench/e2e.py --users 20000 --complaints 200000 --json e2e-after.json
+    git worktree add /tmp/before HEAD~1
+    DATABASE_URL=postgresql://... python bench/e2e.py --root /tmp/before/hotline --json e2e-before.json
+    python bench/e2e.py --compare e2e-before.json e2e-after.json --threshold 15
+"""
+import os, sys, json, time, asyncio, argparse, datetime, itertools
+from collections import Counter
+
+BASE_UID = 9_980_000_000
+ADMIN_UID = BASE_UID - 1
+MOD_CHAT = -1_009_980_000_000
+
+import common
+
+WORDS = ("вода", "свет", "дорога", "школа", "транспорт")
+
+# имя: (пул пользователей, что отправляет). users — пользователи с историей
+# обращений, fresh — каждый апдейт от пользователя, который в этом прогоне ещё
+# не отправлял (иначе упрёмся в rate limit), blocked — из blocked_users, admin — ADMIN_IDS
+SCENARIOS = {
+    "start":            ("users", "text", lambda lang, i: "/start"),
+    "button_about":     ("users", "text", lambda lang, i: "ℹ️ О сервисе" if lang == "ru" else "ℹ️ Xizmat haqida"),
+    "menu_callback":    ("users", "callback", lambda lang, i: "menu:about"),
+    "my":               ("users", "text", lambda lang, i: "📜 Мои" if lang == "ru" else "📜 Mening"),
+    "submit_text":      ("fresh", "text", lambda lang, i: f"e2e обращение {i}: {WORDS[i % len(WORDS)]} не работает"),
+    "submit_photo":     ("fresh", "photo", lambda lang, i: f"e2e фото {i}"),
+    "submit_link":      ("users", "text", lambda lang, i: f"смотрите https://example.com/{i}"),
+    "submit_blocked":   ("blocked", "text", lambda lang, i: f"e2e от заблокированного {i}"),
+    "admin_stats":      ("admin", "text", lambda lang, i: "/stats"),
+    "admin_complaints": ("admin", "text", lambda lang, i: "/complaints"),
+    "admin_search":     ("admin", "text", lambda lang, i: f"/search {WORDS[i % len(WORDS)]}"),
+}
+
+ADMIN_ENDPOINTS = {
+    "dashboard": ("/admin", "web"),
+    "complaints": ("/admin/complaints", "web"),
+    "api_complaints": ("/api/complaints?limit=50", "api"),
+    "api_search": ("/api/complaints?limit=50&q=" + WORDS[0], "api"),
+    "api_users": ("/api/users?limit=100", "api"),
+    "api_stats": ("/api/stats", "api"),
+    "api_outbox": ("/api/outbox", "api"),
+}
+
+def lang_of(uid: int) -> str:
+    return "ru" if uid % 2 == 0 else "uz"
+
+# ===== Seed =====
+def seed(users: int, complaints: int, blocked: int):
+    from sqlalchemy import text
+    import db
+    p = dict(base=BASE_UID, n=users, b=blocked, c=complaints, admin=ADMIN_UID)
+    common.ensure_partitions(datetime.date.today() - datetime.timedelta(seconds=complaints * 20))
+    with db.get_engine().begin() as conn:
+        conn.execute(text("SET LOCAL session_replication_role = replica"))
+        conn.execute(text("""
+            INSERT INTO user_profile(user_id, lang)
+            SELECT :base + g, CASE WHEN g % 2 = 0 THEN 'ru' ELSE 'uz' END FROM generate_series(0, :n + :b - 1) g
+            UNION ALL SELECT :admin, 'ru'
+        """), p)
+        conn.execute(text("""
+            INSERT INTO user_state(user_id, category)
+            SELECT :base + g, 'complaint' FROM generate_series(0, :n + :b - 1) g
+        """), p)
+        conn.execute(text("""
+            INSERT INTO blocked_users(user_id, reason) SELECT :base + :n + g, 'e2e' FROM generate_series(0, :b - 1) g
+        """), p)
+        conn.execute(text("""
+            INSERT INTO complaints(ticket_no, user_id, username, full_name, category, message_text, status, created_at)
+            SELECT 'E2E-' || g, :base + g % :n, 'e2e', 'E2E User',
+                   CASE WHEN g % 3 = 0 THEN 'suggestion' ELSE 'complaint' END,
+                   'e2e row ' || g || ' ' || (ARRAY['вода','свет','дорога','школа','транспорт'])[1 + g % 5]
+                       || ' ' || repeat('x', 40 + g % 80),
+                   (ARRAY['new','in_progress','done'])[1 + g % 3], NOW() - make_interval(secs => g * 20)
+            FROM generate_series(1, :c) g
+        """), p)
+    # производные таблицы (триггеры при засеве были выключены)
+    with db.get_engine().begin() as conn:
+        conn.execute(text("SELECT hotline_rebuild_user_summary()"))
+        conn.execute(text("ANALYZE complaints"))
+        conn.execute(text("ANALYZE user_profile"))
+    db.rebuild_stats()
+
+def unseed():
+    from sqlalchemy import text
+    import db
+    p = dict(a=ADMIN_UID, b=BASE_UID + 10_000_000, mod=MOD_CHAT)
+    with db.get_engine().begin() as conn:
+        conn.execute(text("SET LOCAL session_replication_role = replica"))
+        for table in ("complaints", "media_jobs", "user_summary", "user_state", "user_profile", "blocked_users",
+                      "rate_limiter", "status_notices"):
+            conn.execute(text(f"DELETE FROM {table} WHERE user_id BETWEEN :a AND :b"), p)
+        conn.execute(text("DELETE FROM outbox WHERE chat_id BETWEEN :a AND :b OR chat_id = :mod"), p)
+    db.rebuild_stats()
+
+# ===== Bot =====
+def build_update(scenario: str, uid: int, i: int):
+    from aiogram.types import Update, Message, CallbackQuery, Chat, User, PhotoSize
+    _, kind, make = SCENARIOS[scenario]
+    value = make(lang_of(uid), i)
+    user, chat = User(id=uid, is_bot=False, first_name="E2E"), Chat(id=uid, type="private")
+    now = datetime.datetime.now()
+    if kind == "callback":
+        msg = Message(message_id=i + 1, date=now, chat=chat, from_user=user, text="menu")
+        return Update(update_id=i + 1, callback_query=CallbackQuery(id=str(i), from_user=user, chat_instance="e2e",
+                                                                     message=msg, data=value))
+    if kind == "photo":
+        photo = PhotoSize(file_id=f"e2e-file-{uid}-{i}", file_unique_id=f"e2e-{uid}-{i}", width=800, height=600)
+        return Update(update_id=i + 1, message=Message(message_id=i + 1, date=now, chat=chat, from_user=user,
+                                                       photo=[photo], caption=value))
+    return Update(update_id=i + 1, message=Message(message_id=i + 1, date=now, chat=chat, from_user=user, text=value))
+
+class UserPools:
+    def __init__(self, users: int, blocked: int):
+        self.users, self.blocked = users, blocked
+        self._fresh = itertools.count()
+
+    def take(self, pool: str, count: int) -> list[int]:
+        if pool == "admin":
+            return [ADMIN_UID] * count
+        if pool == "blocked":
+            return [BASE_UID + self.users + i % self.blocked for i in range(count)]
+        if pool == "users":
+            return [BASE_UID + i * 7919 % self.users for i in range(count)]
+        uids = [next(self._fresh) for _ in range(count)]
+        if uids and uids[-1] >= self.users:
+            raise SystemExit(f"--users {self.users} is not enough for fresh submitters, raise it or lower --updates")
+        return [BASE_UID + self.users - 1 - u for u in uids]  # с конца диапазона, чтобы не пересекаться с users
+
+async def replay(main, updates, concurrency: int):
+    latencies, errors = [], 0
+    it = iter(updates)
+
+    async def worker():
+        nonlocal errors
+        for u in it:
+            t0 = time.perf_counter()
+            try:
+                await main.dp.feed_update(main.bot, u)
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - t0, errors
+
+def run_bot(args) -> list[dict]:
+    from sqlalchemy import event
+    import db
+    import main as bot_main
+    session = common.offline_session()
+    bot_main.bot.session = session
+
+    # SQL-запросы считаются в процессе бота: любой коммит, без опоры на metrics.py
+    queries = itertools.count()
+    event.listen(db.get_engine(), "before_cursor_execute", lambda *a: next(queries))
+    handlers = Counter()
+
+    async def note_handler(handler, event, data):
+        handlers[data["handler"].callback.__name__] += 1
+        return await handler(event, data)
+    for name in ("message", "callback_query"):
+        bot_main.dp.observers[name].middleware(note_handler)
+
+    pools = UserPools(args.users, args.blocked)
+    results = []
+    for name in args.scenarios.split(","):
+        pool = SCENARIOS[name][0]
+        uids = pools.take(pool, args.warmup + args.updates)
+        updates = [build_update(name, uid, i) for i, uid in enumerate(uids)]
+        asyncio.run(replay(bot_main, updates[:args.warmup], args.concurrency))  # прогрев кэшей
+        handlers.clear()
+        q0, calls0, cpu0 = next(queries), session.calls, time.process_time()
+        latencies, elapsed, errors = asyncio.run(replay(bot_main, updates[args.warmup:], args.concurrency))
+        n = max(1, len(latencies) + errors)
+        results.append(common.summarize(
+            f"bot[{name}]", latencies, elapsed, concurrency=args.concurrency, errors=errors,
+            cpu_ms_per_update=round((time.process_time() - cpu0) * 1000 / n, 3),
+            db_queries_per_update=round((next(queries) - q0 - 1) / n, 2),
+            tg_calls_per_update=round((session.calls - calls0) / n, 2),
+            handlers=dict(handlers.most_common())))
+    return results
+
+# ===== Admin =====
+def admin_db_queries() -> float | None:
+    # по /metrics админки (есть начиная с коммита с bot/metrics.py)
+    import httpx
+    import admin_load
+    try:
+        r = httpx.get(f"http://127.0.0.1:{admin_load.PORT}/metrics", headers={"Authorization": f"Bearer {admin_load.TOKEN}"})
+    except httpx.HTTPError:
+        return None
+    if r.status_code != 200:
+        return None
+    return sum(float(line.rsplit(" ", 1)[1]) for line in r.text.splitlines()
+               if line.startswith("hotline_db_query_seconds_count"))
+
+async def run_admin(args, pid) -> list[dict]:
+    import httpx
+    import admin_load
+    limits = httpx.Limits(max_connections=args.http_concurrency, max_keepalive_connections=args.http_concurrency)
+    results = []
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{admin_load.PORT}", limits=limits, timeout=30) as client:
+        for name in args.endpoints.split(","):
+            path, kind = ADMIN_ENDPOINTS[name]
+            await admin_load.hammer(client, path, kind, args.http_concurrency, 1)  # прогрев
+            q0, cpu0 = admin_db_queries(), admin_load.cpu_seconds(pid)
+            latencies, elapsed, errors, _ = await admin_load.hammer(client, path, kind, args.http_concurrency,
+                                                                    args.http_duration)
+            q1, cpu1 = admin_db_queries(), admin_load.cpu_seconds(pid)
+            n = max(1, len(latencies) + errors)
+            results.append(common.summarize(
+                f"admin[{name}]", latencies, elapsed, concurrency=args.http_concurrency, errors=errors,
+                cpu_ms_per_req=round((cpu1 - cpu0) * 1000 / n, 3) if cpu0 is not None and cpu1 is not None else None,
+                db_queries_per_req=round((q1 - q0) / n, 2) if q0 is not None and q1 is not None else None))
+    return results
+
+# ===== Compare =====
+def compare(before_path: str, after_path: str, threshold: float) -> int:
+    def load(path):
+        with open(path, encoding="utf-8") as f:
+            return {r["name"]: r for r in json.load(f)["results"] if "per_sec" in r}  # seed — не замер
+    before, after = load(before_path), load(after_path)
+
+    def delta(a, b):
+        return round(100 * (b - a) / a, 1) if a else None
+
+    regressions = []
+    for name in sorted(before.keys() & after.keys()):
+        a, b = before[name], after[name]
+        q_key = "db_queries_per_update" if "db_queries_per_update" in a else "db_queries_per_req"
+        row = dict(name=name, per_sec=[a["per_sec"], b["per_sec"]], per_sec_delta_pct=delta(a["per_sec"], b["per_sec"]),
+                   p95_ms=[a["p95_ms"], b["p95_ms"]], p95_delta_pct=delta(a["p95_ms"], b["p95_ms"]),
+                   db_queries=[a.get(q_key), b.get(q_key)])
+        bad = []
+        if row["per_sec_delta_pct"] is not None and row["per_sec_delta_pct"] < -threshold:
+            bad.append("throughput")
+        if row["p95_delta_pct"] is not None and row["p95_delta_pct"] > threshold:
+            bad.append("p95")
+        if None not in row["db_queries"] and row["db_queries"][1] > row["db_queries"][0] + 0.05:
+            bad.append("db_queries")
+        row["regression"] = bad
+        if bad:
+            regressions.append(name)
+        print(json.dumps(row, ensure_ascii=False))
+    only = sorted(before.keys() ^ after.keys())
+    if only:
+        print(json.dumps({"not_compared": only}, ensure_ascii=False))
+    print(json.dumps({"regressions": regressions, "threshold_pct": threshold}, ensure_ascii=False))
+    return 1 if regressions else 0
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--root", default=common.ROOT, help="каталог hotline/, из которого берутся бот и админка")
+    ap.add_argument("--users", type=int, default=20_000)
+    ap.add_argument("--complaints", type=int, default=200_000)
+    ap.add_argument("--blocked", type=int, default=500)
+    ap.add_argument("--scenarios", default=",".join(SCENARIOS))
+    ap.add_argument("--updates", type=int, default=1000, help="апдейтов на сценарий (после прогрева)")
+    ap.add_argument("--warmup", type=int, default=200)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--endpoints", default=",".join(ADMIN_ENDPOINTS))
+    ap.add_argument("--http-concurrency", type=int, default=16)
+    ap.add_argument("--http-duration", type=float, default=5)
+    ap.add_argument("--skip-admin", action="store_true")
+    ap.add_argument("--keep", action="store_true", help="не удалять засеянные строки")
+    ap.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"))
+    ap.add_argument("--threshold", type=float, default=10, help="допустимое ухудшение, %%")
+    ap.add_argument("--json", default=None)
+    args = ap.parse_args()
+
+    if args.compare:
+        sys.exit(compare(*args.compare, args.threshold))
+
+    common.require_db()
+    # бот импортируется из --root; админ — ADMIN_UID, копии модераторам уходят в outbox
+    os.environ.setdefault("BOT_TOKEN", "1:bench")
+    os.environ.setdefault("ADMIN_IDS", str(ADMIN_UID))
+    os.environ.setdefault("MOD_CHAT_ID", str(MOD_CHAT))
+    os.environ.setdefault("METRICS_PORT", "0")
+    root = os.path.abspath(args.root)
+    sys.path.insert(0, os.path.join(root, "bot"))
+    import db
+    db.wait_db()
+    db.init_db()
+    unseed()  # остатки прерванного прогона
+    t0 = time.perf_counter()
+    seed(args.users, args.complaints, args.blocked)
+    seeded = dict(name="seed", users=args.users, complaints=args.complaints, blocked=args.blocked,
+                  elapsed_sec=round(time.perf_counter() - t0, 2), root=root)
+    try:
+        results = run_bot(args)
+        if not args.skip_admin:
+            import admin_load
+            server = admin_load.start_server(root)
+            try:
+                results += asyncio.run(run_admin(args, server.pid))
+            finally:
+                server.terminate()
+                server.wait()
+    finally:
+        if not args.keep:
+            unseed()
+    common.report([seeded] + results, args.json)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""EXPLAIN-проверка индексов: засевает complaints большим набором строк,
+вызывает функции db.py, перехватывает их SQL и проверяет, что ни один план
+не делает Seq Scan по complaints. Код возврата 1 при нарушении.
+
+    DATABASE_URL=postgresql://... python bench/explain_check.py --rows 500000
+"""
+import argparse, json, sys, datetime
+
+import common
+from sqlalchemy import event, text
+
+import db
+
+BASE_UID = 9_200_000_000
+USERS = 5000
+
+# Запросы, которым полный проход по таблице нужен по смыслу (агрегаты по всей
+# истории). Их перечисляем явно, чтобы новые запросы по умолчанию проверялись.
+EXEMPT = {}
+
+def seed(rows):
+    common.ensure_partitions(datetime.date.today() - datetime.timedelta(days=731))
+    with db.get_engine().begin() as conn:
+        conn.execute(text("""
+        INSERT INTO complaints(ticket_no, user_id, username, full_name, category, message_text, status, created_at)
+        SELECT 'B-' || g, :base + (g % :users), 'bench', 'Bench',
+               CASE WHEN g % 3 = 0 THEN 'suggestion' ELSE 'complaint' END,
+               'explain bench row ' || g,
+               (ARRAY['new','in_progress','done'])[1 + g % 3],
+               NOW() - (g % 730) * INTERVAL '1 day' - (g % 86400) * INTERVAL '1 second'
+        FROM generate_series(1, :rows) g
+        """), dict(base=BASE_UID, users=USERS, rows=rows))
+        conn.execute(text("ANALYZE complaints"))
+
+def cleanup():
+    with db.get_engine().begin() as conn:
+        conn.execute(text("DELETE FROM complaints WHERE user_id >= :base"), dict(base=BASE_UID))
+        conn.execute(text("DELETE FROM user_summary WHERE user_id >= :base"), dict(base=BASE_UID))
+        conn.execute(text("ANALYZE complaints"))
+
+def seq_scans(plan, relation="complaints"):
+    found = []
+    def walk(node):
+        if node.get("Node Type") == "Seq Scan" and node.get("Relation Name", "").startswith(relation):
+            found.append(node["Relation Name"])
+        for child in node.get("Plans", []):
+            walk(child)
+    walk(plan)
+    return found
+
+def capture(fn, *args, **kwargs):
+    statements = []
+    def before(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+    eng = db.get_engine()
+    event.listen(eng, "before_cursor_execute", before)
+    try:
+        fn(*args, **kwargs)
+    finally:
+        event.remove(eng, "before_cursor_execute", before)
+    return statements
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=500_000)
+    ap.add_argument("--keep", action="store_true", help="не удалять засеянные строки")
+    args = ap.parse_args()
+
+    common.require_db()
+    db.wait_db()
+    db.init_db()
+    seed(args.rows)
+
+    calls = [
+        ("list_complaints", lambda: db.list_complaints("complaint", limit=30, offset=0)),
+        ("list_complaints", lambda: db.list_complaints(None, limit=30, offset=0)),
+        ("list_complaints", lambda: db.list_complaints(None, limit=10, offset=0, by_user=BASE_UID + 7)),
+        ("get_by_ticket",   lambda: db.get_by_ticket("B-12345")),
+        ("set_status",      lambda: db.set_status("B-12345", "done")),
+        ("stats_counts",    lambda: (db.invalidate_stats(), db.stats_counts())),
+        ("list_users",      lambda: db.list_users(limit=50, offset=0)),
+        ("search",          lambda: db.search_complaints("explain bench", limit=30)),
+        ("search",          lambda: db.search_complaints("12345", "complaint", limit=30)),
+    ]
+    failures = 0
+    raw = db.get_engine().raw_connection()
+    try:
+        cur = raw.cursor()
+        for name, call in calls:
+            for i, (stmt, params) in enumerate(capture(call)):
+                cur.execute("EXPLAIN (FORMAT JSON) " + stmt, params)
+                plan = cur.fetchone()[0][0]["Plan"]
+                scans = seq_scans(plan)
+                exempt = EXEMPT.get((name, i))
+                status = "ok" if not scans else ("exempt: " + exempt if exempt else "SEQ SCAN")
+                if scans and not exempt:
+                    failures += 1
+                print(json.dumps({"fn": name, "stmt": i, "status": status, "top": plan["Node Type"]}, ensure_ascii=False))
+        raw.rollback()
+    finally:
+        raw.close()
+        if not args.keep:
+            cleanup()
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
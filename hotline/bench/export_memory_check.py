@@ -0,0 +1,95 @@
+"""Проверка потоковой выгрузки на большой таблице: в complaints засеваются
+--rows строк (2001–2005 годы, триггеры отключены через
+session_replication_role, нужен суперпользователь), затем в отдельных
+процессах выгружается 10% и 100% этого диапазона. Пиковый RSS должен
+совпадать с точностью до --tolerance-mb, иначе код возврата 1.
+
+    DATABASE_URL=postgresql://... python bench/export_memory_check.py --rows 2000000 --formats csv,ndjson,parquet
+"""
+import os, sys, json, time, argparse, datetime, resource, subprocess
+
+import common
+from sqlalchemy import text
+
+import db
+
+SEED_FROM = datetime.date(2001, 1, 1)
+SEED_DAYS = 5 * 365
+
+def seed(rows: int):
+    created = common.ensure_partitions(SEED_FROM, SEED_FROM + datetime.timedelta(days=SEED_DAYS))
+    with db.get_engine().begin() as conn:
+        conn.execute(text("SET LOCAL session_replication_role = replica"))
+        conn.execute(text("""
+            INSERT INTO complaints(ticket_no, user_id, username, full_name, category, message_text, status, created_at)
+            SELECT 'SEED-' || g, 9700000000 + g % 100000, 'user' || g % 100000, 'Seed User ' || g,
+                   CASE WHEN g % 3 = 0 THEN 'suggestion' ELSE 'complaint' END,
+                   'seeded message text, row ' || g || ', ' || repeat('x', 40 + g % 80),
+                   'new', CAST(:d0 AS timestamp) + make_interval(secs => g::float8 * :span / :n)
+            FROM generate_series(1, :n) g
+        """), dict(n=rows, d0=SEED_FROM, span=SEED_DAYS * 86400))
+    return created
+
+def unseed():
+    with db.get_engine().begin() as conn:
+        conn.execute(text("SET LOCAL session_replication_role = replica"))
+        conn.execute(text("DELETE FROM complaints WHERE ticket_no LIKE 'SEED-%'"))
+
+def child(fmt: str, gz: bool, share: float):
+    import export
+    date_to = SEED_FROM + datetime.timedelta(days=int(SEED_DAYS * share) - 1)
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    t0 = time.perf_counter()
+    size = export.export_to_file(os.devnull, "all", fmt, gz, SEED_FROM, date_to)
+    elapsed = time.perf_counter() - t0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps(dict(format=fmt + (".gz" if gz else ""), share=share, bytes=size, elapsed_sec=round(elapsed, 2),
+                          base_rss_mb=round(base / 1024, 1), peak_rss_mb=round(peak / 1024, 1))))
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=2_000_000)
+    ap.add_argument("--formats", default="csv,ndjson,parquet")
+    ap.add_argument("--gzip", action="store_true")
+    ap.add_argument("--tolerance-mb", type=float, default=30)
+    ap.add_argument("--keep", action="store_true", help="не удалять засеянные строки")
+    ap.add_argument("--child", nargs=3, default=None, help=argparse.SUPPRESS)
+    ap.add_argument("--json", default=None)
+    args = ap.parse_args()
+
+    if args.child:
+        fmt, gz, share = args.child
+        child(fmt, gz == "1", float(share))
+        return
+
+    common.require_db()
+    db.wait_db()
+    db.init_db()
+    unseed()  # остатки прерванного прогона
+    t0 = time.perf_counter()
+    created = seed(args.rows)
+    seed_sec = time.perf_counter() - t0
+    results, ok = [], True
+    try:
+        for fmt in args.formats.split(","):
+            runs = []
+            for share in (0.1, 1.0):
+                out = subprocess.run([sys.executable, __file__, "--child", fmt, "1" if args.gzip else "0", str(share)],
+                                     check=True, capture_output=True, text=True).stdout
+                runs.append(json.loads(out.strip().splitlines()[-1]))
+            growth = runs[1]["peak_rss_mb"] - runs[0]["peak_rss_mb"]
+            ok &= growth <= args.tolerance_mb
+            results.append(dict(name=f"export[{runs[1]['format']}]", rows=args.rows, seed_sec=round(seed_sec, 1),
+                                rows_per_sec=round(args.rows / runs[1]["elapsed_sec"]) if runs[1]["elapsed_sec"] else None,
+                                mb=round(runs[1]["bytes"] / 2**20, 1),
+                                peak_rss_10pct_mb=runs[0]["peak_rss_mb"], peak_rss_full_mb=runs[1]["peak_rss_mb"],
+                                rss_growth_mb=round(growth, 1)))
+    finally:
+        if not args.keep:
+            unseed()
+            common.drop_partitions(created)
+    common.report(results, args.json)
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
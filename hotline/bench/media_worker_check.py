@@ -0,0 +1,132 @@
+"""Проверка фоновой загрузки вложений против локального S3: moto
+(pip install "moto[server]") поднимается в процессе, если S3_ENDPOINT не
+задан, иначе используется указанный (например MinIO). Telegram заменён
+генератором байтов: часть файлов падает на первой попытке (проверка
+повторов), один — с TelegramBadRequest (сразу failed). Вторым проходом
+проверяется дедупликация: повтор file_unique_id привязывается без задания,
+то же содержимое под новым file_unique_id не оставляет второго объекта.
+Код возврата 1, если результат расходится с ожидаемым.
+
+    DATABASE_URL=postgresql://... python bench/media_worker_check.py --files 200
+"""
+import os, sys, time, asyncio, logging, argparse
+
+os.environ.setdefault("MEDIA_BACKOFF_BASE", "0.2")
+
+import common
+
+def start_moto():
+    from moto.server import ThreadedMotoServer
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = ThreadedMotoServer(port=5055, verbose=False)
+    server.start()
+    os.environ.update(S3_ENDPOINT="http://127.0.0.1:5055", S3_BUCKET="hotline-media", S3_REGION="us-east-1",
+                      S3_ACCESS_KEY="test", S3_SECRET_KEY="test", S3_USE_SSL="false")
+    return server
+
+moto_server = None if os.getenv("S3_ENDPOINT") else start_moto()
+
+from sqlalchemy import text
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import GetFile
+
+import db, adb, media
+
+BASE_UID = 9_600_000_000
+BAD_FILE = "bench-too-big"
+
+async def drain(worker, timeout):
+    await worker.start()
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        st = db.media_job_stats()
+        if st["pending"] == 0 and st["running"] == 0:
+            break
+        await asyncio.sleep(0.2)
+    await worker.stop()
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--files", type=int, default=200)
+    ap.add_argument("--repeats", type=int, default=50, help="повторов по file_unique_id и по содержимому")
+    ap.add_argument("--size-kb", type=int, default=256)
+    ap.add_argument("--workers", type=int, default=8)
+    ap.add_argument("--timeout", type=float, default=60)
+    ap.add_argument("--json", default=None)
+    args = ap.parse_args()
+
+    common.require_db()
+    db.wait_db()
+    db.init_db()
+    s3 = media.get_s3()
+    if moto_server:
+        s3.create_bucket(Bucket=media.S3_BUCKET)
+    before = db.media_dedupe_stats()
+
+    seen = set()
+    block = os.urandom(args.size_kb * 1024)
+
+    async def fetch(file_id):
+        # bench-file-N и bench-dup-N отдают одинаковое содержимое
+        if file_id == BAD_FILE:
+            raise TelegramBadRequest(GetFile(file_id=file_id), "file is too big")
+        if file_id.endswith("7") and file_id not in seen:
+            seen.add(file_id)
+            raise ConnectionError("simulated network error")
+        await asyncio.sleep(0.01)
+        payload = file_id.rsplit("-", 1)[1].encode().ljust(16) + block
+        for i in range(0, len(payload), 64 * 1024):
+            yield payload[i:i + 64 * 1024]
+
+    def submit(i, file_id, unique_id, file_type="photo"):
+        t0 = time.perf_counter()
+        db.insert_complaint(BASE_UID + i, "bench", "Bench", "complaint", "media", file_type, file_id,
+                            file_unique_id=unique_id)
+        return time.perf_counter() - t0
+
+    # проход 1: новые файлы; обращения вставляются без ожидания загрузки
+    submit_lat = [submit(i, f"bench-file-{i}", f"bench-u{i}") for i in range(args.files)]
+    submit(0, BAD_FILE, "bench-u-bad", "video")
+    worker = media.MediaWorker(None, workers=args.workers, poll_sec=0.2, fetch=fetch)
+    t0 = time.perf_counter()
+    await drain(worker, args.timeout)
+    elapsed = time.perf_counter() - t0
+
+    # проход 2: тот же file_unique_id (без задания) и то же содержимое под новым id
+    repeats = min(args.repeats, args.files)
+    submit_lat += [submit(i, f"bench-file-{i}-again", f"bench-u{i}") for i in range(repeats)]
+    submit_lat += [submit(i, f"bench-dup-{i}", f"bench-d{i}") for i in range(repeats)]
+    await drain(worker, args.timeout)
+
+    with db.get_engine().connect() as conn:
+        linked, jobs = conn.execute(text("""
+            SELECT (SELECT COUNT(*) FROM complaints WHERE user_id >= :base AND media_id IS NOT NULL),
+                   (SELECT COUNT(*) FROM media_jobs WHERE user_id >= :base)
+        """), dict(base=BASE_UID)).one()
+    failed = [j for j in db.list_media_jobs("failed", 50) if j.user_id >= BASE_UID]
+    objects = s3.list_objects_v2(Bucket=media.S3_BUCKET, Prefix="media/bench-").get("KeyCount", 0)
+    after = db.media_dedupe_stats()
+    dedupe = {k: after[k] - before[k] for k in after}
+
+    with db.get_engine().begin() as conn:
+        conn.execute(text("""
+            DELETE FROM media WHERE id IN (SELECT media_id FROM complaints WHERE user_id >= :base)
+        """), dict(base=BASE_UID))
+        conn.execute(text("DELETE FROM media_jobs WHERE user_id >= :base"), dict(base=BASE_UID))
+        for table in ("complaints", "user_summary"):
+            conn.execute(text(f"DELETE FROM {table} WHERE user_id >= :base"), dict(base=BASE_UID))
+    adb.shutdown_executor()
+    if moto_server:
+        moto_server.stop()
+
+    result = common.summarize("media_submit", submit_lat, sum(submit_lat), **worker.stats(),
+                              linked=linked, jobs=jobs, s3_objects=objects, drain_sec=round(elapsed, 2),
+                              dedupe=dedupe, failed_jobs=[(j.file_id, j.last_error) for j in failed])
+    common.report([result], args.json)
+    ok = (linked == args.files + 2 * repeats and jobs == args.files + 1 + repeats
+          and objects == args.files and dedupe["reuses"] == repeats and dedupe["dupes"] == repeats
+          and [j.file_id for j in failed] == [BAD_FILE])
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,222 @@
+"""Проверка диспетчера исходящих сообщений (outbox.py) без Telegram: Bot
+работает через подменённую сессию, которая записывает время каждой отправки.
+В outbox ставится --messages сообщений в --chats личных чатов и копии в
+групповой чат; один чат отвечает 429 (retry_after), один — Forbidden, часть
+copyMessage падает с TelegramBadRequest (должен уйти fallback-текст).
+Шлют --dispatchers диспетчеров сразу, как реплики бота. Посередине они
+останавливаются и запускаются заново — сообщения должны дойти из таблицы.
+Проверяется: всё доставлено без дублей, общий (на всех диспетчеров) и
+поканальный темп не выше заданных, после 429 чат молчит retry_after секунд,
+ни один чат не был одновременно в работе у двух диспетчеров.
+Код возврата 1, если что-то не так.
+
+    DATABASE_URL=postgresql://... python bench/outbox_check.py --messages 1000 --chats 200 --rate 100 --chat-rate 2
+"""
+import os, sys, time, asyncio, argparse, datetime
+
+os.environ.setdefault("OUTBOX_LEASE_SEC", "3")
+os.environ.setdefault("OUTBOX_BACKOFF_BASE", "0.2")
+
+import common
+from sqlalchemy import text
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest
+from aiogram.methods import SendMessage, CopyMessage
+from aiogram.types import Message, MessageId, Chat
+
+import db, outbox
+from db import OutboxMessage
+
+BASE_CHAT = 9_950_000_000
+GROUP_CHAT = -1_009_950_000_000
+THROTTLED, FORBIDDEN = BASE_CHAT + 7, BASE_CHAT + 13
+RETRY_AFTER = 2
+
+class FakeSession(BaseSession):
+    def __init__(self, latency: float):
+        super().__init__()
+        self.latency = latency
+        self.log = []        # (t, chat_id, text)
+        self.throttled_at = []
+        self.copies = 0
+        self.restarted_at = None
+
+    async def make_request(self, bot, method, timeout=None):
+        await asyncio.sleep(self.latency)
+        chat_id = method.chat_id
+        if chat_id == FORBIDDEN:
+            raise TelegramForbiddenError(method=method, message="Forbidden: bot was blocked by the user")
+        if chat_id == THROTTLED and not self.throttled_at:
+            self.throttled_at.append(time.monotonic())
+            raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=RETRY_AFTER)
+        if isinstance(method, CopyMessage):
+            self.copies += 1
+            if method.message_id % 2:
+                raise TelegramBadRequest(method=method, message="Bad Request: message to copy not found")
+            self.log.append((time.monotonic(), chat_id, f"copy:{method.message_id}"))
+            return MessageId(message_id=method.message_id)
+        assert isinstance(method, SendMessage)
+        self.log.append((time.monotonic(), chat_id, method.text))
+        return Message(message_id=1, date=datetime.datetime.now(), chat=Chat(id=chat_id, type="private"), text=method.text)
+
+    async def stream_content(self, *args, **kwargs):
+        raise NotImplementedError
+        yield b""
+
+    async def close(self):
+        pass
+
+def cleanup():
+    with db.get_engine().begin() as conn:
+        conn.execute(text("DELETE FROM outbox WHERE chat_id BETWEEN :a AND :b OR chat_id = :g"),
+                     dict(a=BASE_CHAT, b=BASE_CHAT + 1_000_000, g=GROUP_CHAT))
+
+def max_in_window(times, window):
+    times, best, j = sorted(times), 0, 0
+    for i, t in enumerate(times):
+        while times[j] < t - window:
+            j += 1
+        best = max(best, i - j + 1)
+    return best
+
+async def wait_empty(timeout):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        st = db.outbox_stats()
+        with db.get_engine().connect() as conn:
+            left = conn.execute(text("""
+            SELECT COUNT(*) FROM outbox WHERE status <> 'failed' AND (chat_id BETWEEN :a AND :b OR chat_id = :g)
+            """), dict(a=BASE_CHAT, b=BASE_CHAT + 1_000_000, g=GROUP_CHAT)).scalar()
+        if not left:
+            return st
+        await asyncio.sleep(0.2)
+    return None
+
+async def watch_chats(stop: asyncio.Event, shared: list):
+    # чаты, у которых живые sending сразу у нескольких диспетчеров
+    while not stop.is_set():
+        with db.get_engine().connect() as conn:
+            shared += conn.execute(text("""
+            SELECT chat_id FROM outbox
+            WHERE status = 'sending' AND locked_at >= NOW() - make_interval(secs => :lease)
+            GROUP BY chat_id HAVING COUNT(DISTINCT locked_by) > 1
+            """), dict(lease=outbox.OUTBOX_LEASE_SEC)).scalars().all()
+        await asyncio.sleep(0.05)
+
+async def run(args):
+    session = FakeSession(args.latency)
+    bot = Bot("1:bench", session=session)
+    msgs = [OutboxMessage(BASE_CHAT + i % args.chats, "text", {"text": f"m{i}", "parse_mode": None})
+            for i in range(args.messages)]
+    msgs += [OutboxMessage(GROUP_CHAT, "copy", {"from_chat_id": BASE_CHAT, "message_id": 1000 + i,
+                                                "fallback": f"fallback {1000 + i}"}, outbox.PRIORITY_NOTICE)
+             for i in range(args.copies)]
+    db.enqueue_outbox(msgs)
+    names = [f"outbox-check-{i}" for i in range(args.dispatchers)]
+    make = lambda name: outbox.OutboxDispatcher(bot, rate=args.rate, burst=args.burst, chat_rate=args.chat_rate,
+                                                group_rate=args.group_rate, batch=args.batch, poll_sec=0.1, name=name)
+
+    async def start_all():
+        # реплики уже работают: каждый диспетчер с первой пачки знает о соседях
+        for name in names:
+            db.outbox_heartbeat(name, outbox.OUTBOX_ALIVE_SEC)
+        ds = [make(name) for name in names]
+        for d in ds:
+            await d.start()
+        return ds
+
+    stop_watch, shared = asyncio.Event(), []
+    watcher = asyncio.create_task(watch_chats(stop_watch, shared))
+    t0 = time.monotonic()
+    first = await start_all()
+    await asyncio.sleep(args.restart_after)
+    for d in first:
+        await d.stop(timeout=0)  # обрыв посреди пачки
+    session.restarted_at = time.monotonic()
+    second = await start_all()
+    st = await wait_empty(args.timeout)
+    for d in second:
+        await d.stop()
+    elapsed = time.monotonic() - t0
+    stop_watch.set()
+    await watcher
+    return session, first + second, st, elapsed, msgs, sorted(set(shared))
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--messages", type=int, default=1000)
+    ap.add_argument("--chats", type=int, default=200)
+    ap.add_argument("--copies", type=int, default=12)
+    ap.add_argument("--rate", type=float, default=100)
+    ap.add_argument("--burst", type=int, default=outbox.OUTBOX_BURST)
+    ap.add_argument("--chat-rate", type=float, default=2)
+    ap.add_argument("--group-rate", type=float, default=2)
+    ap.add_argument("--batch", type=int, default=100)
+    ap.add_argument("--dispatchers", type=int, default=2)
+    ap.add_argument("--latency", type=float, default=0.02, help="задержка ответа подменённого Telegram, сек")
+    ap.add_argument("--restart-after", type=float, default=2)
+    ap.add_argument("--timeout", type=float, default=120)
+    ap.add_argument("--json", default=None)
+    args = ap.parse_args()
+
+    common.require_db()
+    db.wait_db()
+    db.init_db()
+    cleanup()
+    try:
+        session, dispatchers, st, elapsed, msgs, shared = asyncio.run(run(args))
+        with db.get_engine().connect() as conn:
+            failed = conn.execute(text("SELECT chat_id, COUNT(*) FROM outbox WHERE status = 'failed' "
+                                       "AND (chat_id BETWEEN :a AND :b OR chat_id = :g) GROUP BY chat_id"),
+                                  dict(a=BASE_CHAT, b=BASE_CHAT + 1_000_000, g=GROUP_CHAT)).fetchall()
+    finally:
+        cleanup()
+
+    sent = [(chat, body) for _, chat, body in session.log]
+    expected = {(m.chat_id, m.payload["text"]) for m in msgs if m.kind == "text" and m.chat_id != FORBIDDEN}
+    expected |= {(GROUP_CHAT, f"copy:{m.payload['message_id']}" if m.payload["message_id"] % 2 == 0
+                  else m.payload["fallback"]) for m in msgs if m.kind == "copy"}
+    times = [t for t, _, _ in session.log]
+    # после перезапуска ведра чатов новые (полный burst), поэтому темп чата
+    # считается отдельно до и после перезапуска
+    by_chat = {}
+    for t, chat, _ in session.log:
+        by_chat.setdefault((chat, t >= session.restarted_at), []).append(t)
+    window = 1.0
+    global_max = max_in_window(times, window)
+    global_limit = args.rate * window + args.burst
+    chat_worst = max((max_in_window(ts, window) - (args.chat_rate if c > 0 else args.group_rate) * window
+                      for (c, _), ts in by_chat.items()), default=0)
+    after_429 = [t for t, c, _ in session.log if c == THROTTLED and session.throttled_at and t > session.throttled_at[0]]
+    quiet = round(min(after_429) - session.throttled_at[0], 2) if after_429 else None
+
+    problems = []
+    if st is None:
+        problems.append("queue not drained")
+    if set(sent) != expected:
+        problems.append(f"missing {len(expected - set(sent))}, unexpected {len(set(sent) - expected)}")
+    dupes = len(sent) - len(set(sent))
+    if dupes:
+        problems.append(f"duplicates {dupes}")
+    if global_max > global_limit:
+        problems.append(f"global rate: {global_max} sends in {window}s > {global_limit}")
+    if chat_worst > outbox.OUTBOX_CHAT_BURST:
+        problems.append(f"chat rate exceeded by {chat_worst:.1f}")
+    if quiet is None or quiet < RETRY_AFTER:
+        problems.append(f"chat spoke {quiet}s after 429 (retry_after {RETRY_AFTER})")
+    if dict(failed) != {FORBIDDEN: sum(1 for m in msgs if m.chat_id == FORBIDDEN)}:
+        problems.append(f"failed rows {dict(failed)}")
+    if shared:
+        problems.append(f"chats held by several dispatchers at once: {shared[:10]}")
+
+    stats = {k: sum(d.stats()[k] for d in dispatchers) for k in ("sent", "failed", "retried", "throttled", "deferred")}
+    common.report([dict(name="outbox", messages=len(msgs), delivered=len(sent), elapsed_sec=round(elapsed, 2),
+                        per_sec=round(len(sent) / elapsed, 1), rate=args.rate, chat_rate=args.chat_rate,
+                        dispatchers=args.dispatchers,
+                        max_global_per_sec=global_max, quiet_after_429_sec=quiet, copies_tried=session.copies,
+                        **stats, problems=problems)], args.json)
+    sys.exit(1 if problems else 0)
+
+if __name__ == "__main__":
+    main()
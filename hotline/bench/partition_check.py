@@ -0,0 +1,235 @@
+"""Проверка секционирования complaints и архивации (миграция 0016,
+bot/partitions.py). В секции 2002 года засевается --rows обращений через
+обычные триггеры (user_summary, stats_daily, media_jobs), плюс вложения:
+только в архивируемых месяцах, общее с оставшимся месяцем, повторно
+использованное недавно и старая ссылка file_url. Затем:
+
+- планы: первая страница списка идёт упорядоченным Append без Merge Append и
+  читает не все секции, поиск по номеру заявки отсекает секции других лет;
+- archive(keep_months=5) на «сегодня» 2003-01-15 отсоединяет январь–июль
+  2002 и выгружает их в csv.gz: user_summary и stats_daily совпадают с
+  оставшимися строками, задания media_jobs архивных заявок удалены, строк в
+  файлах — сколько отсоединено;
+- к удалению из S3 выбираются только вложения, которыми больше никто не пользуется;
+- повторный запуск с --drop продолжает с отсоединённых таблиц, файлы не
+  переписывает и удаляет таблицы; оставшиеся месяцы не тронуты.
+
+Код возврата 1, если что-то не так. Засеянное удаляется в любом случае.
+
+    DATABASE_URL=postgresql://... python bench/partition_check.py --rows 50000
+"""
+import os, sys, csv, gzip, time, shutil, argparse, datetime, tempfile
+
+import common
+from sqlalchemy import event, text
+
+import db, partitions
+
+BASE_UID = 9_990_000_000
+USERS = 2000
+YEAR = 2002
+TODAY = datetime.date(YEAR + 1, 1, 15)
+KEEP_MONTHS = 5
+CUTOFF = datetime.datetime(YEAR, 8, 1)  # archive_cutoff(KEEP_MONTHS, TODAY)
+URL_PREFIX = "https://s3.example/hotline/"
+
+def seed(rows: int):
+    created = common.ensure_partitions(datetime.date(YEAR, 1, 1), datetime.date(YEAR, 12, 31))
+    p = dict(base=BASE_UID, users=USERS, n=rows, y=YEAR, cutoff=CUTOFF)
+    with db.get_engine().begin() as conn:
+        # пользователи base+USERS.. пишут только до границы: после архивации их не должно остаться в user_summary
+        conn.execute(text("""
+            INSERT INTO complaints(ticket_no, user_id, username, full_name, category, message_text, status, created_at)
+            SELECT :y || '-' || lpad(g::text, 6, '0'),
+                   CASE WHEN t < :cutoff AND g % 10 = 0 THEN :base + :users + g % 100 ELSE :base + g % :users END,
+                   'part', 'Part Check', CASE WHEN g % 3 = 0 THEN 'suggestion' ELSE 'complaint' END,
+                   'partition check row ' || g, (ARRAY['new','in_progress','done'])[1 + g % 3], t
+            FROM (SELECT g, make_timestamp(:y, 1, 1, 0, 0, 0) + make_interval(secs => g::float8 * 364 * 86400 / :n) AS t
+                  FROM generate_series(1, :n) g) s
+        """), p)
+        conn.execute(text("""
+            INSERT INTO media(sha256, s3_key, url, file_type, last_used_at) VALUES
+                ('partcheck-1', 'media/partcheck-1', :pre || 'media/partcheck-1', 'photo', make_timestamp(:y, 2, 10, 0, 0, 0)),
+                ('partcheck-2', 'media/partcheck-2', :pre || 'media/partcheck-2', 'photo', make_timestamp(:y, 10, 10, 0, 0, 0)),
+                ('partcheck-3', 'media/partcheck-3', :pre || 'media/partcheck-3', 'photo', NOW())
+        """), dict(pre=URL_PREFIX, y=YEAR))
+        # 1 — только в архиве, 2 — ещё и в октябре, 3 — в архиве, но недавно прислан повторно;
+        # старая строка со ссылкой в file_url; вложение без загрузки — задание в media_jobs
+        conn.execute(text("""
+            INSERT INTO complaints(ticket_no, user_id, category, message_text, file_type, file_id, file_url, media_id, created_at)
+            SELECT v.t, :base, 'complaint', 'partition check file', 'photo', 'partcheck-file-' || v.t, v.url,
+                   (SELECT id FROM media WHERE sha256 = v.sha), v.at
+            FROM (VALUES (:y || '-900001', 'partcheck-1', NULL, make_timestamp(:y, 2, 10, 0, 0, 0)),
+                         (:y || '-900002', 'partcheck-2', NULL, make_timestamp(:y, 3, 10, 0, 0, 0)),
+                         (:y || '-900003', 'partcheck-2', NULL, make_timestamp(:y, 10, 10, 0, 0, 0)),
+                         (:y || '-900004', 'partcheck-3', NULL, make_timestamp(:y, 4, 10, 0, 0, 0)),
+                         (:y || '-900005', NULL, :pre || 'legacy/partcheck', make_timestamp(:y, 5, 10, 0, 0, 0)),
+                         (:y || '-900006', NULL, NULL, make_timestamp(:y, 6, 10, 0, 0, 0))) v(t, sha, url, at)
+        """), dict(base=BASE_UID, pre=URL_PREFIX, y=YEAR))
+    with db.get_engine().begin() as conn:
+        conn.execute(text("ANALYZE complaints"))
+    return created
+
+def unseed(created=()):
+    p = dict(a=BASE_UID, b=BASE_UID + 10_000_000)
+    with db.get_engine().begin() as conn:
+        conn.execute(text("DELETE FROM complaints WHERE user_id BETWEEN :a AND :b"), p)
+        conn.execute(text("DELETE FROM user_summary WHERE user_id BETWEEN :a AND :b"), p)
+        conn.execute(text("DELETE FROM media_jobs WHERE user_id BETWEEN :a AND :b"), p)
+        conn.execute(text("DELETE FROM media WHERE sha256 LIKE 'partcheck-%'"))
+        conn.execute(text("DELETE FROM stats_daily WHERE day >= make_date(:y, 1, 1) AND day < make_date(:y + 1, 1, 1)"),
+                     dict(y=YEAR))
+    # в том числе отсоединённые прерванным прогоном
+    common.drop_partitions(sorted({*created, *(p.name for p in db.list_partitions() if p.month.year == YEAR)}))
+
+def plan_of(fn, *args, **kwargs):
+    # SQL, который выполняет функция db.py, и его план с фактическим выполнением
+    captured = []
+    listener = lambda conn, cur, stmt, params, ctx, many: captured.append((stmt, params))
+    event.listen(db.get_engine(), "before_cursor_execute", listener)
+    try:
+        fn(*args, **kwargs)
+    finally:
+        event.remove(db.get_engine(), "before_cursor_execute", listener)
+    stmt, params = next((s, p) for s, p in captured if "complaints" in s)
+    raw = db.get_engine().raw_connection()
+    try:
+        cur = raw.cursor()
+        cur.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + stmt, params)
+        plan = cur.fetchone()[0][0]["Plan"]
+        raw.rollback()
+    finally:
+        raw.close()
+    return plan
+
+def walk(node):
+    yield node
+    for child in node.get("Plans", []):
+        yield from walk(child)
+
+def partitions_of(plan):
+    planned = [n["Relation Name"] for n in walk(plan) if n.get("Relation Name", "").startswith("complaints_")]
+    executed = [n["Relation Name"] for n in walk(plan)
+                if n.get("Relation Name", "").startswith("complaints_") and n.get("Actual Loops", 0) > 0]
+    return planned, executed, any(n["Node Type"] == "Merge Append" for n in walk(plan))
+
+def live_counts(conn):
+    return conn.execute(text("""
+        SELECT COUNT(*), COUNT(*) FILTER (WHERE created_at < :cutoff)
+        FROM complaints WHERE user_id BETWEEN :a AND :b
+    """), dict(a=BASE_UID, b=BASE_UID + 10_000_000, cutoff=CUTOFF)).one()
+
+def check_derived(conn, problems):
+    bad = [r for r in db.check_user_summary(limit=1_000_000) if BASE_UID <= r[0] < BASE_UID + 10_000_000]
+    if bad:
+        problems.append(f"user_summary mismatched for {len(bad)} users, e.g. {tuple(bad[0])}")
+    stats, live = conn.execute(text("""
+        SELECT (SELECT COALESCE(sum(cnt), 0) FROM stats_daily WHERE day >= make_date(:y, 1, 1) AND day < make_date(:y + 1, 1, 1)),
+               (SELECT COUNT(*) FROM complaints WHERE created_at >= make_date(:y, 1, 1) AND created_at < make_date(:y + 1, 1, 1))
+    """), dict(y=YEAR)).one()
+    if stats != live:
+        problems.append(f"stats_daily {stats} vs {live} live rows in {YEAR}")
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=20_000)
+    ap.add_argument("--json", default=None)
+    args = ap.parse_args()
+
+    common.require_db()
+    db.wait_db()
+    db.init_db()
+    unseed()
+    foreign = [p.name for p in db.list_partitions() if not p.attached or p.month < CUTOFF.date()]
+    if foreign:
+        raise SystemExit(f"archive() would touch partitions that are not ours: {', '.join(foreign)}")
+    t0 = time.perf_counter()
+    created = seed(args.rows)
+    seed_sec = time.perf_counter() - t0
+    export_dir = tempfile.mkdtemp(prefix="partcheck-")
+    problems, result = [], dict(name="partitions", rows=args.rows, seed_sec=round(seed_sec, 2))
+    try:
+        total = len(db.list_partitions())
+        # первая страница списка: с конца, без Merge Append, не все секции
+        planned, executed, merge = partitions_of(plan_of(db.list_complaints, None, 31))
+        result.update(partitions=total, list_planned=len(planned), list_executed=len(executed))
+        if merge or len(executed) >= total:
+            problems.append(f"list_complaints: merge append {merge}, {len(executed)} of {total} partitions executed")
+        # номер заявки: только секции своего года (± сутки)
+        planned, _, _ = partitions_of(plan_of(db.get_by_ticket, f"{YEAR}-000123"))
+        result.update(ticket_planned=len(planned))
+        if not planned or any(not (f"_{YEAR - 1}_12" in n or f"_{YEAR}_" in n or f"_{YEAR + 1}_01" in n) for n in planned):
+            problems.append(f"get_by_ticket not pruned to {YEAR}: {planned}")
+
+        with db.get_engine().connect() as conn:
+            live_before, archived_expected = live_counts(conn)
+            version0 = conn.execute(text("SELECT version FROM data_versions WHERE name = 'complaints'")).scalar()
+            check_derived(conn, problems)
+
+        t0 = time.perf_counter()
+        items = partitions.archive(KEEP_MONTHS, export_dir, today=TODAY)
+        result.update(archive_sec=round(time.perf_counter() - t0, 2), detached=len(items),
+                      archived_rows=sum(it["rows"] for it in items))
+        months = [it["month"] for it in items]
+        if months != [f"{YEAR}-{m:02d}-01" for m in range(1, 8)]:
+            problems.append(f"detached months {months}")
+        if result["archived_rows"] != archived_expected:
+            problems.append(f"detached {result['archived_rows']} rows, expected {archived_expected}")
+        with db.get_engine().connect() as conn:
+            live_after, archived_left = live_counts(conn)
+            if (live_after, archived_left) != (live_before - archived_expected, 0):
+                problems.append(f"live rows {live_after} (archived left {archived_left}), "
+                                f"expected {live_before - archived_expected}")
+            check_derived(conn, problems)
+            old_only = conn.execute(text("SELECT COUNT(*) FROM user_summary WHERE user_id BETWEEN :a AND :b"),
+                                    dict(a=BASE_UID + USERS, b=BASE_UID + USERS + 100)).scalar()
+            if old_only:
+                problems.append(f"{old_only} users with only archived complaints left in user_summary")
+            if conn.execute(text("SELECT COUNT(*) FROM media_jobs WHERE ticket_no = :t"), dict(t=f"{YEAR}-900006")).scalar():
+                problems.append("media job of an archived ticket not deleted")
+            if conn.execute(text("SELECT version FROM data_versions WHERE name = 'complaints'")).scalar() == version0:
+                problems.append("data_versions not bumped")
+
+        exported, mtimes = 0, {}
+        for it in items:
+            with gzip.open(it["file"], "rt", encoding="utf-8", newline="") as f:
+                reader = csv.reader(f)
+                if next(reader) != partitions.ARCHIVE_COLS:
+                    problems.append(f"{it['file']}: unexpected header")
+                exported += sum(1 for _ in reader)
+            mtimes[it["file"]] = os.stat(it["file"]).st_mtime_ns
+        result.update(exported_rows=exported, export_mb=round(sum(os.path.getsize(f) for f in mtimes) / 2**20, 2))
+        if exported != archived_expected:
+            problems.append(f"exported {exported} rows, expected {archived_expected}")
+
+        keys = sorted(k for it in items for k in db.delete_partition_media(it["name"], URL_PREFIX))
+        if keys != ["legacy/partcheck", "media/partcheck-1"]:
+            problems.append(f"media to delete {keys}")
+        with db.get_engine().connect() as conn:
+            left = conn.execute(text("SELECT sha256 FROM media WHERE sha256 LIKE 'partcheck-%' ORDER BY 1")).scalars().all()
+        if left != ["partcheck-2", "partcheck-3"]:
+            problems.append(f"media left {left}")
+
+        # второй запуск: продолжает с отсоединённых таблиц, готовые файлы не переписывает
+        again = partitions.archive(KEEP_MONTHS, export_dir, drop=True, today=TODAY)
+        if [it["name"] for it in again] != [it["name"] for it in items] or not all(it.get("dropped") for it in again):
+            problems.append(f"resume: {again}")
+        if any(os.stat(f).st_mtime_ns != t for f, t in mtimes.items()):
+            problems.append("resume rewrote export files")
+        names = {p.name for p in db.list_partitions()}
+        if any(it["name"] in names for it in items):
+            problems.append("archived partitions still exist")
+        with db.get_engine().connect() as conn:
+            if live_counts(conn)[0] != live_after:
+                problems.append("kept months changed")
+        if db.ensure_partitions():
+            problems.append("ensure_partitions created partitions after init_db")
+    finally:
+        shutil.rmtree(export_dir, ignore_errors=True)
+        unseed(created)
+    result["problems"] = problems
+    common.report([result], args.json)
+    sys.exit(1 if problems else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Сравнение бэкендов лимитера по решениям в секунду.
+
+    python bench/ratelimit_bench.py --decisions 50000
+    REDIS_URL=redis://localhost:6379/0 python bench/ratelimit_bench.py --backends memory,redis
+    DATABASE_URL=postgresql://... python bench/ratelimit_bench.py --backends memory,table
+
+Для redis без сервера используется fakeredis (pip install fakeredis lupa),
+если REDIS_URL не задан.
+"""
+import argparse, asyncio, os, time, datetime
+
+import common
+import ratelimit
+
+BASE_UID = 9_400_000_000
+USERS = 10_000
+
+def make_redis():
+    if os.getenv("REDIS_URL"):
+        return ratelimit.RedisLimiter()
+    import fakeredis
+    return ratelimit.RedisLimiter(client=fakeredis.FakeAsyncRedis())
+
+class TableBench(ratelimit.RateLimiter):
+    # Таблица rate_limiter так, как её использовал handle_payload: SELECT + UPSERT
+    def __init__(self):
+        import adb
+        self.adb = adb
+
+    async def hit(self, user_id, category):
+        now = datetime.datetime.utcnow()
+        last = await self.adb.last_submit_time(user_id)
+        if last and (now - last).total_seconds() < self.window_for(category):
+            return 1
+        await self.adb.touch_rate_limit(user_id, now)
+        return 0
+
+    async def refund(self, user_id, category):
+        pass
+
+async def run_backend(name, limiter, decisions, concurrency):
+    latencies, allowed = [], 0
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        nonlocal allowed
+        async with sem:
+            t0 = time.perf_counter()
+            wait = await limiter.hit(BASE_UID + i % USERS, "complaint")
+            latencies.append(time.perf_counter() - t0)
+            allowed += wait == 0
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(decisions)))
+    result = common.summarize(f"ratelimit[{name}]", latencies, time.perf_counter() - t0, allowed=allowed)
+    await limiter.close()
+    return result
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--backends", default="memory,redis")
+    ap.add_argument("--decisions", type=int, default=50_000)
+    ap.add_argument("--concurrency", type=int, default=100)
+    ap.add_argument("--json", default=None)
+    args = ap.parse_args()
+
+    factories = {"memory": ratelimit.MemoryLimiter, "redis": make_redis, "table": TableBench}
+    results = []
+    for name in args.backends.split(","):
+        if name == "table":
+            common.require_db()
+            import db, adb
+            from sqlalchemy import text
+            db.init_db()
+        n = args.decisions if name != "table" else min(args.decisions, 5000)
+        results.append(await run_backend(name, factories[name](), n, args.concurrency))
+        if name == "table":
+            with db.get_engine().begin() as conn:
+                conn.execute(text("DELETE FROM rate_limiter WHERE user_id >= :base"), dict(base=BASE_UID))
+            adb.shutdown_executor()
+    common.report(results, args.json)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,188 @@
+"""Проверка маршрутизации чтений на реплики (db.get_engine(readonly=True)).
+С --replica-url — настоящая реплика (второй экземпляр Postgres, потоковая
+репликация). Без него — замена на одном сервере: временная роль с
+pg_read_all_data, «реплика» — тот же DATABASE_URL под этой ролью. Отставание
+у неё всегда 0, поэтому отставание проверяется остановкой проверок:
+между ними оценка растёт на прошедшее время.
+
+- списки, поиск, статистика, data_versions и выгрузка читаются с реплики,
+  запись через её соединение падает (read-only);
+- после submit_complaint обращения этого пользователя читаются с основного,
+  другие — с реплики; через DB_REPLICA_MAX_LAG_SEC снова с реплики;
+- массовая смена статуса переводит на основной все чтения процесса;
+- get_by_ticket, не нашедший заявку на реплике, перечитывает её с основного;
+- без свежей проверки дольше допустимого отставания — чтения на основном,
+  после проверки — снова на реплике;
+- недоступная реплика (неверный порт) — чтения на основном, ошибок нет.
+
+Код возврата 1, если что-то не так.
+
+    DATABASE_URL=postgresql://... python bench/replica_check.py
+    DATABASE_URL=postgresql://primary/... python bench/replica_check.py --replica-url postgresql://replica/...
+"""
+import sys, time, argparse, threading
+
+import common
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+
+import db, export
+
+BASE_UID = 9_500_000_000
+ROLE = "hotline_replica_check"
+MAX_LAG = 0.5
+
+def create_role() -> str:
+    with db.get_engine().begin() as conn:
+        conn.execute(text(f"DROP ROLE IF EXISTS {ROLE}"))
+        conn.execute(text(f"CREATE ROLE {ROLE} LOGIN PASSWORD '{ROLE}'"))
+        conn.execute(text(f"GRANT pg_read_all_data TO {ROLE}"))
+    url = make_url(db.DATABASE_URL).set(username=ROLE, password=ROLE)
+    return url.render_as_string(hide_password=False)
+
+def drop_role():
+    with db.get_engine().begin() as conn:
+        conn.execute(text(f"DROP ROLE IF EXISTS {ROLE}"))
+
+def use_replicas(urls: list[str]):
+    db.dispose_engine()
+    db.DATABASE_REPLICA_URLS = urls
+
+def wait_checked(timeout: float = 10.0) -> db.Replica:
+    # первая проверка идёт фоном с первого чтения
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        db.get_engine(readonly=True)
+        r = db._get_replicas()[0]
+        if r.checked_at:
+            return r
+        time.sleep(0.05)
+    raise SystemExit("replica check did not run")
+
+class Served:
+    # какими движками выполнялись запросы этого потока внутри with (фоновая проверка реплик не в счёт)
+    def __init__(self):
+        self.targets = []
+
+    def __enter__(self):
+        self.engines = [(db.get_engine(), "primary")] + [(r.engine, "replica") for r in db._get_replicas()]
+        me = threading.current_thread()
+        self.listeners = [(eng, lambda *a, name=name: threading.current_thread() is me and self.targets.append(name))
+                          for eng, name in self.engines]
+        for eng, fn in self.listeners:
+            event.listen(eng, "before_cursor_execute", fn)
+        return self
+
+    def __exit__(self, *exc):
+        for eng, fn in self.listeners:
+            event.remove(eng, "before_cursor_execute", fn)
+
+def served(fn, *args, **kwargs) -> list[str]:
+    with Served() as s:
+        fn(*args, **kwargs)
+    return s.targets
+
+def expect(problems, what, got, want):
+    if got != want:
+        problems.append(f"{what}: {got}, expected {want}")
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--replica-url", default=None, help="настоящая реплика; без него — роль на том же сервере")
+    ap.add_argument("--json", default=None)
+    args = ap.parse_args()
+
+    common.require_db()
+    db.wait_db()
+    db.init_db()
+    url = args.replica_url or create_role()
+    db.DB_REPLICA_MAX_LAG_SEC, db.DB_REPLICA_CHECK_SEC = MAX_LAG, 0.1
+    uid, other = BASE_UID, BASE_UID + 1
+    problems, result = [], dict(name="replicas", stand_in=not args.replica_url)
+    try:
+        use_replicas([url])
+        r = wait_checked()
+        result.update(replica=r.name, lag=r.lag, error=r.error)
+        if r.lag is None or r.lag > MAX_LAG:
+            raise SystemExit(f"replica {r.name} is not usable: lag {r.lag}, {r.error}")
+
+        db.invalidate_stats()
+        for name, fn, fargs in (("list_complaints", db.list_complaints, (None, 10)),
+                                ("list_users", db.list_users, (10,)),
+                                ("list_blocked", db.list_blocked, (10,)),
+                                ("search_complaints", db.search_complaints, ("проверка",)),
+                                ("stats_counts", db.stats_counts, ()),
+                                ("stats_range", db.stats_range, (db.datetime.date(2026, 1, 1), db.datetime.date.today())),
+                                ("data_version", db.data_version, ("complaints",)),
+                                ("export", lambda: next(export.iter_rows("complaints"), None), ())):
+            expect(problems, name, set(served(fn, *fargs)), {"replica"})
+        try:
+            with r.engine.begin() as conn:
+                conn.execute(text("UPDATE data_versions SET version = version WHERE name = 'complaints'"))
+            problems.append("write through a replica connection succeeded")
+        except Exception as e:
+            result["replica_write"] = type(getattr(e, "orig", e)).__name__
+
+        # свои записи: автор читает с основного, остальные — с реплики
+        db.set_user_category(uid, "complaint")
+        res = db.submit_complaint(uid, "replica", "Replica Check", "replica check")
+        expect(problems, "submit", res.outcome, "saved")
+        with Served() as s:
+            mine = db.list_complaints(None, 10, by_user=uid)
+        expect(problems, "author right after submit", s.targets, ["primary"])
+        if not mine or mine[0][1] != res.ticket:
+            problems.append(f"author does not see {res.ticket}")
+        expect(problems, "other user right after submit", served(db.list_complaints, None, 10, by_user=other), ["replica"])
+        time.sleep(MAX_LAG + 0.1)
+        expect(problems, "author after the lag window", served(db.list_complaints, None, 10, by_user=uid), ["replica"])
+
+        # запись администратора: на основной все чтения процесса
+        db.set_statuses([res.ticket], "done", notify=False)
+        expect(problems, "list after set_statuses", served(db.list_complaints, None, 10), ["primary"])
+        time.sleep(MAX_LAG + 0.1)
+        expect(problems, "list after the lag window", served(db.list_complaints, None, 10), ["replica"])
+
+        expect(problems, "get_by_ticket found", served(db.get_by_ticket, res.ticket), ["replica"])
+        expect(problems, "get_by_ticket missing", served(db.get_by_ticket, "2026-999999999"), ["replica", "primary"])
+
+        # проверки остановились: оценка отставания растёт, пока не превысит допустимое
+        db.DB_REPLICA_CHECK_SEC = 3600
+        time.sleep(MAX_LAG + 0.1)
+        expect(problems, "stale check", served(db.list_complaints, None, 10), ["primary"])
+        db.DB_REPLICA_CHECK_SEC = 0.1
+        use_replicas([url])
+        wait_checked()
+        expect(problems, "after a fresh check", served(db.list_complaints, None, 10), ["replica"])
+
+        # недоступная реплика
+        down = make_url(url).set(host="127.0.0.1", port=1, query={}).render_as_string(hide_password=False)
+        use_replicas([down])
+        r = wait_checked()
+        result["down_error"] = r.error
+        if r.lag is not None:
+            problems.append(f"unreachable replica has lag {r.lag}")
+        t0 = time.perf_counter()
+        expect(problems, "replica down", served(db.list_complaints, None, 10), ["primary"])
+        result["down_read_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+
+        # без DATABASE_REPLICA_URLS — всё на основном, как раньше
+        use_replicas([])
+        expect(problems, "no replicas", db.get_engine(readonly=True) is db.get_engine(), True)
+        result["reads"] = {"/".join(k): v._value.get() for k, v in db._READS.items()}
+    finally:
+        use_replicas([])
+        with db.get_engine().begin() as conn:
+            conn.execute(text("DELETE FROM complaints WHERE user_id = :u"), dict(u=uid))
+            conn.execute(text("DELETE FROM user_summary WHERE user_id = :u"), dict(u=uid))
+            conn.execute(text("DELETE FROM user_state WHERE user_id = :u"), dict(u=uid))
+            conn.execute(text("DELETE FROM rate_limiter WHERE user_id = :u"), dict(u=uid))
+            conn.execute(text("DELETE FROM media_jobs WHERE user_id = :u"), dict(u=uid))
+        if not args.replica_url:
+            db.dispose_engine()
+            drop_role()
+    result["problems"] = problems
+    common.report([result], args.json)
+    sys.exit(1 if problems else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Передача вложений в локальный S3 (moto в отдельном процессе или свой
+S3_ENDPOINT, например MinIO): старая схема (весь файл в BytesIO + новый
+boto3-клиент на файл) против потоковой media.upload_stream. Каждый режим
+запускается в отдельном процессе, чтобы пиковый RSS мерился честно.
+
+    python bench/s3_transfer_bench.py --photos 200 --videos 10 --video-mb 40 --concurrency 8
+"""
+import os, sys, json, time, asyncio, argparse, resource, subprocess
+
+import common
+
+MOTO_PORT = 5056
+BLOCK = os.urandom(256 * 1024)
+
+def s3_env() -> dict:
+    if os.getenv("S3_ENDPOINT"):
+        return {}
+    return dict(S3_ENDPOINT=f"http://127.0.0.1:{MOTO_PORT}", S3_BUCKET="hotline-bench", S3_REGION="us-east-1",
+                S3_ACCESS_KEY="test", S3_SECRET_KEY="test", S3_USE_SSL="false")
+
+async def source(size: int):
+    # имитация stream_content Telegram: куски по 256 КБ, без хранения файла целиком
+    sent = 0
+    while sent < size:
+        n = min(len(BLOCK), size - sent)
+        yield BLOCK[:n]
+        sent += n
+        await asyncio.sleep(0)
+
+async def upload_buffered(media, chunks, key):
+    # как было в tg_file_to_s3 до фоновой загрузки: BytesIO + новый клиент
+    from io import BytesIO
+    import boto3
+    buf = BytesIO()
+    async for chunk in chunks:
+        buf.write(chunk)
+    buf.seek(0)
+    s3 = boto3.client("s3", endpoint_url=media.S3_ENDPOINT, aws_access_key_id=media.S3_ACCESS,
+                      aws_secret_access_key=media.S3_SECRET, region_name=media.S3_REGION)
+    await asyncio.to_thread(s3.upload_fileobj, buf, media.S3_BUCKET, key, ExtraArgs={"ACL": "public-read"})
+    return media.public_url(key)
+
+async def run_mode(mode: str, args):
+    import media
+    upload = media.upload_stream if mode == "stream" else (lambda c, k: upload_buffered(media, c, k))
+    sizes = [args.photo_kb * 1024] * args.photos + [args.video_mb * 1024 * 1024] * args.videos
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    sem = asyncio.Semaphore(args.concurrency)
+    latencies = []
+
+    async def one(i, size):
+        async with sem:
+            t0 = time.perf_counter()
+            await upload(source(size), f"bench/{mode}/{i}")
+            latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i, s) for i, s in enumerate(sizes)))
+    elapsed = time.perf_counter() - t0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return common.summarize(f"s3_transfer[{mode}]", latencies, elapsed, concurrency=args.concurrency,
+                            total_mb=round(sum(sizes) / 2**20, 1), mb_per_sec=round(sum(sizes) / 2**20 / elapsed, 1),
+                            base_rss_mb=round(base_rss / 1024, 1), peak_rss_mb=round(peak / 1024, 1),
+                            rss_growth_mb=round((peak - base_rss) / 1024, 1))
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--modes", default="buffered,stream")
+    ap.add_argument("--photos", type=int, default=200)
+    ap.add_argument("--photo-kb", type=int, default=800)
+    ap.add_argument("--videos", type=int, default=10)
+    ap.add_argument("--video-mb", type=int, default=40)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    ap.add_argument("--json", default=None)
+    args = ap.parse_args()
+
+    if args.child:
+        print(json.dumps(asyncio.run(run_mode(args.child, args))))
+        return
+
+    env = dict(os.environ, **s3_env(), MEDIA_WORKERS=str(args.concurrency))
+    server = None
+    if not os.getenv("S3_ENDPOINT"):
+        server = subprocess.Popen([sys.executable, "-m", "moto.server", "-p", str(MOTO_PORT)],
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        time.sleep(2)
+    try:
+        if server:
+            import boto3
+            boto3.client("s3", endpoint_url=env["S3_ENDPOINT"], aws_access_key_id=env["S3_ACCESS_KEY"],
+                         aws_secret_access_key=env["S3_SECRET_KEY"], region_name=env["S3_REGION"]
+                         ).create_bucket(Bucket=env["S3_BUCKET"])
+        shape = ["--photos", str(args.photos), "--photo-kb", str(args.photo_kb), "--videos", str(args.videos),
+                 "--video-mb", str(args.video_mb), "--concurrency", str(args.concurrency)]
+        results = []
+        for mode in args.modes.split(","):
+            out = subprocess.run([sys.executable, __file__, "--child", mode] + shape,
+                                 env=env, check=True, capture_output=True, text=True).stdout
+            results.append(json.loads(out.strip().splitlines()[-1]))
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+    common.report(results, args.json)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""Поиск по обращениям на большой таблице: засевает complaints --rows
+строками из русского и узбекского словаря (частоты слов по убыванию плюс
+длинный хвост редких токенов — номера домов и квартир, как в живом тексте;
+триггеры отключены через session_replication_role, нужен суперпользователь),
+затем гоняет db.search_complaints_page по набору запросов — частое слово,
+редкое, словоформа, узбекское, фраза, опечатка, вторая страница по курсору.
+Для каждого запроса проверяется, что план идёт по индексу (GIN для редких
+слов, complaints_created_idx для частых), а не Seq Scan по complaints
+(иначе код возврата 1).
+
+    DATABASE_URL=postgresql://... python bench/search_bench.py --rows 1000000 --repeat 50
+"""
+import sys, time, json, argparse, datetime
+
+import common
+from sqlalchemy import event, text
+
+import db
+
+BASE_UID = 9_800_000_000
+RARE = "шлагбаум"
+WORDS = ("подъезд вода нет свет улица грязный мусор двор лифт отопление жалоба просьба дом квартира "
+         "холодно сломан уже неделю никто не отвечает автобус дорога яма ремонт школа очередь врач "
+         "suv yo'q chiroq yo'l maktab navbat shifokor issiq sovuq avtobus uy hovli iltimos "
+         "охрана парковка детская площадка счётчик тариф").split()
+
+QUERIES = [
+    ("common", "подъезд"),
+    ("stem", "подъезды"),
+    ("two_words", "грязный лифт"),
+    ("phrase", '"не отвечает"'),
+    ("uzbek", "chiroq"),
+    ("rare", RARE),
+    ("typo", "шлагбаму"),
+    ("none", "абракадабра"),
+]
+
+def seed(rows: int):
+    common.ensure_partitions(datetime.date.today() - datetime.timedelta(seconds=rows))
+    with db.get_engine().begin() as conn:
+        conn.execute(text("SET LOCAL session_replication_role = replica"))
+        conn.execute(text("""
+            INSERT INTO complaints(ticket_no, user_id, username, full_name, category, message_text, status, created_at)
+            SELECT 'SRCH-' || g, :base + g % 50000, 'bench', 'Bench',
+                   CASE WHEN g % 3 = 0 THEN 'suggestion' ELSE 'complaint' END,
+                   array_to_string(ARRAY(
+                       SELECT (CAST(:words AS text[]))[1 + floor(power(random(), 2) * :n)::int]
+                       FROM generate_series(1, 6 + g % 14)
+                   ), ' ') || ' д' || (g::bigint * 7919) % 20000 || ' кв' || g % 100000
+                   || CASE WHEN g % 50000 = 0 THEN ' ' || :rare ELSE '' END,
+                   'new', NOW() - make_interval(secs => g)
+            FROM generate_series(1, :rows) g
+        """), dict(base=BASE_UID, rows=rows, words=list(WORDS), n=len(WORDS), rare=RARE))
+    with db.get_engine().begin() as conn:
+        conn.execute(text("ANALYZE complaints"))
+
+def unseed():
+    with db.get_engine().begin() as conn:
+        conn.execute(text("SET LOCAL session_replication_role = replica"))
+        conn.execute(text("DELETE FROM complaints WHERE user_id >= :base AND ticket_no LIKE 'SRCH-%'"),
+                     dict(base=BASE_UID))
+
+def plan_of(fn):
+    # SQL перехватывается так же, как в explain_check.py
+    statements = []
+    def before(conn, cursor, statement, parameters, context, executemany):
+        if "search_tsv" in statement:
+            statements.append((statement, parameters))
+    eng = db.get_engine()
+    event.listen(eng, "before_cursor_execute", before)
+    try:
+        fn()
+    finally:
+        event.remove(eng, "before_cursor_execute", before)
+    raw = eng.raw_connection()
+    try:
+        cur = raw.cursor()
+        cur.execute("EXPLAIN (FORMAT JSON) " + statements[0][0], statements[0][1])
+        plan = cur.fetchone()[0][0]["Plan"]
+        raw.rollback()
+    finally:
+        raw.close()
+    nodes = []
+    def walk(node):
+        nodes.append((node["Node Type"], node.get("Index Name") or node.get("Relation Name")))
+        for child in node.get("Plans", []):
+            walk(child)
+    walk(plan)
+    return nodes
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=1_000_000)
+    ap.add_argument("--repeat", type=int, default=50)
+    ap.add_argument("--limit", type=int, default=30)
+    ap.add_argument("--keep", action="store_true", help="не удалять засеянные строки")
+    ap.add_argument("--json", default=None)
+    args = ap.parse_args()
+
+    common.require_db()
+    db.wait_db()
+    db.init_db()
+    unseed()  # остатки прерванного прогона
+    t0 = time.perf_counter()
+    seed(args.rows)
+    seed_sec = round(time.perf_counter() - t0, 1)
+    with db.get_engine().connect() as conn:
+        fuzzy = db.has_trgm(conn)
+
+    results, bad = [], []
+    try:
+        first = db.search_complaints_page("подъезд", limit=args.limit)
+        calls = [(name, (lambda q=q: db.search_complaints_page(q, limit=args.limit))) for name, q in QUERIES]
+        calls.append(("common_page2", lambda: db.search_complaints_page("подъезд", limit=args.limit, after=first.next)))
+        for name, call in calls:
+            nodes = plan_of(call)
+            seq = [rel for node, rel in nodes if node == "Seq Scan" and (rel or "").startswith("complaints")]
+            if seq:
+                bad.append(name)
+            latencies = []
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                pg = call()
+                latencies.append(time.perf_counter() - t0)
+            results.append(common.summarize(f"search[{name}]", latencies, sum(latencies), rows=args.rows,
+                                            seed_sec=seed_sec, fuzzy=fuzzy, found=len(pg.rows),
+                                            index_scans=sorted({rel for node, rel in nodes if "Index" in node}),
+                                            seq_scan=bool(seq)))
+    finally:
+        if not args.keep:
+            unseed()
+    common.report(results, args.json)
+    if bad:
+        print(json.dumps({"seq_scan": bad}))
+    sys.exit(1 if bad else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Проверка выдачи номеров заявок под конкурентной нагрузкой: тысячи
+параллельных insert_complaint, затем поиск коллизий ticket_no. Кроме того,
+проверяется, что уникальность держит сама БД: есть уникальный индекс на
+одном ticket_no (complaints до секционирования, complaint_tickets после) и
+повторная вставка уже выданного номера падает с unique_violation.
+Завершается с кодом 1, если нашёлся хотя бы один дубликат или БД его пропускает.
+
+    DATABASE_URL=postgresql://... python bench/ticket_concurrency.py --total 5000 --threads 32
+"""
+import argparse, sys, time
+from concurrent.futures import ThreadPoolExecutor
+
+import common
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+import db
+
+BASE_UID = 9_100_000_000
+
+def unique_index(conn) -> str | None:
+    return conn.execute(text("""
+        SELECT i.indexrelid::regclass::text
+        FROM pg_index i JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+        WHERE i.indrelid IN (to_regclass('complaints'), to_regclass('complaint_tickets'))
+          AND i.indisunique AND i.indnkeyatts = 1 AND a.attname = 'ticket_no'
+        LIMIT 1
+    """)).scalar()
+
+def duplicate_rejected(ticket: str) -> bool:
+    try:
+        with db.get_engine().begin() as conn:
+            conn.execute(text("""
+                INSERT INTO complaints(ticket_no, user_id, category, message_text)
+                VALUES (:t, :u, 'complaint', 'ticket bench duplicate')
+            """), dict(t=ticket, u=BASE_UID))
+    except IntegrityError:
+        return True
+    return False
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--total", type=int, default=5000)
+    ap.add_argument("--threads", type=int, default=32)
+    ap.add_argument("--window", type=int, default=1000, help="размер окна для замера пропускной способности")
+    ap.add_argument("--json", default=None)
+    args = ap.parse_args()
+
+    common.require_db()
+    db.wait_db()
+    db.init_db()
+
+    def one(i):
+        t0 = time.perf_counter()
+        ticket = db.insert_complaint(BASE_UID + i, "bench", "Bench", "complaint", "ticket bench", None, None)
+        return ticket, time.perf_counter() - t0, time.perf_counter()
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        done = list(pool.map(one, range(args.total)))
+    elapsed = time.perf_counter() - t0
+
+    tickets = [t for t, _, _ in done]
+    dupes = len(tickets) - len(set(tickets))
+    with db.get_engine().connect() as conn:
+        db_dupes = conn.execute(text("""
+            SELECT COUNT(*) FROM (
+                SELECT ticket_no FROM complaints GROUP BY ticket_no HAVING COUNT(*) > 1
+            ) d
+        """)).scalar()
+        index = unique_index(conn)
+    rejected = duplicate_rejected(tickets[0])
+
+    # пропускная способность по окнам: должна оставаться ровной, без деградации
+    finish = sorted(ts for _, _, ts in done)
+    windows = []
+    for k in range(0, len(finish) - args.window + 1, args.window):
+        span = finish[k + args.window - 1] - finish[k]
+        windows.append(round(args.window / span, 1) if span > 0 else None)
+
+    with db.get_engine().begin() as conn:
+        conn.execute(text("DELETE FROM complaints WHERE user_id >= :base"), dict(base=BASE_UID))
+        conn.execute(text("DELETE FROM user_summary WHERE user_id >= :base"), dict(base=BASE_UID))
+
+    common.report([common.summarize(
+        "insert_complaint", [lat for _, lat, _ in done], elapsed,
+        threads=args.threads, collisions=dupes, db_collisions=db_dupes, window_per_sec=windows,
+        unique_index=index, duplicate_rejected=rejected,
+    )], args.json)
+    if dupes or db_dupes or not index or not rejected:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Прогон записанных Update через webhook бота (BOT_MODE=webhook).
+Файл — JSON-массив или JSONL с объектами Update (как их присылает Telegram);
+без --file шлются синтетические текстовые сообщения.
+
+    BOT_MODE=webhook WEBHOOK_SECRET=s3cret python bot/main.py &
+    python bench/webhook_replay.py --url http://localhost:8080/tg/webhook --secret s3cret --file updates.jsonl
+"""
+import argparse, asyncio, json, time
+from collections import Counter
+
+import aiohttp
+from yarl import URL
+
+import common
+
+def load_updates(path: str | None, count: int) -> list[dict]:
+    if not path:
+        return [{
+            "update_id": 900_000_000 + i,
+            "message": {
+                "message_id": i + 1, "date": int(time.time()), "text": f"replay message {i}",
+                "chat": {"id": 9_500_000_000 + i % 1000, "type": "private"},
+                "from": {"id": 9_500_000_000 + i % 1000, "is_bot": False, "first_name": "Replay"},
+            },
+        } for i in range(count)]
+    with open(path, encoding="utf-8") as f:
+        raw = f.read().strip()
+    updates = json.loads(raw) if raw.startswith("[") else [json.loads(line) for line in raw.splitlines() if line.strip()]
+    return (updates * (count // len(updates) + 1))[:count] if count else updates
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--url", default="http://localhost:8080/tg/webhook")
+    ap.add_argument("--secret", default="")
+    ap.add_argument("--file", default=None)
+    ap.add_argument("--count", type=int, default=0, help="сколько запросов (0 — все из файла, 1000 для синтетики)")
+    ap.add_argument("--concurrency", type=int, default=50)
+    ap.add_argument("--json", default=None)
+    args = ap.parse_args()
+
+    updates = load_updates(args.file, args.count or (0 if args.file else 1000))
+    headers = {"X-Telegram-Bot-Api-Secret-Token": args.secret} if args.secret else {}
+    statuses, latencies = Counter(), []
+    sem = asyncio.Semaphore(args.concurrency)
+
+    async with aiohttp.ClientSession(headers=headers) as session:
+        async def one(update):
+            async with sem:
+                t0 = time.perf_counter()
+                async with session.post(args.url, json=update) as resp:
+                    await resp.read()
+                    statuses[resp.status] += 1
+                latencies.append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one(u) for u in updates))
+        elapsed = time.perf_counter() - t0
+        async with session.get(URL(args.url).origin().with_path("/healthz")) as resp:
+            health = await resp.json() if resp.content_type == "application/json" else None
+
+    common.report([common.summarize("webhook_replay", latencies, elapsed,
+                                    statuses=dict(statuses), server=health)], args.json)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,118 @@
+# Async-обёртка над db.py: те же имена и результаты, но каждый вызов идёт
+# в отдельный пул потоков размером с пул соединений и не блокирует event loop.
+import os, asyncio, functools
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from . import db
+    from .cache import MISSING
+except ImportError:
+    import db
+    from cache import MISSING
+
+DB_THREADS = int(os.getenv("DB_THREADS", "0"))  # 0 — по размеру пула (db.pool_capacity)
+_executor = None
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=DB_THREADS or db.pool_capacity(), thread_name_prefix="db")
+    return _executor
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+async def run(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), functools.partial(fn, *args, **kwargs))
+
+def _cached(cache, loader):
+    # Попадание в кэш отдаётся сразу, без прыжка в пул потоков
+    async def wrapper(user_id: int):
+        value = cache.get(user_id)
+        if value is MISSING:
+            value = await run(cache.load, user_id, loader)
+        return value
+    return wrapper
+
+async def stats_counts():
+    # свежий кэш stats_counts отдаётся без прыжка в пул потоков
+    cached = db.cached_stats()
+    return cached if cached is not None else await run(db.stats_counts)
+
+def _async(fn):
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        return await run(fn, *args, **kwargs)
+    return wrapper
+
+init_db              = _async(db.init_db)
+dispose_engine       = _async(db.dispose_engine)
+wait_db              = _async(db.wait_db)
+set_user_category    = _async(db.set_user_category)
+get_user_category    = _cached(db.category_cache, db._load_user_category)
+set_user_lang        = _async(db.set_user_lang)
+get_user_lang        = _cached(db.lang_cache, db._load_user_lang)
+is_blocked           = _cached(db.blocked_cache, db._load_is_blocked)
+block_user           = _async(db.block_user)
+unblock_user         = _async(db.unblock_user)
+block_users          = _async(db.block_users)
+unblock_users        = _async(db.unblock_users)
+list_blocked         = _async(db.list_blocked)
+list_users           = _async(db.list_users)
+list_complaints      = _async(db.list_complaints)
+list_blocked_page    = _async(db.list_blocked_page)
+list_users_page      = _async(db.list_users_page)
+list_complaints_page = _async(db.list_complaints_page)
+search_complaints_page = _async(db.search_complaints_page)
+save_search_query    = _async(db.save_search_query)
+get_search_query     = _async(db.get_search_query)
+insert_complaint     = _async(db.insert_complaint)
+submit_complaint     = _async(db.submit_complaint)
+set_file_url         = _async(db.set_file_url)
+get_by_ticket        = _async(db.get_by_ticket)
+get_file_url         = _async(db.get_file_url)
+set_status           = _async(db.set_status)
+set_statuses         = _async(db.set_statuses)
+close_stale          = _async(db.close_stale)
+ticket_authors       = _async(db.ticket_authors)
+drain_status_notices = _async(db.drain_status_notices)
+touch_rate_limit     = _async(db.touch_rate_limit)
+last_submit_time     = _async(db.last_submit_time)
+claim_media_jobs     = _async(db.claim_media_jobs)
+complete_media_job   = _async(db.complete_media_job)
+fail_media_job       = _async(db.fail_media_job)
+media_job_stats      = _async(db.media_job_stats)
+list_media_jobs      = _async(db.list_media_jobs)
+retry_media_jobs     = _async(db.retry_media_jobs)
+media_dedupe_stats   = _async(db.media_dedupe_stats)
+enqueue_outbox       = _async(db.enqueue_outbox)
+claim_outbox         = _async(db.claim_outbox)
+outbox_heartbeat     = _async(db.outbox_heartbeat)
+outbox_leave         = _async(db.outbox_leave)
+complete_outbox      = _async(db.complete_outbox)
+fail_outbox          = _async(db.fail_outbox)
+defer_outbox         = _async(db.defer_outbox)
+pause_outbox_chat    = _async(db.pause_outbox_chat)
+outbox_stats         = _async(db.outbox_stats)
+list_outbox_failed   = _async(db.list_outbox_failed)
+retry_outbox         = _async(db.retry_outbox)
+create_broadcast     = _async(db.create_broadcast)
+running_broadcasts   = _async(db.running_broadcasts)
+feed_broadcast       = _async(db.feed_broadcast)
+finish_broadcast     = _async(db.finish_broadcast)
+cancel_broadcast     = _async(db.cancel_broadcast)
+get_broadcast        = _async(db.get_broadcast)
+list_broadcasts      = _async(db.list_broadcasts)
+reuse_media          = _async(db.reuse_media)
+register_media       = _async(db.register_media)
+stats_range          = _async(db.stats_range)
+data_version         = _async(db.data_version)
+ensure_partitions    = _async(db.ensure_partitions)
+invalidate_stats     = db.invalidate_stats
+cache_stats          = db.cache_stats
+start_cache_listener = db.start_cache_listener
+stop_cache_listener  = db.stop_cache_listener
@@ -0,0 +1,115 @@
+import os, re, asyncio, logging
+
+try:
+    from . import adb
+    from .db import OutboxMessage, LANGS
+    from .outbox import PRIORITY_NOTICE, PRIORITY_BROADCAST
+except ImportError:
+    import adb
+    from db import OutboxMessage, LANGS
+    from outbox import PRIORITY_NOTICE, PRIORITY_BROADCAST
+
+# Рассылки по всем пользователям (/broadcast, POST /api/broadcasts). Запись в
+# broadcasts создаёт команда или админка, BroadcastRunner в процессе бота
+# перекладывает получателей в outbox пачками по BROADCAST_BATCH, держа в
+# очереди не больше BROADCAST_WINDOW строк рассылки: в памяти — одна пачка,
+# в outbox — окно, уведомления о статусе (приоритет выше) не ждут за
+# сотнями тысяч строк. Темп и 429 — на OutboxDispatcher. Чекпоинт
+# (last_user_id) сдвигается в транзакции вставки, так что после падения
+# рассылка продолжается с места остановки. Когда получатели кончились и
+# очередь рассылки пуста — done, автору уходит итог.
+BROADCAST_BATCH    = int(os.getenv("BROADCAST_BATCH", "1000"))
+BROADCAST_WINDOW   = int(os.getenv("BROADCAST_WINDOW", "5000"))
+BROADCAST_POLL_SEC = float(os.getenv("BROADCAST_POLL_SEC", "2"))
+
+log = logging.getLogger("hotline.broadcast")
+
+_LANG_LINE = re.compile(rf"^\s*({'|'.join(LANGS)})\s*:\s?(.*)$")
+
+def parse_texts(body: str) -> dict[str, str]:
+    # "текст" — один на всех; строка "ru: ..." / "uz: ..." начинает текст на
+    # своём языке (дальше — до следующей такой строки). Текст до первой
+    # метки считается русским, если ru не задан отдельно.
+    texts: dict[str, list[str]] = {}
+    cur = None
+    for line in body.splitlines():
+        m = _LANG_LINE.match(line)
+        if m:
+            cur = m[1]
+            texts[cur] = [m[2]]
+        else:
+            texts.setdefault(cur, []).append(line)
+    lead = texts.pop(None, [])
+    if lead and "ru" not in texts:
+        texts["ru"] = lead
+    return {l: "\n".join(lines).strip() for l, lines in texts.items()}
+
+class BroadcastRunner:
+    # render_done(lang, row) -> текст итога для автора; outbox — диспетчер, которого будим после пачки
+    def __init__(self, render_done=None, outbox=None, batch: int = BROADCAST_BATCH,
+                 window: int = BROADCAST_WINDOW, poll_sec: float = BROADCAST_POLL_SEC):
+        self.render_done = render_done
+        self.outbox = outbox
+        self.batch = batch
+        self.window = window
+        self.poll_sec = poll_sec
+        self.queued = 0
+        self._wake = asyncio.Event()
+        self._stopping = False
+        self._task: asyncio.Task | None = None
+
+    def wake(self):
+        self._wake.set()
+
+    async def start(self):
+        self._stopping = False
+        self._task = asyncio.create_task(self._loop(), name="broadcast")
+
+    async def stop(self):
+        self._stopping = True
+        self._wake.set()
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self):
+        while not self._stopping:
+            try:
+                fed = await self.run_once()
+            except Exception:
+                log.exception("broadcast failed")
+                fed = False
+            if not fed:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_sec)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def run_once(self) -> bool:
+        # True — поставлена хотя бы одна пачка, окно может быть ещё не заполнено
+        fed = False
+        for b in await adb.running_broadcasts():
+            room = self.window - (b.queued - b.delivered - b.failed)
+            if room <= 0:
+                continue
+            n = await adb.feed_broadcast(b.id, min(self.batch, room), PRIORITY_BROADCAST)
+            if n:
+                fed = True
+                self.queued += n
+            elif n == 0:
+                await self.finish(b.id)
+        if fed and self.outbox is not None:
+            self.outbox.wake()
+        return fed
+
+    async def finish(self, broadcast_id: int):
+        row = await adb.finish_broadcast(broadcast_id)
+        if row is None:
+            return
+        log.info("broadcast %s done: queued %s, delivered %s, failed %s", row.id, row.queued, row.delivered, row.failed)
+        if row.created_by and self.render_done is not None:
+            await adb.enqueue_outbox([OutboxMessage(row.created_by, "text", {"text": self.render_done(row.lang, row)},
+                                                    PRIORITY_NOTICE)])
+            if self.outbox is not None:
+                self.outbox.wake()
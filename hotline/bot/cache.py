@@ -0,0 +1,70 @@
+import os, time, threading
+from collections import OrderedDict
+
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "50000"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "300"))
+
+MISSING = object()
+
+class TTLCache:
+    # Ограниченный LRU с TTL. Поколение (generation) растёт при каждой
+    # инвалидации: значение, прочитанное из БД до инвалидации, не попадёт
+    # в кэш после неё (см. load).
+    def __init__(self, name: str, maxsize: int = USER_CACHE_SIZE, ttl: float = USER_CACHE_TTL):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._gen = 0
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def get(self, key, default=MISSING):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                value, expires = item
+                if expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, gen: int | None = None):
+        with self._lock:
+            if gen is not None and gen != self._gen:
+                return
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def load(self, key, loader):
+        gen = self._gen
+        value = loader(key)
+        self.set(key, value, gen)
+        return value
+
+    def get_or_load(self, key, loader):
+        value = self.get(key)
+        return self.load(key, loader) if value is MISSING else value
+
+    def invalidate(self, key=MISSING):
+        with self._lock:
+            self._gen += 1
+            self.invalidations += 1
+            if key is MISSING:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data), "hits": self.hits, "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "evictions": self.evictions, "invalidations": self.invalidations,
+        }
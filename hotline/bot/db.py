@@ -1,66 +1,322 @@
-from sqlalchemy import create_engine, text
-from sqlalchemy.exc import OperationalError
-import os, time, datetime
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
+from typing import NamedTuple
+import os, re, json, math, time, uuid, struct, select, base64, hashlib, logging, datetime, threading
+
+try:
+    from .cache import TTLCache
+    from . import metrics
+except ImportError:
+    from cache import TTLCache
+    import metrics
+
+log = logging.getLogger(__name__)
 
 DATABASE_URL = os.getenv("DATABASE_URL")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))     # ожидание свободного соединения, сек
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))  # 0 — без ограничения
 engine = None
+# Переопределения пула для процесса (админка: configure_engine из ADMIN_DB_*)
+engine_options: dict = {}
+
+# Реплики для чтения: DATABASE_REPLICA_URLS — через запятую, пусто — всё идёт
+# на основной. get_engine(readonly=True) отдаёт первую по списку реплику,
+# отставшую не больше DB_REPLICA_MAX_LAG_SEC (первую, а не по кругу: версия
+# data_versions для ETag и сами данные читаются с одной реплики), иначе основной.
+# Отставание проверяет фоновый поток (запускается с первым чтением) раз в
+# DB_REPLICA_CHECK_SEC: реплика, проигравшая WAL основного, отстаёт на 0,
+# иначе — now() реплики минус время последней проигранной транзакции (часы
+# серверов должны совпадать). Между
+# проверками отставание считается выросшим на прошедшее время, так что
+# зависшая проверка или упавшая реплика сами уводят чтения на основной;
+# обрыв соединения с репликой уводит их сразу.
+# Свои записи: после note_write(user_id) чтения этого пользователя (без
+# user_id — все чтения процесса) DB_REPLICA_MAX_LAG_SEC секунд идут на основной,
+# за это время любая допустимая реплика запись уже получила.
+# Соединения с репликой read-only (default_transaction_read_only): запись,
+# по ошибке отправленная туда, падает, а не расходится с основным. Для проверки
+# на одном сервере «репликой» может быть он же под ролью с правом только на
+# SELECT (bench/replica_check.py).
+DATABASE_REPLICA_URLS = [u.strip() for u in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if u.strip()]
+DB_REPLICA_MAX_LAG_SEC = float(os.getenv("DB_REPLICA_MAX_LAG_SEC", "5"))
+DB_REPLICA_CHECK_SEC = float(os.getenv("DB_REPLICA_CHECK_SEC", "1"))
+DB_REPLICA_CONNECT_TIMEOUT = int(os.getenv("DB_REPLICA_CONNECT_TIMEOUT", "2"))
+
+class Replica:
+    def __init__(self, url: str):
+        u = make_url(url)
+        self.name = f"{u.host or 'local'}:{u.port or 5432}/{u.database}"
+        self.engine = _create_engine(url, readonly=True, **engine_options)
+        self.lag: float | None = None  # на момент checked_at; None — недоступна или ещё не проверена
+        self.checked_at = 0.0
+        self.error: str | None = None
+
+        @event.listens_for(self.engine, "handle_error")
+        def _down(ctx):
+            if ctx.is_disconnect:
+                self.lag, self.error = None, str(ctx.original_exception).strip().splitlines()[0]
+
+    def current_lag(self, now: float) -> float | None:
+        return None if self.lag is None else self.lag + (now - self.checked_at)
+
+replicas: list[Replica] | None = None
+_replica_lock = threading.Lock()
+_replica_stop: threading.Event | None = None
+_recent_writes: dict[int | None, float] = {}  # user_id (None — весь процесс) -> monotonic, до которого читать с основного
+_READS = {k: metrics.DB_READS.labels(*k) for k in (("replica", "ok"), ("primary", "recent_write"),
+                                                   ("primary", "lagging"), ("primary", "unavailable"))}
+
+def configure_engine(pool_size: int | None = None, max_overflow: int | None = None,
+                     statement_timeout_ms: int | None = None):
+    # до первого get_engine; None — значение из DB_* окружения
+    global engine_options
+    engine_options = {k: v for k, v in dict(pool_size=pool_size, max_overflow=max_overflow,
+                                            statement_timeout_ms=statement_timeout_ms).items() if v is not None}
 
-def get_engine():
+def pool_capacity() -> int:
+    return engine_options.get("pool_size", DB_POOL_SIZE) + engine_options.get("max_overflow", DB_MAX_OVERFLOW)
+
+def _create_engine(url: str, readonly: bool = False, pool_size: int | None = None, max_overflow: int | None = None,
+                   statement_timeout_ms: int | None = None):
+    # statement_timeout задаётся на всё соединение через libpq options;
+    # миграции и выгрузки снимают его у себя (SET LOCAL statement_timeout = 0)
+    timeout = DB_STATEMENT_TIMEOUT_MS if statement_timeout_ms is None else statement_timeout_ms
+    options = [f"-c statement_timeout={timeout}"] if timeout else []
+    connect_args = {}
+    if readonly:
+        options.append("-c default_transaction_read_only=on")
+        connect_args["connect_timeout"] = DB_REPLICA_CONNECT_TIMEOUT
+    if options:
+        connect_args["options"] = " ".join(options)
+    eng = create_engine(url, pool_pre_ping=True, poolclass=metrics.TimedQueuePool,
+                        pool_size=DB_POOL_SIZE if pool_size is None else pool_size,
+                        max_overflow=DB_MAX_OVERFLOW if max_overflow is None else max_overflow,
+                        pool_timeout=DB_POOL_TIMEOUT, pool_recycle=DB_POOL_RECYCLE,
+                        connect_args=connect_args)
+    # время запросов с меткой функции этого модуля, ожидание пула (metrics.py)
+    metrics.instrument_engine(eng, globals(), primary=not readonly)
+    return eng
+
+def get_engine(readonly: bool = False, user_id: int | None = None):
     global engine
     if engine is None:
-        engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+        engine = _create_engine(DATABASE_URL, **engine_options)
+    if readonly and DATABASE_REPLICA_URLS:
+        return _read_engine(user_id)
     return engine
 
-def init_db():
+def _get_replicas() -> list[Replica]:
+    global replicas, _replica_stop
+    if replicas is None:
+        with _replica_lock:
+            if replicas is None:
+                replicas = [Replica(u) for u in DATABASE_REPLICA_URLS]
+                _replica_stop = threading.Event()
+                threading.Thread(target=_replica_check_loop, args=(replicas, _replica_stop), name="db-replica-check",
+                                 daemon=True).start()
+    return replicas
+
+def _read_engine(user_id: int | None):
+    now = time.monotonic()
+    if _recent_writes.get(user_id, 0.0) > now or _recent_writes.get(None, 0.0) > now:
+        _READS["primary", "recent_write"].inc()
+        return engine
+    lagging = False
+    for r in _get_replicas():
+        lag = r.current_lag(now)
+        if lag is not None and lag <= DB_REPLICA_MAX_LAG_SEC:
+            _READS["replica", "ok"].inc()
+            return r.engine
+        lagging = lagging or lag is not None
+    _READS["primary", "lagging" if lagging else "unavailable"].inc()
+    return engine
+
+def note_write(user_id: int | None = None):
+    if not DATABASE_REPLICA_URLS:
+        return
+    now = time.monotonic()
+    _recent_writes[user_id] = now + DB_REPLICA_MAX_LAG_SEC
+    if len(_recent_writes) > 10_000:
+        with _replica_lock:
+            for k, until in list(_recent_writes.items()):
+                if until <= now:
+                    _recent_writes.pop(k, None)
+
+def check_replicas(items: list[Replica] | None = None) -> list[Replica]:
+    # позиция WAL основного берётся до опроса реплик: «догнала» — значит, есть всё, что было до t0
+    items = _get_replicas() if items is None else items
+    t0 = time.monotonic()
+    with get_engine().connect() as conn:
+        lsn = conn.execute(text("SELECT pg_current_wal_lsn()")).scalar()
+    for r in items:
+        was_down = r.checked_at > 0 and r.lag is None
+        try:
+            with r.engine.connect() as conn:
+                recovery, caught_up, behind = conn.execute(text("""
+                SELECT pg_is_in_recovery(), pg_last_wal_replay_lsn() >= CAST(:lsn AS pg_lsn),
+                       EXTRACT(epoch FROM now() - pg_last_xact_replay_timestamp())
+                """), dict(lsn=lsn)).one()
+            # не в recovery — тот же сервер под другой ролью (или отдельный основной — это ошибка настройки)
+            if not recovery or caught_up:
+                r.lag = 0.0
+            else:
+                r.lag = math.inf if behind is None else max(float(behind), 0.0)
+            r.error = None
+        except SQLAlchemyError as e:
+            r.lag, r.error = None, str(getattr(e, "orig", None) or e).strip().splitlines()[0]
+        if r.lag is None and not was_down:
+            log.warning("replica %s unavailable: %s", r.name, r.error)
+        elif r.lag is not None and was_down:
+            log.info("replica %s is back, lag %.3fs", r.name, r.lag)
+        r.checked_at = t0
+        metrics.DB_REPLICA_LAG.labels(r.name).set(math.nan if r.lag is None else r.lag)
+    return items
+
+def _replica_check_loop(items: list[Replica], stop: threading.Event):
+    while not stop.is_set():
+        try:
+            check_replicas(items)
+        except Exception:
+            log.exception("replica check failed")
+        stop.wait(DB_REPLICA_CHECK_SEC)
+
+def dispose_engine():
+    global engine, replicas
+    with _replica_lock:
+        if _replica_stop is not None:
+            _replica_stop.set()
+        for r in replicas or ():
+            r.engine.dispose()
+        replicas = None
+    if engine is not None:
+        engine.dispose()
+        engine = None
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+MIGRATION_RE = re.compile(r"^(\d{4})_([\w-]+)\.sql$")
+MIGRATION_LOCK_ID = 740_001  # pg_advisory_xact_lock: бот и админка не мигрируют одновременно
+
+def list_migrations():
+    out = []
+    for name in sorted(os.listdir(MIGRATIONS_DIR)):
+        m = MIGRATION_RE.match(name)
+        if m:
+            out.append((int(m.group(1)), m.group(2), os.path.join(MIGRATIONS_DIR, name)))
+    return out
+
+def applied_versions(conn) -> set[int]:
+    return {r[0] for r in conn.execute(text("SELECT version FROM schema_version"))}
+
+def migrate(target: int | None = None) -> list[int]:
     eng = get_engine()
+    done = []
     with eng.begin() as conn:
+        conn.execute(text("SELECT pg_advisory_xact_lock(:k)"), dict(k=MIGRATION_LOCK_ID))
         conn.execute(text("""
-        CREATE TABLE IF NOT EXISTS complaints(
-            id BIGSERIAL PRIMARY KEY,
-            ticket_no TEXT,
-            user_id BIGINT,
-            username TEXT,
-            full_name TEXT,
-            category TEXT CHECK (category in ('complaint','suggestion')) DEFAULT 'complaint',
-            message_text TEXT,
-            file_type TEXT,
-            file_id TEXT,
-            file_url TEXT,
-            status TEXT DEFAULT 'new',
-            created_at TIMESTAMP DEFAULT NOW()
-        );
-        """))
-        conn.execute(text("ALTER TABLE complaints ADD COLUMN IF NOT EXISTS file_url TEXT"))
-        conn.execute(text("ALTER TABLE complaints ADD COLUMN IF NOT EXISTS status TEXT DEFAULT 'new'"))
-        conn.execute(text("ALTER TABLE complaints ADD COLUMN IF NOT EXISTS ticket_no TEXT"))
-        conn.execute(text("""
-        CREATE TABLE IF NOT EXISTS user_state(
-            user_id BIGINT PRIMARY KEY,
-            category TEXT CHECK (category in ('complaint','suggestion')) DEFAULT 'complaint',
-            updated_at TIMESTAMP DEFAULT NOW()
-        );
-        """))
-        conn.execute(text("""
-        CREATE TABLE IF NOT EXISTS user_profile(
-            user_id BIGINT PRIMARY KEY,
-            lang TEXT CHECK (lang in ('ru','uz')) DEFAULT 'ru',
-            created_at TIMESTAMP DEFAULT NOW(),
-            updated_at TIMESTAMP DEFAULT NOW()
-        );
-        """))
-        conn.execute(text("""
-        CREATE TABLE IF NOT EXISTS blocked_users(
-            user_id BIGINT PRIMARY KEY,
-            reason TEXT,
-            blocked_at TIMESTAMP DEFAULT NOW()
-        );
-        """))
-        conn.execute(text("""
-        CREATE TABLE IF NOT EXISTS rate_limiter(
-            user_id BIGINT PRIMARY KEY,
-            last_submit_at TIMESTAMP
+        CREATE TABLE IF NOT EXISTS schema_version(
+            version INT PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT NOW()
         );
         """))
+    for version, name, path in list_migrations():
+        if target is not None and version > target:
+            break
+        with eng.begin() as conn:
+            conn.execute(text("SELECT pg_advisory_xact_lock(:k)"), dict(k=MIGRATION_LOCK_ID))
+            if version in applied_versions(conn):
+                continue
+            conn.execute(text("SET LOCAL statement_timeout = 0"))
+            with open(path, encoding="utf-8") as f:
+                sql = f.read()
+            conn.exec_driver_sql(sql, execution_options={"no_parameters": True})
+            conn.execute(text("INSERT INTO schema_version(version, name) VALUES (:v, :n)"),
+                         dict(v=version, n=name))
+            done.append(version)
+    return done
+
+def init_db():
+    migrate()
+    ensure_partitions()
+
+# ===== Hot caches: language, category, block status =====
+# Значения меняются редко, а читаются на каждом апдейте. Запись через db.py
+# обновляет кэш сразу (write-through) и рассылает NOTIFY, чтобы остальные
+# процессы (второй бот, админка) сбросили у себя ключ без ожидания TTL.
+CACHE_CHANNEL = "hotline_cache"
+CACHE_ORIGIN = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+lang_cache = TTLCache("lang")
+category_cache = TTLCache("category")
+blocked_cache = TTLCache("blocked")
+CACHES = {"lang": lang_cache, "category": category_cache, "blocked": blocked_cache}
+
+def _notify_cache(conn, kind: str, user_id: int):
+    conn.execute(text("SELECT pg_notify(:ch, :payload)"),
+                 dict(ch=CACHE_CHANNEL, payload=f"{kind}:{user_id}:{CACHE_ORIGIN}"))
+
+def _write_through(kind: str, user_id: int, value):
+    c = CACHES[kind]
+    c.invalidate(user_id)
+    c.set(user_id, value)
+
+def cache_stats() -> dict:
+    return {name: c.stats() for name, c in CACHES.items()}
+
+def handle_cache_notify(payload: str):
+    try:
+        kind, uid, origin = payload.split(":", 2)
+        uid = int(uid)
+    except ValueError:
+        return
+    if origin != CACHE_ORIGIN and kind in CACHES:
+        CACHES[kind].invalidate(uid)
+
+def _listen_loop(stop: threading.Event):
+    while not stop.is_set():
+        raw = None
+        try:
+            raw = get_engine().raw_connection()
+            dbapi = raw.driver_connection
+            raw.detach()  # отдельное соединение на весь срок жизни, не из пула
+            dbapi.autocommit = True
+            dbapi.cursor().execute(f"LISTEN {CACHE_CHANNEL}")
+            # пока не слушали, уведомления могли потеряться — начинаем с чистого кэша
+            for c in CACHES.values():
+                c.invalidate()
+            while not stop.is_set():
+                if select.select([dbapi], [], [], 5.0)[0]:
+                    dbapi.poll()
+                    while dbapi.notifies:
+                        handle_cache_notify(dbapi.notifies.pop(0).payload)
+        except Exception:
+            log.exception("cache listener failed, reconnecting")
+            stop.wait(2.0)
+        finally:
+            if raw is not None:
+                try: raw.close()
+                except Exception: pass
+
+_listener = None
+
+def start_cache_listener():
+    global _listener
+    if _listener is None:
+        stop = threading.Event()
+        t = threading.Thread(target=_listen_loop, args=(stop,), name="cache-listener", daemon=True)
+        t.start()
+        _listener = (t, stop)
+    return _listener
+
+def stop_cache_listener():
+    global _listener
+    if _listener is not None:
+        _listener[1].set()
+        _listener = None
 
 def set_user_category(user_id: int, category: str):
     eng = get_engine()
@@ -70,14 +326,19 @@ def set_user_category(user_id: int, category: str):
         VALUES (:uid, :cat)
         ON CONFLICT (user_id) DO UPDATE SET category = EXCLUDED.category, updated_at = NOW()
         """), dict(uid=user_id, cat=category))
+        _notify_cache(conn, "category", user_id)
+    _write_through("category", user_id, category)
 
-def get_user_category(user_id: int):
+def _load_user_category(user_id: int):
     eng = get_engine()
     with eng.connect() as conn:
         row = conn.execute(text("SELECT category FROM user_state WHERE user_id = :uid"),
                            dict(uid=user_id)).fetchone()
         return row[0] if row else None
 
+def get_user_category(user_id: int):
+    return category_cache.get_or_load(user_id, _load_user_category)
+
 def set_user_lang(user_id: int, lang: str):
     eng = get_engine()
     with eng.begin() as conn:
@@ -86,105 +347,484 @@ def set_user_lang(user_id: int, lang: str):
         VALUES (:uid, :lang)
         ON CONFLICT (user_id) DO UPDATE SET lang = EXCLUDED.lang, updated_at = NOW()
         """), dict(uid=user_id, lang=lang))
+        _notify_cache(conn, "lang", user_id)
+    _write_through("lang", user_id, lang)
 
-def get_user_lang(user_id: int):
+def _load_user_lang(user_id: int):
     eng = get_engine()
     with eng.connect() as conn:
         row = conn.execute(text("SELECT lang FROM user_profile WHERE user_id = :uid"),
                            dict(uid=user_id)).fetchone()
         return row[0] if row else None
 
-def is_blocked(user_id: int) -> bool:
+def get_user_lang(user_id: int):
+    return lang_cache.get_or_load(user_id, _load_user_lang)
+
+def _load_is_blocked(user_id: int) -> bool:
     eng = get_engine()
     with eng.connect() as conn:
         row = conn.execute(text("SELECT 1 FROM blocked_users WHERE user_id = :uid"),
                            dict(uid=user_id)).fetchone()
         return bool(row)
 
+def is_blocked(user_id: int) -> bool:
+    return blocked_cache.get_or_load(user_id, _load_is_blocked)
+
 def block_user(user_id: int, reason: str = None):
+    block_users([user_id], reason)
+
+def unblock_user(user_id: int):
+    unblock_users([user_id])
+
+# Массовые блокировки: один оператор на весь список и один pg_notify на
+# пользователя в том же запросе. Возвращают число реально изменённых строк.
+def _notify_cache_many(conn, kind: str, user_ids: list[int]):
+    conn.execute(text("""
+    SELECT pg_notify(:ch, :kind || ':' || u || ':' || :origin) FROM unnest(CAST(:uids AS bigint[])) u
+    """), dict(ch=CACHE_CHANNEL, kind=kind, origin=CACHE_ORIGIN, uids=user_ids))
+
+def block_users(user_ids: list[int], reason: str = None) -> int:
+    user_ids = sorted(set(user_ids))
+    if not user_ids:
+        return 0
     eng = get_engine()
     with eng.begin() as conn:
-        conn.execute(text("""
-        INSERT INTO blocked_users(user_id, reason) VALUES (:uid, :reason)
+        n = conn.execute(text("""
+        INSERT INTO blocked_users(user_id, reason) SELECT u, :reason FROM unnest(CAST(:uids AS bigint[])) u
         ON CONFLICT (user_id) DO NOTHING
-        """), dict(uid=user_id, reason=reason))
+        """), dict(uids=user_ids, reason=reason)).rowcount
+        _notify_cache_many(conn, "blocked", user_ids)
+    for uid in user_ids:
+        _write_through("blocked", uid, True)
+    note_write()
+    return n
 
-def unblock_user(user_id: int):
+def unblock_users(user_ids: list[int]) -> int:
+    user_ids = sorted(set(user_ids))
+    if not user_ids:
+        return 0
     eng = get_engine()
     with eng.begin() as conn:
-        conn.execute(text("DELETE FROM blocked_users WHERE user_id = :uid"),
-                     dict(uid=user_id))
+        n = conn.execute(text("DELETE FROM blocked_users WHERE user_id = ANY(:uids)"),
+                         dict(uids=user_ids)).rowcount
+        _notify_cache_many(conn, "blocked", user_ids)
+    for uid in user_ids:
+        _write_through("blocked", uid, False)
+    note_write()
+    return n
 
-def list_blocked(limit: int = 50, offset: int = 0):
-    eng = get_engine()
+# ===== Keyset pagination =====
+# Курсор — непрозрачный токен из (timestamp, id) последней/первой строки
+# страницы. Страница N+1 читается по индексу от курсора, без OFFSET.
+EPOCH = datetime.datetime(1970, 1, 1)
+
+class Page(NamedTuple):
+    rows: list
+    next: str | None = None   # курсор для after=
+    prev: str | None = None   # курсор для before=
+    truncated: bool = False   # поиск: совпадений больше SEARCH_WINDOW, старые не показаны
+
+def encode_cursor(ts: datetime.datetime, row_id: int) -> str:
+    micros = (ts - EPOCH) // datetime.timedelta(microseconds=1)
+    raw = f"{micros:x}.{int(row_id):x}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(token: str) -> tuple[datetime.datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+        micros, row_id = raw.split(".", 1)
+        return EPOCH + datetime.timedelta(microseconds=int(micros, 16)), int(row_id, 16)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("bad cursor")
+
+# Курсор поиска — (rank, id); rank хранится как точные 4 байта real, чтобы
+# сравнение с пересчитанным ts_rank на следующей странице было точным
+def encode_rank_cursor(rank: float, row_id: int) -> str:
+    raw = f"{struct.pack('>f', rank).hex()}.{int(row_id):x}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_rank_cursor(token: str) -> tuple[float, int]:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+        rank, row_id = raw.split(".", 1)
+        return struct.unpack(">f", bytes.fromhex(rank))[0], int(row_id, 16)
+    except (ValueError, UnicodeDecodeError, struct.error):
+        raise ValueError("bad cursor")
+
+def _keyset(cond: list, params: dict, after, before, ts_col: str, id_col: str, decode=decode_cursor) -> str:
+    if after:
+        params["c_ts"], params["c_id"] = decode(after)
+        cond.append(f"({ts_col}, {id_col}) < (:c_ts, :c_id)")
+    elif before:
+        params["c_ts"], params["c_id"] = decode(before)
+        cond.append(f"({ts_col}, {id_col}) > (:c_ts, :c_id)")
+        return f"{ts_col} ASC, {id_col} ASC"
+    return f"{ts_col} DESC, {id_col} DESC"
+
+def _make_page(rows, limit, key, after=None, before=None, offset=0, encode=encode_cursor) -> Page:
+    # rows запрошены с limit+1: лишняя строка значит, что дальше есть ещё
+    rows = list(rows)
+    has_more = len(rows) > limit
+    if has_more:
+        rows = rows[1:] if before else rows[:limit]
+    if not rows:
+        return Page(rows)
+    nxt = encode(*key(rows[-1])) if (has_more or before) else None
+    prv = encode(*key(rows[0])) if (has_more if before else (after or offset)) else None
+    return Page(rows, nxt, prv)
+
+def list_blocked(limit: int = 50, offset: int = 0, after: str | None = None, before: str | None = None):
+    eng = get_engine(readonly=True)
     with eng.connect() as conn:
-        return conn.execute(text("""
+        cond, params = [], {"lim": limit, "off": 0 if (after or before) else offset}
+        order = _keyset(cond, params, after, before, "blocked_at", "user_id")
+        rows = conn.execute(text(f"""
         SELECT user_id, reason, blocked_at
         FROM blocked_users
-        ORDER BY blocked_at DESC
+        {"WHERE " + " AND ".join(cond) if cond else ""}
+        ORDER BY {order}
+        LIMIT :lim OFFSET :off
+        """), params).fetchall()
+        return rows[::-1] if before else rows
+
+def list_blocked_page(limit: int = 50, offset: int = 0, after: str | None = None, before: str | None = None) -> Page:
+    rows = list_blocked(limit + 1, offset, after, before)
+    return _make_page(rows, limit, lambda r: (r[2], r[0]), after, before, offset)
+
+def list_users(limit: int = 50, offset: int = 0, after: str | None = None, before: str | None = None):
+    eng = get_engine(readonly=True)
+    with eng.connect() as conn:
+        cond, params = [], {"lim": limit, "off": 0 if (after or before) else offset}
+        order = _keyset(cond, params, after, before, "last_activity", "user_id")
+        rows = conn.execute(text(f"""
+        SELECT user_id, username, full_name, last_activity, total_messages
+        FROM user_summary
+        {"WHERE " + " AND ".join(cond) if cond else ""}
+        ORDER BY {order}
         LIMIT :lim OFFSET :off
-        """), dict(lim=limit, off=offset)).fetchall()
+        """), params).fetchall()
+        return rows[::-1] if before else rows
+
+def list_users_page(limit: int = 50, offset: int = 0, after: str | None = None, before: str | None = None) -> Page:
+    rows = list_users(limit + 1, offset, after, before)
+    return _make_page(rows, limit, lambda r: (r[3], r[0]), after, before, offset)
 
-def list_users(limit: int = 50, offset: int = 0):
+def check_user_summary(limit: int = 100):
+    # Сверка user_summary с complaints: строки, где агрегат разошёлся с фактом
     eng = get_engine()
     with eng.connect() as conn:
         return conn.execute(text("""
-        SELECT user_id,
-               max(username) as username,
-               max(full_name) as full_name,
-               max(created_at) as last_activity,
-               COUNT(*) as total_messages
-        FROM complaints
-        GROUP BY user_id
-        ORDER BY last_activity DESC
-        LIMIT :lim OFFSET :off
-        """), dict(lim=limit, off=offset)).fetchall()
+        WITH fact AS (
+            SELECT user_id, COALESCE(max(created_at), 'epoch') AS last_activity, COUNT(*) AS total,
+                   COUNT(*) FILTER (WHERE category = 'complaint') AS complaints,
+                   COUNT(*) FILTER (WHERE category = 'suggestion') AS suggestions
+            FROM complaints WHERE user_id IS NOT NULL
+            GROUP BY user_id
+        )
+        SELECT COALESCE(f.user_id, s.user_id) AS user_id,
+               f.total AS expected_total, s.total_messages AS actual_total,
+               f.last_activity AS expected_last, s.last_activity AS actual_last
+        FROM fact f
+        FULL OUTER JOIN user_summary s ON s.user_id = f.user_id
+        WHERE f.user_id IS NULL OR s.user_id IS NULL
+           OR f.total <> s.total_messages
+           OR f.complaints <> s.complaints_count
+           OR f.suggestions <> s.suggestions_count
+           OR f.last_activity IS DISTINCT FROM s.last_activity
+        ORDER BY 1
+        LIMIT :lim
+        """), dict(lim=limit)).fetchall()
 
-def list_complaints(category: str | None, limit: int = 30, offset: int = 0, by_user: int | None = None):
+def rebuild_user_summary() -> int:
     eng = get_engine()
+    with eng.begin() as conn:
+        return conn.execute(text("SELECT hotline_rebuild_user_summary()")).scalar()
+
+def list_complaints(category: str | None, limit: int = 30, offset: int = 0, by_user: int | None = None,
+                    after: str | None = None, before: str | None = None):
+    # свои обращения (/my) сразу после отправки — с основного (note_write в submit_complaint)
+    eng = get_engine(readonly=True, user_id=by_user)
     with eng.connect() as conn:
         base = """
         SELECT id, ticket_no, user_id, username, full_name, category, message_text, file_type, status, created_at
         FROM complaints
         """
         where = []
-        params = {"lim": limit, "off": offset}
+        params = {"lim": limit, "off": 0 if (after or before) else offset}
         if category in ("complaint", "suggestion"):
             where.append("category = :cat"); params["cat"] = category
         if by_user:
             where.append("user_id = :uid"); params["uid"] = by_user
+        order = _keyset(where, params, after, before, "created_at", "id")
         if where: base += " WHERE " + " AND ".join(where)
-        base += " ORDER BY created_at DESC LIMIT :lim OFFSET :off"
-        return conn.execute(text(base), params).fetchall()
+        base += f" ORDER BY {order} LIMIT :lim OFFSET :off"
+        rows = conn.execute(text(base), params).fetchall()
+        return rows[::-1] if before else rows
+
+def list_complaints_page(category: str | None, limit: int = 30, offset: int = 0, by_user: int | None = None,
+                         after: str | None = None, before: str | None = None) -> Page:
+    rows = list_complaints(category, limit + 1, offset, by_user, after, before)
+    return _make_page(rows, limit, lambda r: (r[9], r[0]), after, before, offset)
+
+# ===== Search =====
+# Поиск по message_text (миграция 0011): совпадение по search_tsv (GIN),
+# при наличии pg_trgm — ещё и нечёткое по word_similarity (опечатки).
+# Ранжируются только SEARCH_WINDOW самых свежих совпадений: частое слово
+# совпадает с большой долей таблицы, и ts_rank по всем совпадениям стоил бы
+# секунды. Окно берётся либо обратным проходом по complaints_created_idx с
+# фильтром (частые слова), либо из GIN с сортировкой (редкие) — выбирает планировщик.
+# Строки как у list_complaints плюс rank последним. Берётся на одно совпадение
+# больше окна: если оно нашлось, более старые совпадения отброшены, и
+# search_complaints_page отдаёт Page.truncated — админке и боту есть что сказать
+# вместо молчаливого «конца выдачи».
+SEARCH_WINDOW = int(os.getenv("SEARCH_WINDOW", "1000"))
+SEARCH_MAX_LEN = 200
+SEARCH_FUZZY_MIN_LEN = 3  # короче триграммы не работают
+_trgm = None
+
+def has_trgm(conn) -> bool:
+    global _trgm
+    if _trgm is None:
+        _trgm = bool(conn.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).scalar())
+    return _trgm
+
+def search_complaints(q: str, category: str | None = None, limit: int = 30,
+                      after: str | None = None, before: str | None = None):
+    return _search(q, category, limit, after, before)[0]
+
+def _search(q: str, category: str | None, limit: int, after: str | None, before: str | None) -> tuple[list, bool]:
+    # -> (строки, окно обрезало совпадения)
+    q = (q or "").strip()[:SEARCH_MAX_LEN]
+    if not q:
+        return [], False
+    eng = get_engine(readonly=True)
+    with eng.connect() as conn:
+        fuzzy = len(q) >= SEARCH_FUZZY_MIN_LEN and has_trgm(conn)
+        match = "c.search_tsv @@ s.tsq" + (" OR :q <% c.message_text" if fuzzy else "")
+        rank = "ts_rank_cd(c.search_tsv, s.tsq, 32)" + (" + word_similarity(:q, c.message_text)" if fuzzy else "")
+        inner, outer, params = [f"({match})"], ["rn <= :window"], {"q": q, "lim": limit, "window": SEARCH_WINDOW}
+        if category in ("complaint", "suggestion"):
+            inner.append("c.category = :cat"); params["cat"] = category
+        order = _keyset(outer, params, after, before, "rank", "id", decode_rank_cursor)
+        # tsquery — подзапрос, а не CTE: так планировщик видит значение и оценивает селективность по статистике
+        tsq = "(SELECT websearch_to_tsquery('russian', :q) || websearch_to_tsquery('simple', :q) AS tsq) s"
+        rows = conn.execute(text(f"""
+        SELECT id, ticket_no, user_id, username, full_name, category, message_text, file_type, status, created_at,
+               rank, truncated
+        FROM (
+            SELECT c.id, c.ticket_no, c.user_id, c.username, c.full_name, c.category, c.message_text,
+                   c.file_type, c.status, c.created_at, CAST({rank} AS real) AS rank,
+                   row_number() OVER (ORDER BY c.created_at DESC, c.id DESC) AS rn,
+                   count(*) OVER () > :window AS truncated
+            FROM (
+                SELECT c.* FROM complaints c, {tsq}
+                WHERE {" AND ".join(inner)}
+                ORDER BY c.created_at DESC, c.id DESC
+                LIMIT :window + 1
+            ) c, {tsq}
+        ) r
+        WHERE {" AND ".join(outer)}
+        ORDER BY {order}
+        LIMIT :lim
+        """), params).fetchall()
+        truncated = bool(rows) and rows[0].truncated
+        rows = [r[:-1] for r in rows]
+        return (rows[::-1] if before else rows), truncated
+
+def search_complaints_page(q: str, category: str | None = None, limit: int = 30,
+                           after: str | None = None, before: str | None = None) -> Page:
+    rows, truncated = _search(q, category, limit + 1, after, before)
+    pg = _make_page(rows, limit, lambda r: (r[10], r[0]), after, before, encode=encode_rank_cursor)
+    return pg._replace(truncated=truncated)
+
+# Ключ для кнопок листания /search (миграция 0018). Читается с основного:
+# кнопку могут нажать сразу, реплика могла ещё не получить запись.
+SEARCH_KEEP_DAYS = int(os.getenv("SEARCH_KEEP_DAYS", "30"))
+
+def save_search_query(q: str) -> str:
+    key = hashlib.blake2s(q.encode(), digest_size=8).hexdigest()
+    eng = get_engine()
+    with eng.begin() as conn:
+        conn.execute(text("""
+        INSERT INTO search_queries(key, query) VALUES (:k, :q)
+        ON CONFLICT (key) DO UPDATE SET query = EXCLUDED.query, used_at = NOW()
+        """), dict(k=key, q=q))
+        conn.execute(text("DELETE FROM search_queries WHERE used_at < NOW() - make_interval(days => :d)"),
+                     dict(d=SEARCH_KEEP_DAYS))
+    return key
+
+def get_search_query(key: str) -> str | None:
+    eng = get_engine()
+    with eng.connect() as conn:
+        return conn.execute(text("SELECT query FROM search_queries WHERE key = :k"), dict(k=key)).scalar()
+
+# Номер заявки начинается с года (hotline_next_ticket), complaints секционирована
+# по created_at (0016): условие по году номера отсекает секции других лет.
+# Сутки запаса с каждой стороны: год номера считается в UTC, created_at — по часам БД.
+TICKET_YEAR_RE = re.compile(r"^(2\d{3})-\d+$")
+
+def _ticket_range(ticket_nos) -> str:
+    years = set()
+    for t in ticket_nos:
+        m = TICKET_YEAR_RE.match(t or "")
+        if not m:
+            return ""  # номер не по схеме (импорт, тесты) — без отсечения
+        years.add(int(m[1]))
+    if not years:
+        return ""
+    lo = datetime.date(min(years), 1, 1) - datetime.timedelta(days=1)
+    hi = datetime.date(max(years) + 1, 1, 1) + datetime.timedelta(days=1)
+    return f" AND created_at >= '{lo}' AND created_at < '{hi}'"
 
 def next_ticket_no(conn) -> str:
     year = datetime.datetime.utcnow().year
-    seq = conn.execute(text("SELECT COALESCE(MAX(id),0)+1 FROM complaints")).scalar()
-    return f"{year}-{int(seq):06d}"
+    return conn.execute(text("SELECT hotline_next_ticket(:y)"), dict(y=year)).scalar()
 
-def insert_complaint(user_id, username, full_name, category, message_text, file_type, file_id, file_url=None):
+def insert_complaint(user_id, username, full_name, category, message_text, file_type, file_id, file_url=None,
+                     file_unique_id=None):
     eng = get_engine()
     with eng.begin() as conn:
         ticket = next_ticket_no(conn)
         conn.execute(text("""
-            INSERT INTO complaints(ticket_no, user_id, username, full_name, category, message_text, file_type, file_id, file_url)
-            VALUES (:ticket, :uid, :uname, :fname, :cat, :text, :ftype, :fid, :furl)
-        """), dict(ticket=ticket, uid=user_id, uname=username, fname=full_name,
-                   cat=category, text=message_text, ftype=file_type, fid=file_id, furl=file_url))
-        return ticket
+            INSERT INTO complaints(ticket_no, user_id, username, full_name, category, message_text,
+                                   file_type, file_id, file_unique_id, file_url)
+            VALUES (:ticket, :uid, :uname, :fname, :cat, :text, :ftype, :fid, :fuid, :furl)
+        """), dict(ticket=ticket, uid=user_id, uname=username, fname=full_name, cat=category,
+                   text=message_text, ftype=file_type, fid=file_id, fuid=file_unique_id, furl=file_url))
+    invalidate_stats()
+    note_write(user_id)
+    return ticket
+
+class SubmitResult(NamedTuple):
+    outcome: str                 # saved | blocked | no_category | rate_limited
+    ticket: str | None = None
+    category: str | None = None
+    wait_sec: int | None = None
+
+def submit_complaint(user_id, username, full_name, message_text, file_type=None, file_id=None,
+                     file_url=None, rate_limit_seconds: int = 0, file_unique_id=None) -> SubmitResult:
+    eng = get_engine()
+    with eng.begin() as conn:
+        row = conn.execute(text("""
+            SELECT outcome, ticket, category, wait_sec
+            FROM hotline_submit(:uid, :uname, :fname, :text, :ftype, :fid, :furl, :rate, :fuid)
+        """), dict(uid=user_id, uname=username, fname=full_name, text=message_text, ftype=file_type,
+                   fid=file_id, furl=file_url, rate=rate_limit_seconds, fuid=file_unique_id)).one()
+    if row.outcome == "saved":
+        invalidate_stats()
+        note_write(user_id)
+    return SubmitResult(*row)
+
+def set_file_url(ticket_no: str, file_url: str):
+    eng = get_engine()
+    with eng.begin() as conn:
+        conn.execute(text("UPDATE complaints SET file_url = :url WHERE ticket_no = :t" + _ticket_range([ticket_no])),
+                     dict(url=file_url, t=ticket_no))
+
+def get_file_url(ticket_no: str) -> str | None:
+    eng = get_engine()
+    with eng.connect() as conn:
+        return conn.execute(text("SELECT file_url FROM complaint_files WHERE ticket_no = :t" + _ticket_range([ticket_no])),
+                            dict(t=ticket_no)).scalar()
 
 def get_by_ticket(ticket_no: str):
+    sql = text("""
+    SELECT id, ticket_no, user_id, status FROM complaints WHERE ticket_no = :t
+    """ + _ticket_range([ticket_no]))
+    eng = get_engine(readonly=True)
+    with eng.connect() as conn:
+        row = conn.execute(sql, dict(t=ticket_no)).fetchone()
+    if row is None and eng is not get_engine():
+        # заявка могла появиться только что и не дойти до реплики
+        with get_engine().connect() as conn:
+            row = conn.execute(sql, dict(t=ticket_no)).fetchone()
+    return row
+
+def set_status(ticket_no: str, status: str, notify: bool = True) -> bool:
+    return bool(set_statuses([ticket_no], status, notify))
+
+# ----- массовая смена статуса -----
+# Один оператор на список заявок; заявки, где статус уже такой, не трогаются.
+# notify — уведомления авторам пишутся в status_notices в том же операторе
+# (миграция 0013) и уходят из бота пачкой, см. notify.py.
+BULK_BATCH = int(os.getenv("BULK_BATCH", "5000"))
+
+_SET_STATUS_SQL = """
+WITH upd AS (
+    UPDATE complaints SET status = :st
+    WHERE {cond} AND status IS DISTINCT FROM :st
+    RETURNING ticket_no, user_id
+), notices AS (
+    INSERT INTO status_notices(user_id, ticket_no, status)
+    SELECT user_id, ticket_no, :st FROM upd WHERE :notify AND user_id IS NOT NULL
+)
+SELECT ticket_no FROM upd
+"""
+
+def set_statuses(ticket_nos: list[str], status: str, notify: bool = True) -> list[str]:
+    # -> номера заявок, у которых статус действительно изменился
+    ticket_nos = sorted(set(ticket_nos))
+    if not ticket_nos:
+        return []
+    eng = get_engine()
+    with eng.begin() as conn:
+        rows = conn.execute(text(_SET_STATUS_SQL.format(cond="ticket_no = ANY(:tickets)" + _ticket_range(ticket_nos))),
+                            dict(st=status, tickets=ticket_nos, notify=notify)).fetchall()
+    invalidate_stats()
+    note_write()
+    return [r[0] for r in rows]
+
+def close_stale(before: datetime.datetime, category: str | None = None, status: str = "done",
+                notify: bool = True, batch: int = BULK_BATCH) -> int:
+    # "закрыть всё старше X": пачками по batch строк в отдельных транзакциях,
+    # чтобы не держать блокировки на сотнях тысяч строк и не раздувать одну транзакцию
+    # created_at < :before и снаружи: UPDATE не заходит в секции новее границы
+    cond = "created_at < :before AND (id, created_at) IN (SELECT id, created_at FROM complaints " \
+           "WHERE created_at < :before AND status IS DISTINCT FROM :st"
+    params = dict(st=status, before=before, notify=notify, n=batch)
+    if category in ("complaint", "suggestion"):
+        cond += " AND category = :cat"; params["cat"] = category
+    cond += " ORDER BY created_at, id LIMIT :n FOR UPDATE SKIP LOCKED)"
+    sql = text(_SET_STATUS_SQL.format(cond=cond))
+    eng = get_engine()
+    total = 0
+    while True:
+        with eng.begin() as conn:
+            n = len(conn.execute(sql, params).fetchall())
+        total += n
+        if n < batch:
+            break
+    invalidate_stats()
+    note_write()
+    return total
+
+def ticket_authors(ticket_nos: list[str]) -> list[int]:
     eng = get_engine()
     with eng.connect() as conn:
-        return conn.execute(text("""
-        SELECT id, ticket_no, user_id, status FROM complaints WHERE ticket_no = :t
-        """), dict(t=ticket_no)).fetchone()
+        return [r[0] for r in conn.execute(text("""
+        SELECT DISTINCT user_id FROM complaints WHERE ticket_no = ANY(:tickets) AND user_id IS NOT NULL
+        """ + _ticket_range(ticket_nos)), dict(tickets=list(ticket_nos)))]
 
-def set_status(ticket_no: str, status: str):
+# Очередь status_notices переносится в outbox: build(rows) превращает пачку
+# (user_id, ticket_no, status, lang) в сообщения, удаление и вставка — в одной
+# транзакции, так что уведомление не теряется при падении бота.
+def drain_status_notices(build, limit: int = 500) -> int:
     eng = get_engine()
     with eng.begin() as conn:
-        conn.execute(text("UPDATE complaints SET status = :st WHERE ticket_no = :t"),
-                     dict(st=status, t=ticket_no))
+        rows = conn.execute(text("""
+        WITH claimed AS (
+            DELETE FROM status_notices WHERE id IN (
+                SELECT id FROM status_notices ORDER BY id LIMIT :n FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id, user_id, ticket_no, status
+        )
+        SELECT c.user_id, c.ticket_no, c.status, p.lang
+        FROM claimed c LEFT JOIN user_profile p USING (user_id)
+        ORDER BY c.id
+        """), dict(n=limit)).fetchall()
+        if rows:
+            _enqueue_outbox(conn, build(rows))
+        return len(rows)
 
 def touch_rate_limit(user_id: int, now_ts: datetime.datetime):
     eng = get_engine()
@@ -202,17 +842,565 @@ def last_submit_time(user_id: int):
                            dict(uid=user_id)).fetchone()
         return row[0] if row else None
 
+# ===== Media jobs =====
+# Очередь загрузки вложений (media_jobs, см. миграцию 0009 и media.py).
+# Воркеры забирают задания через FOR UPDATE SKIP LOCKED; задание в статусе
+# running дольше lease_sec считается брошенным и забирается снова.
+MEDIA_JOB_COLS = "id, ticket_no, user_id, file_type, file_id, file_unique_id, attempts, created_at"
+
+def claim_media_jobs(worker: str, limit: int = 10, lease_sec: int = 300):
+    eng = get_engine()
+    with eng.begin() as conn:
+        return conn.execute(text(f"""
+        UPDATE media_jobs j SET status = 'running', attempts = j.attempts + 1,
+               locked_by = :w, locked_at = NOW(), updated_at = NOW()
+        WHERE j.id IN (
+            SELECT id FROM media_jobs
+            WHERE status IN ('pending','running') AND run_after <= NOW()
+              AND (status = 'pending' OR locked_at < NOW() - make_interval(secs => :lease))
+            ORDER BY run_after, id
+            LIMIT :n
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING {MEDIA_JOB_COLS}
+        """), dict(w=worker, n=limit, lease=lease_sec)).fetchall()
+
+def complete_media_job(job_id: int, ticket_no: str, media_id: int, file_url: str):
+    eng = get_engine()
+    with eng.begin() as conn:
+        conn.execute(text("""
+        UPDATE media_jobs SET status = 'done', media_id = :mid, file_url = :url, last_error = NULL,
+               locked_by = NULL, updated_at = NOW()
+        WHERE id = :id
+        """), dict(id=job_id, mid=media_id, url=file_url))
+        conn.execute(text("UPDATE complaints SET media_id = :mid WHERE ticket_no = :t" + _ticket_range([ticket_no])),
+                     dict(mid=media_id, t=ticket_no))
+
+def fail_media_job(job_id: int, error: str, retry_in: float | None):
+    # retry_in=None — попытки исчерпаны или ошибка неисправима: задание остаётся в failed
+    eng = get_engine()
+    with eng.begin() as conn:
+        conn.execute(text("""
+        UPDATE media_jobs SET status = CASE WHEN CAST(:retry AS float8) IS NULL THEN 'failed' ELSE 'pending' END,
+               run_after = NOW() + make_interval(secs => COALESCE(CAST(:retry AS float8), 0)),
+               last_error = :err, locked_by = NULL, updated_at = NOW()
+        WHERE id = :id
+        """), dict(id=job_id, err=error[:2000], retry=retry_in))
+
+# ----- media: дедупликация по file_unique_id и sha256 (миграция 0010) -----
+class MediaRef(NamedTuple):
+    id: int
+    s3_key: str
+    url: str
+    inserted: bool = False
+
+def reuse_media(file_unique_id: str) -> MediaRef | None:
+    # файл с этим file_unique_id уже лежит в S3: задание закрывается без скачивания
+    eng = get_engine()
+    with eng.begin() as conn:
+        row = conn.execute(text("""
+        UPDATE media m SET reuse_count = m.reuse_count + 1, last_used_at = NOW()
+        FROM media_aliases a
+        WHERE a.file_unique_id = :fuid AND m.id = a.media_id
+        RETURNING m.id, m.s3_key, m.url
+        """), dict(fuid=file_unique_id)).fetchone()
+        return MediaRef(*row) if row else None
+
+def register_media(sha256: str, size_bytes: int, s3_key: str, url: str, file_type: str | None,
+                   file_unique_id: str | None) -> MediaRef:
+    # inserted=False: такое содержимое уже было под другим ключом — вызывающий удаляет свой объект
+    eng = get_engine()
+    with eng.begin() as conn:
+        row = conn.execute(text("""
+        INSERT INTO media(sha256, s3_key, url, file_type, size_bytes)
+        VALUES (:sha, :key, :url, :ftype, :size)
+        ON CONFLICT (sha256) DO UPDATE SET dupe_count = media.dupe_count + 1, last_used_at = NOW()
+        RETURNING id, s3_key, url, (xmax = 0) AS inserted
+        """), dict(sha=sha256, key=s3_key, url=url, ftype=file_type, size=size_bytes)).one()
+        if file_unique_id:
+            conn.execute(text("""
+            INSERT INTO media_aliases(file_unique_id, media_id) VALUES (:fuid, :mid)
+            ON CONFLICT (file_unique_id) DO NOTHING
+            """), dict(fuid=file_unique_id, mid=row.id))
+        return MediaRef(*row)
+
+def media_dedupe_stats() -> dict:
+    eng = get_engine()
+    with eng.connect() as conn:
+        row = conn.execute(text("""
+        SELECT COUNT(*) AS objects,
+               COALESCE(sum(size_bytes), 0)::bigint AS bytes_stored,
+               COALESCE(sum(reuse_count), 0)::bigint AS reuses,
+               COALESCE(sum(reuse_count * size_bytes), 0)::bigint AS bytes_saved_transfer,
+               COALESCE(sum(dupe_count), 0)::bigint AS dupes,
+               COALESCE(sum(dupe_count * size_bytes), 0)::bigint AS bytes_saved_storage
+        FROM media
+        """)).mappings().one()
+        return dict(row)
+
+def media_job_stats() -> dict:
+    eng = get_engine()
+    with eng.connect() as conn:
+        row = conn.execute(text("""
+        SELECT COUNT(*) FILTER (WHERE status = 'pending') AS pending,
+               COUNT(*) FILTER (WHERE status = 'running') AS running,
+               COUNT(*) FILTER (WHERE status = 'failed') AS failed,
+               COALESCE(EXTRACT(EPOCH FROM NOW() - min(created_at)), 0)::int AS oldest_sec
+        FROM media_jobs WHERE status IN ('pending','running','failed')
+        """)).mappings().one()
+        return dict(row)
+
+def list_media_jobs(status: str = "failed", limit: int = 50):
+    eng = get_engine(readonly=True)
+    with eng.connect() as conn:
+        return conn.execute(text(f"""
+        SELECT {MEDIA_JOB_COLS}, status, run_after, last_error, updated_at
+        FROM media_jobs WHERE status = :st
+        ORDER BY updated_at DESC, id DESC
+        LIMIT :lim
+        """), dict(st=status, lim=limit)).fetchall()
+
+def retry_media_jobs(ids: list[int] | None = None) -> int:
+    # failed -> pending с нуля попыток; без ids — все упавшие
+    cond, params = "status = 'failed'", {}
+    if ids:
+        cond += " AND id = ANY(:ids)"; params["ids"] = list(ids)
+    eng = get_engine()
+    with eng.begin() as conn:
+        n = conn.execute(text(f"""
+        UPDATE media_jobs SET status = 'pending', attempts = 0, run_after = NOW(), updated_at = NOW()
+        WHERE {cond}
+        """), params).rowcount
+    note_write()
+    return n
+
+# ===== Outbox =====
+# Исходящие сообщения (миграция 0014, диспетчер — outbox.py). Забираются с
+# lease, как media_jobs; отправленные удаляются одним оператором на пачку.
+class OutboxMessage(NamedTuple):
+    chat_id: int
+    kind: str
+    payload: dict
+    priority: int = 0
+
+OUTBOX_COLS = "id, chat_id, kind, payload, attempts"
+OUTBOX_CLAIM_LOCK_ID = 740_002  # pg_advisory_xact_lock: диспетчеры забирают пачки по очереди
+
+def _enqueue_outbox(conn, messages: list[OutboxMessage]) -> int:
+    if not messages:
+        return 0
+    return conn.execute(text("""
+    INSERT INTO outbox(chat_id, kind, payload, priority)
+    SELECT * FROM unnest(CAST(:chats AS bigint[]), CAST(:kinds AS text[]),
+                         CAST(:payloads AS jsonb[]), CAST(:prios AS smallint[]))
+    """), dict(chats=[m.chat_id for m in messages], kinds=[m.kind for m in messages],
+               payloads=[json.dumps(m.payload, ensure_ascii=False) for m in messages],
+               prios=[m.priority for m in messages])).rowcount
+
+def enqueue_outbox(messages: list[OutboxMessage]) -> int:
+    eng = get_engine()
+    with eng.begin() as conn:
+        return _enqueue_outbox(conn, messages)
+
+def claim_outbox(worker: str, limit: int = 100, lease_sec: int = 60):
+    # Чат целиком у одного диспетчера: пока у другого есть живые (в пределах
+    # lease) sending этого чата, его строки не берутся — порядок и темп чата
+    # держит один процесс. Заборы идут по очереди под advisory lock, и снимок
+    # UPDATE (следующий оператор) уже видит sending, забранные соседом до нас.
+    eng = get_engine()
+    with eng.begin() as conn:
+        conn.execute(text("SELECT pg_advisory_xact_lock(:k)"), dict(k=OUTBOX_CLAIM_LOCK_ID))
+        return conn.execute(text(f"""
+        UPDATE outbox o SET status = 'sending', attempts = o.attempts + 1, locked_by = :w, locked_at = NOW()
+        WHERE o.id IN (
+            SELECT id FROM outbox
+            WHERE status IN ('pending','sending') AND run_after <= NOW()
+              AND (status = 'pending' OR locked_at < NOW() - make_interval(secs => :lease))
+              AND chat_id NOT IN (
+                  SELECT chat_id FROM outbox
+                  WHERE status = 'sending' AND locked_by <> :w AND locked_at >= NOW() - make_interval(secs => :lease)
+              )
+            ORDER BY priority DESC, run_after, id
+            LIMIT :n
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING {OUTBOX_COLS}
+        """), dict(w=worker, n=limit, lease=lease_sec)).fetchall()
+
+def outbox_heartbeat(worker: str, alive_sec: float) -> int:
+    # -> сколько диспетчеров живо, считая этот (миграция 0017)
+    eng = get_engine()
+    with eng.begin() as conn:
+        conn.execute(text("""
+        INSERT INTO outbox_dispatchers(name) VALUES (:w)
+        ON CONFLICT (name) DO UPDATE SET seen_at = NOW()
+        """), dict(w=worker))
+        conn.execute(text("DELETE FROM outbox_dispatchers WHERE seen_at < NOW() - make_interval(secs => :s)"),
+                     dict(s=alive_sec))
+        return conn.execute(text("SELECT COUNT(*) FROM outbox_dispatchers")).scalar()
+
+def outbox_leave(worker: str):
+    eng = get_engine()
+    with eng.begin() as conn:
+        conn.execute(text("DELETE FROM outbox_dispatchers WHERE name = :w"), dict(w=worker))
+
+def complete_outbox(ids: list[int]):
+    if not ids:
+        return
+    eng = get_engine()
+    with eng.begin() as conn:
+        # строки рассылок сразу засчитываются в broadcasts.delivered
+        conn.execute(text("""
+        WITH d AS (DELETE FROM outbox WHERE id = ANY(:ids) RETURNING broadcast_id)
+        UPDATE broadcasts b SET delivered = b.delivered + c.n
+        FROM (SELECT broadcast_id, COUNT(*) AS n FROM d WHERE broadcast_id IS NOT NULL GROUP BY broadcast_id) c
+        WHERE b.id = c.broadcast_id
+        """), dict(ids=list(ids)))
+
+def fail_outbox(msg_id: int, error: str, retry_in: float | None):
+    # retry_in=None — ошибка окончательная, строка остаётся в failed. Строки
+    # рассылок не копятся (сотни тысяч «бот заблокирован»): удаляются со
+    # счётчиком в broadcasts.failed
+    eng = get_engine()
+    with eng.begin() as conn:
+        bid = conn.execute(text("""
+        UPDATE outbox SET status = CASE WHEN CAST(:retry AS float8) IS NULL THEN 'failed' ELSE 'pending' END,
+               run_after = NOW() + make_interval(secs => COALESCE(CAST(:retry AS float8), 0)),
+               last_error = :err, locked_by = NULL
+        WHERE id = :id
+        RETURNING broadcast_id
+        """), dict(id=msg_id, err=error[:2000], retry=retry_in)).scalar()
+        if bid is not None and retry_in is None:
+            conn.execute(text("DELETE FROM outbox WHERE id = :id"), dict(id=msg_id))
+            conn.execute(text("UPDATE broadcasts SET failed = failed + 1, last_error = :err WHERE id = :b"),
+                         dict(b=bid, err=error[:2000]))
+
+def defer_outbox(ids: list[int], delay: float):
+    eng = get_engine()
+    with eng.begin() as conn:
+        conn.execute(text("""
+        UPDATE outbox SET status = 'pending', attempts = attempts - 1, locked_by = NULL,
+               run_after = NOW() + make_interval(secs => :delay)
+        WHERE id = ANY(:ids)
+        """), dict(ids=list(ids), delay=delay))
+
+def pause_outbox_chat(chat_id: int, ids: list[int], delay: float):
+    # 429 по чату: свои строки (ids) и всё, что ждёт в очереди для этого чата,
+    # откладываются на retry_after — пауза переживает и перезапуск диспетчера
+    eng = get_engine()
+    with eng.begin() as conn:
+        conn.execute(text("""
+        UPDATE outbox SET status = 'pending', locked_by = NULL,
+               attempts = attempts - CASE WHEN id = ANY(:ids) THEN 1 ELSE 0 END,
+               run_after = GREATEST(run_after, NOW() + make_interval(secs => :delay))
+        WHERE chat_id = :chat AND (status = 'pending' OR id = ANY(:ids))
+        """), dict(chat=chat_id, ids=list(ids), delay=delay))
+
+def outbox_stats() -> dict:
+    eng = get_engine()
+    with eng.connect() as conn:
+        row = conn.execute(text("""
+        SELECT COUNT(*) FILTER (WHERE status = 'pending') AS pending,
+               COUNT(*) FILTER (WHERE status = 'sending') AS sending,
+               COUNT(*) FILTER (WHERE status = 'failed') AS failed,
+               COALESCE(EXTRACT(EPOCH FROM NOW() - min(created_at) FILTER (WHERE status <> 'failed')), 0) AS oldest_sec
+        FROM outbox
+        """)).mappings().one()
+        return {k: int(v) for k, v in row.items()}
+
+def list_outbox_failed(limit: int = 50):
+    eng = get_engine(readonly=True)
+    with eng.connect() as conn:
+        return conn.execute(text("""
+        SELECT id, chat_id, kind, attempts, created_at, last_error
+        FROM outbox WHERE status = 'failed'
+        ORDER BY created_at DESC, id DESC LIMIT :n
+        """), dict(n=limit)).fetchall()
+
+def retry_outbox(ids: list[int] | None = None) -> int:
+    cond, params = "status = 'failed'", {}
+    if ids:
+        cond += " AND id = ANY(:ids)"; params["ids"] = list(ids)
+    eng = get_engine()
+    with eng.begin() as conn:
+        n = conn.execute(text(f"""
+        UPDATE outbox SET status = 'pending', attempts = 0, run_after = NOW(), last_error = NULL
+        WHERE {cond}
+        """), params).rowcount
+    note_write()
+    return n
+
+# ===== Broadcasts =====
+# Рассылки (миграция 0015, цикл — broadcast.py). Получатели идут из
+# user_profile по user_id > last_user_id пачками: вставка в outbox и сдвиг
+# чекпоинта — одна транзакция, строка рассылки при этом заблокирована,
+# так что два процесса бота одну пачку не поставят.
+LANGS = ("ru", "uz")  # как в CHECK user_profile.lang; ru — по умолчанию
+TG_TEXT_LIMIT = 4096
+
+def broadcast_texts(texts: dict[str, str]) -> dict[str, str]:
+    # текст на каждый язык: не заданные берут ru или первый из заданных
+    texts = {l: t.strip() for l, t in texts.items() if l in LANGS and t and t.strip()}
+    if not texts:
+        raise ValueError("broadcast text is empty")
+    if any(len(t) > TG_TEXT_LIMIT for t in texts.values()):
+        raise ValueError(f"broadcast text is longer than {TG_TEXT_LIMIT}")
+    default = texts.get("ru") or next(iter(texts.values()))
+    return {l: texts.get(l, default) for l in LANGS}
+
+BROADCAST_COLS = "id, texts, status, last_user_id, queued, delivered, failed, last_error, created_by, created_at, finished_at"
+
+def create_broadcast(texts: dict[str, str], created_by: int | None = None) -> int:
+    eng = get_engine()
+    with eng.begin() as conn:
+        return conn.execute(text("""
+        INSERT INTO broadcasts(texts, created_by) VALUES (CAST(:texts AS jsonb), :by) RETURNING id
+        """), dict(texts=json.dumps(broadcast_texts(texts), ensure_ascii=False), by=created_by)).scalar()
+
+def running_broadcasts():
+    eng = get_engine()
+    with eng.connect() as conn:
+        return conn.execute(text("""
+        SELECT id, queued, delivered, failed FROM broadcasts WHERE status = 'running' ORDER BY id
+        """)).fetchall()
+
+def feed_broadcast(broadcast_id: int, limit: int, priority: int = 0) -> int | None:
+    # ставит в outbox следующих limit получателей; 0 — получатели кончились,
+    # None — рассылка не running или её пачку сейчас ставит другой процесс
+    eng = get_engine()
+    with eng.begin() as conn:
+        b = conn.execute(text("""
+        SELECT last_user_id FROM broadcasts WHERE id = :id AND status = 'running'
+        FOR UPDATE SKIP LOCKED
+        """), dict(id=broadcast_id)).fetchone()
+        if b is None:
+            return None
+        n, last = conn.execute(text("""
+        WITH r AS (
+            SELECT p.user_id, p.lang FROM user_profile p
+            WHERE p.user_id > :last
+              AND NOT EXISTS (SELECT 1 FROM blocked_users x WHERE x.user_id = p.user_id)
+            ORDER BY p.user_id
+            LIMIT :n
+        ), ins AS (
+            INSERT INTO outbox(chat_id, kind, payload, priority, broadcast_id)
+            SELECT r.user_id, 'text',
+                   jsonb_build_object('text', COALESCE(t.texts ->> r.lang, t.texts ->> 'ru'), 'parse_mode', NULL),
+                   :prio, :id
+            FROM r, broadcasts t WHERE t.id = :id
+            RETURNING chat_id
+        )
+        SELECT COUNT(*), max(chat_id) FROM ins
+        """), dict(id=broadcast_id, last=b.last_user_id, n=limit, prio=priority)).one()
+        if n:
+            conn.execute(text("""
+            UPDATE broadcasts SET last_user_id = :last, queued = queued + :n WHERE id = :id
+            """), dict(id=broadcast_id, last=last, n=n))
+        return n
+
+def finish_broadcast(broadcast_id: int):
+    # после того, как получатели кончились: done, когда в outbox не осталось её строк
+    eng = get_engine()
+    with eng.begin() as conn:
+        return conn.execute(text("""
+        UPDATE broadcasts b SET status = 'done', finished_at = NOW()
+        WHERE b.id = :id AND b.status = 'running'
+          AND NOT EXISTS (SELECT 1 FROM outbox o WHERE o.broadcast_id = :id)
+        RETURNING b.id, b.created_by, b.queued, b.delivered, b.failed,
+                  (SELECT lang FROM user_profile p WHERE p.user_id = b.created_by) AS lang
+        """), dict(id=broadcast_id)).fetchone()
+
+def cancel_broadcast(broadcast_id: int) -> bool:
+    # ещё не отправленное снимается с очереди; то, что уже отправляется, дойдёт
+    eng = get_engine()
+    with eng.begin() as conn:
+        if not conn.execute(text("""
+        UPDATE broadcasts SET status = 'cancelled', finished_at = NOW() WHERE id = :id AND status = 'running'
+        """), dict(id=broadcast_id)).rowcount:
+            return False
+        conn.execute(text("""
+        DELETE FROM outbox WHERE broadcast_id = :id AND status IN ('pending','failed')
+        """), dict(id=broadcast_id))
+        return True
+
+def get_broadcast(broadcast_id: int):
+    eng = get_engine()
+    with eng.connect() as conn:
+        return conn.execute(text(f"SELECT {BROADCAST_COLS} FROM broadcasts WHERE id = :id"),
+                            dict(id=broadcast_id)).fetchone()
+
+def list_broadcasts(limit: int = 20):
+    eng = get_engine()
+    with eng.connect() as conn:
+        return conn.execute(text(f"SELECT {BROADCAST_COLS} FROM broadcasts ORDER BY id DESC LIMIT :n"),
+                            dict(n=limit)).fetchall()
+
+# ===== Stats =====
+# stats_counts читает роллап stats_daily и кэшируется в процессе на
+# STATS_CACHE_TTL секунд; запись в этом процессе сбрасывает кэш сразу.
+STATS_CACHE_TTL = float(os.getenv("STATS_CACHE_TTL", "5"))
+_stats_cache = {"at": 0.0, "value": None}
+
+def invalidate_stats():
+    _stats_cache["value"] = None
+
+def cached_stats() -> dict | None:
+    cached = _stats_cache["value"]
+    if cached is not None and time.monotonic() - _stats_cache["at"] < STATS_CACHE_TTL:
+        return dict(cached)
+    return None
+
 def stats_counts():
+    cached = cached_stats()
+    if cached is not None:
+        return cached
+    eng = get_engine(readonly=True)
+    with eng.connect() as conn:
+        row = conn.execute(text("""
+        SELECT COALESCE(sum(cnt), 0) AS total,
+               COALESCE(sum(cnt) FILTER (WHERE day = CURRENT_DATE), 0) AS today,
+               COALESCE(sum(cnt) FILTER (WHERE day > CURRENT_DATE - 7), 0) AS week,
+               COALESCE(sum(cnt) FILTER (WHERE day > CURRENT_DATE - 30), 0) AS month,
+               COALESCE(sum(cnt) FILTER (WHERE category = 'complaint'), 0) AS complaints,
+               COALESCE(sum(cnt) FILTER (WHERE category = 'suggestion'), 0) AS suggestions,
+               COALESCE(sum(cnt) FILTER (WHERE status = 'new'), 0) AS new,
+               COALESCE(sum(cnt) FILTER (WHERE status = 'in_progress'), 0) AS in_progress,
+               COALESCE(sum(cnt) FILTER (WHERE status = 'done'), 0) AS done
+        FROM stats_daily
+        """)).mappings().one()
+        out = {k: int(v) for k, v in row.items()}
+    _stats_cache.update(at=time.monotonic(), value=out)
+    return dict(out)
+
+STATS_GROUPS = ("day", "category", "status")
+
+# ===== Data versions =====
+# Маркер изменений для ETag/Last-Modified админки: version в data_versions
+# поднимают триггеры (0012) в транзакции записи. Вместе с версией отдаётся
+# начало текущих суток: today/week в stats_counts меняются и без записей.
+# Читается с той же реплики, что и данные: иначе ETag мог бы опередить ответ.
+def data_version(name: str):
+    eng = get_engine(readonly=True)
+    with eng.connect() as conn:
+        return conn.execute(text("""
+        SELECT version, changed_at, date_trunc('day', now()) AS day_start
+        FROM data_versions WHERE name = :n
+        """), dict(n=name)).one()
+
+def stats_range(date_from: datetime.date, date_to: datetime.date, group_by=("day",), category: str | None = None):
+    # Разбивка за произвольный период [date_from, date_to] по любым из day/category/status
+    cols = [g for g in STATS_GROUPS if g in group_by]
+    params = {"d1": date_from, "d2": date_to}
+    where = ["day BETWEEN :d1 AND :d2"]
+    if category in ("complaint", "suggestion"):
+        where.append("category = :cat"); params["cat"] = category
+    query = ", ".join(cols + ["COALESCE(sum(cnt), 0)::bigint AS cnt"])
+    sql = f"SELECT {query} FROM stats_daily WHERE {' AND '.join(where)}"
+    if cols:
+        sql += f" GROUP BY {', '.join(cols)} HAVING sum(cnt) <> 0 ORDER BY {', '.join(cols)}"
+    eng = get_engine(readonly=True)
+    with eng.connect() as conn:
+        return [dict(r) for r in conn.execute(text(sql), params).mappings()]
+
+def rebuild_stats() -> int:
+    eng = get_engine()
+    with eng.begin() as conn:
+        n = conn.execute(text("SELECT hotline_rebuild_stats_daily()")).scalar()
+    invalidate_stats()
+    return n
+
+# ===== Partitions =====
+# complaints секционирована по месяцам created_at (миграция 0016), секции —
+# complaints_YYYY_MM. Секции по умолчанию нет: вставка в месяц без секции
+# падает, поэтому секции создаются заранее на PARTITIONS_AHEAD месяцев
+# (init_db, PartitionKeeper в боте, manage.py partitions). ATTACH и DETACH
+# ждут блокировку не дольше PARTITION_LOCK_TIMEOUT_MS: за долгим запросом к
+# complaints не выстраивается очередь из вставок. Архивация — partitions.py.
+PARTITIONS_AHEAD = int(os.getenv("PARTITIONS_AHEAD", "3"))
+PARTITION_LOCK_TIMEOUT_MS = int(os.getenv("PARTITION_LOCK_TIMEOUT_MS", "5000"))
+PARTITION_RE = re.compile(r"^complaints_(\d{4})_(\d{2})$")
+
+class Partition(NamedTuple):
+    name: str
+    month: datetime.date
+    attached: bool               # False — отсоединена архивацией, ещё не удалена
+    rows: int                    # оценка из pg_class.reltuples, -1 — ещё не анализировалась
+    size_bytes: int
+
+def ensure_partitions(ahead: int = PARTITIONS_AHEAD, since: datetime.date | None = None) -> list[str]:
+    # since — ещё и прошлые месяцы начиная с этого (загрузка истории); -> созданные секции
+    eng = get_engine()
+    with eng.begin() as conn:
+        conn.execute(text("SELECT pg_advisory_xact_lock(:k)"), dict(k=MIGRATION_LOCK_ID))
+        conn.execute(text(f"SET LOCAL lock_timeout = {PARTITION_LOCK_TIMEOUT_MS}"))
+        return [r[0] for r in conn.execute(text("SELECT hotline_ensure_complaints_partitions(:n, :since)"),
+                                           dict(n=ahead, since=since))]
+
+def list_partitions() -> list[Partition]:
     eng = get_engine()
     with eng.connect() as conn:
-        out = {}
-        out["total"] = conn.execute(text("SELECT COUNT(*) FROM complaints")).scalar()
-        out["today"] = conn.execute(text("SELECT COUNT(*) FROM complaints WHERE created_at::date = CURRENT_DATE")).scalar()
-        out["week"]  = conn.execute(text("SELECT COUNT(*) FROM complaints WHERE created_at >= NOW() - INTERVAL '7 days'")).scalar()
-        out["month"] = conn.execute(text("SELECT COUNT(*) FROM complaints WHERE created_at >= NOW() - INTERVAL '30 days'")).scalar()
-        out["complaints"] = conn.execute(text("SELECT COUNT(*) FROM complaints WHERE category='complaint'")).scalar()
-        out["suggestions"] = conn.execute(text("SELECT COUNT(*) FROM complaints WHERE category='suggestion'")).scalar()
-        return out
+        rows = conn.execute(text("""
+        SELECT c.relname, i.inhrelid IS NOT NULL, c.reltuples::bigint, pg_total_relation_size(c.oid)
+        FROM pg_class c
+        LEFT JOIN pg_inherits i ON i.inhrelid = c.oid AND i.inhparent = 'complaints'::regclass
+        WHERE c.relkind = 'r' AND c.relname LIKE 'complaints%' AND pg_table_is_visible(c.oid)
+        ORDER BY c.relname
+        """)).fetchall()
+    out = []
+    for name, attached, n, size in rows:
+        m = PARTITION_RE.match(name)
+        if m:
+            out.append(Partition(name, datetime.date(int(m[1]), int(m[2]), 1), attached, n, size))
+    return out
+
+def _check_detached(conn, name: str):
+    # имя подставляется в SQL: только отсоединённые complaints_YYYY_MM
+    if not PARTITION_RE.match(name) or not conn.execute(text("""
+        SELECT to_regclass(:p) IS NOT NULL AND NOT EXISTS (SELECT 1 FROM pg_inherits WHERE inhrelid = to_regclass(:p))
+    """), dict(p=name)).scalar():
+        raise ValueError(f"not a detached complaints partition: {name}")
+
+def detach_partition(name: str) -> int:
+    # -> строк в секции; user_summary, stats_daily и media_jobs поправлены в той же транзакции
+    eng = get_engine()
+    with eng.begin() as conn:
+        conn.execute(text("SET LOCAL statement_timeout = 0"))
+        conn.execute(text(f"SET LOCAL lock_timeout = {PARTITION_LOCK_TIMEOUT_MS}"))
+        n = conn.execute(text("SELECT hotline_detach_complaints_partition(:p)"), dict(p=name)).scalar()
+    invalidate_stats()
+    return n
+
+def delete_partition_media(name: str, url_prefix: str | None = None) -> list[str]:
+    # Вложения отсоединённой секции, на которые не ссылаются живые обращения:
+    # строки media удаляются (с ними media_aliases — повторно присланный файл
+    # скачается заново), возвращаются ключи S3 для удаления. Файл, присланный
+    # повторно после конца месяца (last_used_at), остаётся. url_prefix —
+    # public_url(""): старые строки без media_id хранят ссылку в file_url.
+    m = PARTITION_RE.match(name)
+    end = (datetime.date(int(m[1]), int(m[2]), 1) + datetime.timedelta(days=31)).replace(day=1) if m else None
+    eng = get_engine()
+    with eng.begin() as conn:
+        _check_detached(conn, name)
+        conn.execute(text("SET LOCAL statement_timeout = 0"))
+        keys = [r[0] for r in conn.execute(text(f"""
+        DELETE FROM media m
+        WHERE m.id IN (SELECT media_id FROM {name} WHERE media_id IS NOT NULL)
+          AND m.last_used_at < :end
+          AND NOT EXISTS (SELECT 1 FROM complaints c WHERE c.media_id = m.id)
+        RETURNING m.s3_key
+        """), dict(end=end))]
+        if url_prefix:
+            keys += [r[0] for r in conn.execute(text(f"""
+            SELECT DISTINCT substr(file_url, :n + 1) FROM {name}
+            WHERE media_id IS NULL AND left(file_url, :n) = :p
+            """), dict(n=len(url_prefix), p=url_prefix))]
+    return keys
+
+def drop_partition(name: str):
+    eng = get_engine()
+    with eng.begin() as conn:
+        _check_detached(conn, name)
+        conn.execute(text(f"DROP TABLE {name}"))
 
 def wait_db(max_sec=60):
     start = time.time()
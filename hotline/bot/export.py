@@ -0,0 +1,166 @@
+import os, io, csv, json, zlib, datetime
+from sqlalchemy import text
+
+try:
+    from . import db
+except ImportError:
+    import db
+
+# Потоковая выгрузка: строки читаются серверным курсором пачками по
+# EXPORT_BATCH и сразу пишутся в выходной формат, поэтому память не растёт
+# с размером таблицы и ограничения по числу строк нет.
+# Форматы: csv, ndjson, parquet (нужен pyarrow), любой из них — с gzip.
+EXPORT_BATCH = int(os.getenv("EXPORT_BATCH", "5000"))
+EXPORT_FLUSH_BYTES = 256 * 1024
+FORMATS = ("csv", "ndjson", "parquet")
+
+COMPLAINT_COLS = ["ticket_no", "user_id", "username", "full_name", "category", "status", "created_at",
+                  "message_text", "file_type"]
+USER_COLS = ["user_id", "username", "full_name", "last_activity", "total_messages"]
+
+EXPORTS = {
+    "complaints": (COMPLAINT_COLS, "complaints", "created_at", "category = 'complaint'"),
+    "suggestions": (COMPLAINT_COLS, "complaints", "created_at", "category = 'suggestion'"),
+    "all": (COMPLAINT_COLS, "complaints", "created_at", None),
+    "users": (USER_COLS, "user_summary", "last_activity", None),
+}
+
+def export_query(what: str, date_from: datetime.date | None = None, date_to: datetime.date | None = None):
+    if what not in EXPORTS:
+        raise ValueError(f"unknown export: {what}")
+    cols, table, ts_col, cond = EXPORTS[what]
+    where, params = [cond] if cond else [], {}
+    if date_from:
+        where.append(f"{ts_col} >= :d1"); params["d1"] = date_from
+    if date_to:
+        where.append(f"{ts_col} < :d2"); params["d2"] = date_to + datetime.timedelta(days=1)
+    id_col = "id" if table == "complaints" else "user_id"
+    sql = f"""
+    SELECT {", ".join(cols)} FROM {table}
+    {"WHERE " + " AND ".join(where) if where else ""}
+    ORDER BY {ts_col} DESC, {id_col} DESC
+    """
+    return cols, text(sql), params
+
+def iter_rows(what: str, date_from=None, date_to=None, batch: int = EXPORT_BATCH):
+    # stream_results: psycopg2 открывает именованный (серверный) курсор, yield_per — размер пачки
+    cols, sql, params = export_query(what, date_from, date_to)
+    # с реплики: на ней долгий запрос может отменить конфликт с recovery —
+    # там нужен hot_standby_feedback = on или большой max_standby_streaming_delay
+    eng = db.get_engine(readonly=True)
+    with eng.connect() as conn:
+        conn.execute(text("SET LOCAL statement_timeout = 0"))  # выгрузка длинная по природе
+        # yield_per задаётся на результате: опция уровня соединения partitions() не учитывает
+        result = conn.execution_options(stream_results=True).execute(sql, params).yield_per(batch)
+        for part in result.partitions():
+            yield from part
+
+def _cell(v):
+    if isinstance(v, (datetime.datetime, datetime.date)):
+        return v.isoformat(sep=" ") if isinstance(v, datetime.datetime) else v.isoformat()
+    return v
+
+def _csv_chunks(cols, rows):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(cols)
+    for row in rows:
+        writer.writerow(["" if v is None else _cell(v) for v in row])
+        if buf.tell() >= EXPORT_FLUSH_BYTES:
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0); buf.truncate()
+    yield buf.getvalue().encode("utf-8")
+
+def _ndjson_chunks(cols, rows):
+    out, size = [], 0
+    for row in rows:
+        line = json.dumps(dict(zip(cols, map(_cell, row))), ensure_ascii=False) + "\n"
+        out.append(line); size += len(line)
+        if size >= EXPORT_FLUSH_BYTES:
+            yield "".join(out).encode("utf-8")
+            out, size = [], 0
+    yield "".join(out).encode("utf-8")
+
+class _Sink(io.RawIOBase):
+    # pyarrow пишет сюда; накопленные байты забираются после каждой группы строк
+    def __init__(self):
+        self.parts = []
+        self.pos = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.parts.append(bytes(b)); self.pos += len(b)
+        return len(b)
+
+    def tell(self):
+        return self.pos
+
+    def drain(self) -> bytes:
+        data = b"".join(self.parts); self.parts = []
+        return data
+
+def _parquet_chunks(cols, rows, batch: int = EXPORT_BATCH):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("parquet export needs pyarrow (pip install pyarrow)")
+    types = {"user_id": pa.int64(), "total_messages": pa.int64(),
+             "created_at": pa.timestamp("us"), "last_activity": pa.timestamp("us")}
+    schema = pa.schema([(c, types.get(c, pa.string())) for c in cols])
+    sink = _Sink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    buf = []
+
+    def flush():
+        writer.write_table(pa.table({c: [r[i] for r in buf] for i, c in enumerate(cols)}, schema=schema))
+        buf.clear()
+
+    for row in rows:
+        buf.append(row)
+        if len(buf) >= batch:
+            flush()
+            yield sink.drain()
+    if buf:
+        flush()
+    writer.close()
+    yield sink.drain()
+
+def _gzip_chunks(chunks):
+    z = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 — формат gzip
+    for chunk in chunks:
+        out = z.compress(chunk)
+        if out:
+            yield out
+    yield z.flush()
+
+def export_chunks(what: str, fmt: str = "csv", gzip: bool = False, date_from=None, date_to=None):
+    # Генератор байтовых кусков; запрос выполняется при первом next()
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown format: {fmt}")
+    if what not in EXPORTS:
+        raise ValueError(f"unknown export: {what}")
+    cols = EXPORTS[what][0]
+    rows = iter_rows(what, date_from, date_to)
+    chunks = {"csv": _csv_chunks, "ndjson": _ndjson_chunks, "parquet": _parquet_chunks}[fmt](cols, rows)
+    chunks = (c for c in chunks if c)
+    return _gzip_chunks(chunks) if gzip else chunks
+
+def filename(what: str, fmt: str = "csv", gzip: bool = False) -> str:
+    stamp = datetime.datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+    return f"{what}_{stamp}.{fmt}" + (".gz" if gzip else "")
+
+MEDIA_TYPES = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson", "parquet": "application/vnd.apache.parquet"}
+
+def media_type(fmt: str, gzip: bool = False) -> str:
+    return "application/gzip" if gzip else MEDIA_TYPES[fmt]
+
+def export_to_file(path: str, what: str, fmt: str = "csv", gzip: bool = False, date_from=None, date_to=None) -> int:
+    # Возвращает размер файла в байтах
+    size = 0
+    with open(path, "wb") as f:
+        for chunk in export_chunks(what, fmt, gzip, date_from, date_to):
+            f.write(chunk); size += len(chunk)
+    return size
@@ -1,4 +1,5 @@
-import os, re, asyncio, datetime, csv, io
+import os, re, html, asyncio
+from types import MappingProxyType
 from aiogram import Bot, Dispatcher, F
 from aiogram.types import Message, CallbackQuery, FSInputFile, ReplyKeyboardMarkup, KeyboardButton
 from aiogram.filters import CommandStart, Command
@@ -7,34 +8,48 @@ from aiogram.client.default import DefaultBotProperties
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.exceptions import TelegramBadRequest
 
-from db import (
+from adb import (
     init_db, wait_db,
     set_user_category, get_user_category,
     set_user_lang, get_user_lang,
     is_blocked, block_user, unblock_user, list_blocked,
-    list_users, list_complaints, insert_complaint, get_by_ticket, set_status,
-    last_submit_time, touch_rate_limit, stats_counts
+    list_users, list_complaints, list_complaints_page, search_complaints_page, get_by_ticket, set_status,
+    save_search_query, get_search_query,
+    submit_complaint, stats_counts, enqueue_outbox,
+    create_broadcast, cancel_broadcast, list_broadcasts,
+    cache_stats, start_cache_listener
 )
+from adb import run as run_db
+from ratelimit import get_limiter
+import export
+from media import MediaWorker
+from notify import StatusNotifier
+from broadcast import BroadcastRunner, parse_texts
+from partitions import PartitionKeeper
+from outbox import OutboxDispatcher, PRIORITY_NOTICE
+from db import OutboxMessage, SEARCH_WINDOW
+import metrics
 
 # --- ENV ---
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 if not BOT_TOKEN:
     raise RuntimeError("BOT_TOKEN is not set")
 MOD_CHAT_ID = int(os.getenv("MOD_CHAT_ID", "0"))
-RATE_LIMIT_SECONDS = int(os.getenv("RATE_LIMIT_SECONDS", "30"))
 ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "changeme")
+TG_UPLOAD_LIMIT = 50 * 1024 * 1024  # sendDocument в Bot API
+BOT_MODE = os.getenv("BOT_MODE", "polling")  # polling | webhook (см. webhook.py)
 ADMIN_IDS = set(int(x.strip()) for x in os.getenv("ADMIN_IDS","").split(",") if x.strip().isdigit())
 
-# S3 params (optional)
-S3_ENDPOINT = os.getenv("S3_ENDPOINT")
-S3_BUCKET   = os.getenv("S3_BUCKET")
-S3_REGION   = os.getenv("S3_REGION")
-S3_ACCESS   = os.getenv("S3_ACCESS_KEY")
-S3_SECRET   = os.getenv("S3_SECRET_KEY")
-S3_USE_SSL  = os.getenv("S3_USE_SSL","true").lower() == "true"
-
 bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+metrics.instrument_bot(bot)
 dp = Dispatcher()
+limiter = get_limiter()
+media_worker = MediaWorker(bot)
+dp.startup.register(media_worker.start)
+dp.shutdown.register(media_worker.stop)
+outbox = OutboxDispatcher(bot)
+dp.startup.register(outbox.start)
+dp.shutdown.register(outbox.stop)
 
 # --- i18n ---
 T = {
@@ -71,9 +86,21 @@ T = {
         "stats": "📊 Статистика:\nВсего: {total}\nСегодня: {today}\n7 дней: {week}\n30 дней: {month}\nЖалоб: {complaints}\nПредложений: {suggestions}",
         "status_ok": "Статус заявки <b>{ticket}</b> установлен: <b>{status}</b>.",
         "status_notify": "ℹ️ По вашей заявке <b>{ticket}</b> установлен статус: <b>{status}</b>.",
+        "status_notify_many": "ℹ️ Изменён статус ваших заявок:\n{lines}",
         "status_usage": "Использование: /setstatus <TICKET> <new|in_progress|done>",
-        "export_usage": "Использование: /export complaints|suggestions|users",
-        "export_done": "Экспорт готов, отправляю файл…"
+        "export_usage": "Использование: /export complaints|suggestions|users [csv|ndjson|parquet] [gz]",
+        "export_done": "Экспорт готов, отправляю файл…",
+        "export_too_big": "Файл слишком большой для Telegram ({mb} МБ). Используйте gz или /api/export в админке.",
+        "search_usage": "Использование: /search <текст>",
+        "search_empty": "Ничего не найдено.",
+        "search_title": "🔎 Поиск «{q}» (стр. {page}):",
+        "search_truncated": "⚠️ Совпадений больше {n}: показаны только {n} самых свежих. Уточните запрос.",
+        "broadcast_usage": "Использование: /broadcast &lt;текст&gt; — всем одинаково, или по языкам:\n/broadcast\nru: текст\nuz: matn\nОтмена: /broadcast_cancel &lt;id&gt;",
+        "broadcast_started": "📣 Рассылка <b>#{id}</b> запущена. Итог придёт сюда.",
+        "broadcast_done": "📣 Рассылка <b>#{id}</b> завершена: доставлено {delivered}, ошибок {failed} (из {queued}).",
+        "broadcast_row": "• #{id} {status}: поставлено {queued}, доставлено {delivered}, ошибок {failed}",
+        "broadcast_cancelled": "Рассылка <b>#{id}</b> остановлена.",
+        "broadcast_not_running": "Рассылка не найдена или уже завершена."
     },
     "uz": {
         "menu": "Amalni tanlang:",
@@ -108,9 +135,21 @@ T = {
         "stats": "📊 Statistika:\nJami: {total}\nBugun: {today}\n7 kun: {week}\n30 kun: {month}\nShikoyatlar: {complaints}\nTakliflar: {suggestions}",
         "status_ok": "Ariza holati <b>{ticket}</b>: <b>{status}</b> ga o‘rnatildi.",
         "status_notify": "ℹ️ Sizning <b>{ticket}</b> arizangiz holati: <b>{status}</b>.",
+        "status_notify_many": "ℹ️ Arizalaringiz holati o‘zgardi:\n{lines}",
         "status_usage": "Foydalanish: /setstatus <TICKET> <new|in_progress|done>",
-        "export_usage": "Foydalanish: /export complaints|suggestions|users",
-        "export_done": "Eksport tayyor, fayl yuborilmoqda…"
+        "export_usage": "Foydalanish: /export complaints|suggestions|users [csv|ndjson|parquet] [gz]",
+        "export_done": "Eksport tayyor, fayl yuborilmoqda…",
+        "export_too_big": "Fayl Telegram uchun juda katta ({mb} MB). gz yoki admin paneldagi /api/export dan foydalaning.",
+        "search_usage": "Foydalanish: /search <matn>",
+        "search_empty": "Hech narsa topilmadi.",
+        "search_title": "🔎 Qidiruv «{q}» (sah. {page}):",
+        "search_truncated": "⚠️ Mosliklar {n} tadan ko'p: faqat eng yangi {n} tasi ko'rsatildi. So'rovni aniqlashtiring.",
+        "broadcast_usage": "Foydalanish: /broadcast &lt;matn&gt; — hammaga bir xil, yoki tillar bo‘yicha:\n/broadcast\nru: текст\nuz: matn\nBekor qilish: /broadcast_cancel &lt;id&gt;",
+        "broadcast_started": "📣 <b>#{id}</b> xabarnoma boshlandi. Natija shu yerga keladi.",
+        "broadcast_done": "📣 <b>#{id}</b> xabarnoma tugadi: yetkazildi {delivered}, xatolar {failed} ({queued} dan).",
+        "broadcast_row": "• #{id} {status}: navbatga {queued}, yetkazildi {delivered}, xatolar {failed}",
+        "broadcast_cancelled": "<b>#{id}</b> xabarnoma to‘xtatildi.",
+        "broadcast_not_running": "Xabarnoma topilmadi yoki allaqachon tugagan."
     }
 }
 
@@ -121,14 +160,27 @@ WELCOME = {
 
 URL_RE = re.compile(r"(https?://|www\.|t\.me/|telegram\.me/|@[a-zA-Z0-9_]{4,}|://)", re.IGNORECASE)
 
-def kb_lang():
+# Подписи закреплённой клавиатуры. Из этих таблиц собираются и сами
+# клавиатуры, и таблица маршрутов BUTTONS — подпись не разойдётся с действием.
+PINNED_ACTIONS = ("complaint", "suggestion", "my", "about", "lang")
+PINNED_LABELS = {
+    "ru": ("🟥 Жалоба", "🟩 Предложение", "📜 Мои", "ℹ️ О сервисе", "🌐 Язык"),
+    "uz": ("🟥 Shikoyat", "🟩 Taklif", "📜 Mening", "ℹ️ Xizmat haqida", "🌐 Til"),
+}
+ADMIN_ACTIONS = ("complaints", "suggestions", "users", "stats")
+ADMIN_LABELS = {
+    "ru": ("📥 Жалобы", "💡 Предложения", "👥 Пользователи", "📊 Статистика"),
+    "uz": ("📥 Shikoyatlar", "💡 Takliflar", "👥 Foydalanuvchilar", "📊 Statistika"),
+}
+
+def _build_kb_lang():
     kb = InlineKeyboardBuilder()
     kb.button(text="🇷🇺 Русский", callback_data="lang:ru")
     kb.button(text="🇺🇿 O‘zbek",   callback_data="lang:uz")
     kb.adjust(2)
     return kb.as_markup()
 
-def kb_menu(lang="ru"):
+def _build_kb_menu(lang: str):
     kb = InlineKeyboardBuilder()
     kb.button(text=T[lang]["btn_complaint"],  callback_data="menu:complaint")
     kb.button(text=T[lang]["btn_suggestion"], callback_data="menu:suggestion")
@@ -137,16 +189,47 @@ def kb_menu(lang="ru"):
     kb.adjust(2,2)
     return kb.as_markup()
 
-def kb_pinned(lang: str = "ru") -> ReplyKeyboardMarkup:
-    labels = {
-        "ru": ["🟥 Жалоба", "🟩 Предложение", "📜 Мои", "ℹ️ О сервисе", "🌐 Язык"],
-        "uz": ["🟥 Shikoyat", "🟩 Taklif", "📜 Mening", "ℹ️ Xizmat haqida", "🌐 Til"]
-    }[lang]
+def _build_kb_pinned(lang: str) -> ReplyKeyboardMarkup:
+    labels = PINNED_LABELS[lang]
     row1 = [KeyboardButton(text=labels[0]), KeyboardButton(text=labels[1])]
     row2 = [KeyboardButton(text=labels[2]), KeyboardButton(text=labels[3])]
     row3 = [KeyboardButton(text=labels[4])]
     return ReplyKeyboardMarkup(keyboard=[row1,row2,row3], resize_keyboard=True, is_persistent=True, input_field_placeholder="Напишите текст…")
 
+def _build_kb_admin_pinned(lang: str) -> ReplyKeyboardMarkup:
+    labels = ADMIN_LABELS[lang]
+    base = _build_kb_pinned(lang)
+    admin_rows = [[KeyboardButton(text=labels[0]), KeyboardButton(text=labels[1])],
+                  [KeyboardButton(text=labels[2]), KeyboardButton(text=labels[3])]]
+    return ReplyKeyboardMarkup(keyboard=base.keyboard + admin_rows, resize_keyboard=True, is_persistent=True, input_field_placeholder="Напишите текст…")
+
+# Разметка не зависит ни от пользователя, ни от времени: собирается один раз
+# при импорте. Модели aiogram заморожены (frozen), общий экземпляр на все ответы безопасен.
+KB_LANG         = _build_kb_lang()
+KB_MENU         = MappingProxyType({l: _build_kb_menu(l) for l in T})
+KB_PINNED       = MappingProxyType({l: _build_kb_pinned(l) for l in T})
+KB_ADMIN_PINNED = MappingProxyType({l: _build_kb_admin_pinned(l) for l in T})
+
+def kb_lang():
+    return KB_LANG
+
+def kb_menu(lang="ru"):
+    return KB_MENU[lang]
+
+def kb_pinned(lang: str = "ru") -> ReplyKeyboardMarkup:
+    return KB_PINNED[lang]
+
+def kb_admin_pinned(lang: str = "ru") -> ReplyKeyboardMarkup:
+    return KB_ADMIN_PINNED[lang]
+
+# Кнопки закреплённой клавиатуры: подпись (в нижнем регистре, любого языка) ->
+# действие. Подписи языков не пересекаются, поэтому для разбора язык
+# пользователя не нужен. admin:* — быстрые кнопки администратора.
+BUTTONS = MappingProxyType(
+    {label.lower(): action for l in T for label, action in zip(PINNED_LABELS[l], PINNED_ACTIONS)}
+    | {label.lower(): f"admin:{action}" for l in T for label, action in zip(ADMIN_LABELS[l], ADMIN_ACTIONS)}
+)
+
 async def safe_edit_text(msg, text, reply_markup=None):
     try:
         await msg.edit_text(text, reply_markup=reply_markup)
@@ -155,37 +238,20 @@ async def safe_edit_text(msg, text, reply_markup=None):
             return
         raise
 
+async def say(message: Message, text: str, reply_markup=None):
+    return await message.answer(text, reply_markup=reply_markup)
+
 def is_admin(message: Message) -> bool:
     return message.from_user and message.from_user.id in ADMIN_IDS
 
-def lang_of(message: Message) -> str:
-    l = get_user_lang(message.from_user.id)
+async def lang_of(message: Message) -> str:
+    l = await get_user_lang(message.from_user.id)
     return l if l in ("ru","uz") else "ru"
 
-def s3_enabled() -> bool:
-    return all([S3_ENDPOINT, S3_BUCKET, S3_ACCESS, S3_SECRET])
-
-async def tg_file_to_s3(file_id: str, key_prefix: str) -> str | None:
-    if not s3_enabled():
-        return None
-    try:
-        from io import BytesIO
-        import boto3
-        file = await bot.get_file(file_id)
-        buf = BytesIO()
-        await bot.download_file(file.file_path, buf)
-        buf.seek(0)
-        key = f"{key_prefix}/{file_id}"
-        s3 = boto3.client("s3", endpoint_url=S3_ENDPOINT, aws_access_key_id=S3_ACCESS, aws_secret_access_key=S3_SECRET, region_name=S3_REGION)
-        s3.upload_fileobj(buf, S3_BUCKET, key, ExtraArgs={"ACL": "public-read"})
-        return f"{S3_ENDPOINT.rstrip('/')}/{S3_BUCKET}/{key}"
-    except Exception:
-        return None
-
 # ===== Onboarding / Language =====
 @dp.message(CommandStart())
 async def start(message: Message):
-    l = get_user_lang(message.from_user.id)
+    l = await get_user_lang(message.from_user.id)
     if l not in ("ru","uz"):
         await say(message, "👋 Assalomu alaykum! / Здравствуйте!\nIltimos, tilni tanlang / Пожалуйста, выберите язык:", reply_markup=kb_lang())
     else:
@@ -201,7 +267,7 @@ async def cmd_lang(message: Message):
 async def on_lang(cb: CallbackQuery):
     lang = cb.data.split(":",1)[1]
     if lang not in ("ru","uz"): lang = "ru"
-    set_user_lang(cb.from_user.id, lang)
+    await set_user_lang(cb.from_user.id, lang)
     await cb.message.answer(WELCOME[lang], reply_markup=kb_pinned(lang))
     await cb.message.answer(T[lang]["menu"])
     await cb.answer()
@@ -209,16 +275,16 @@ async def on_lang(cb: CallbackQuery):
 # ===== Menu (inline) =====
 @dp.callback_query(F.data.startswith("menu:"))
 async def on_menu(cb: CallbackQuery):
-    lang = get_user_lang(cb.from_user.id) or "ru"
+    lang = await get_user_lang(cb.from_user.id) or "ru"
     action = cb.data.split(":",1)[1]
     if action == "complaint":
-        set_user_category(cb.from_user.id, "complaint")
+        await set_user_category(cb.from_user.id, "complaint")
         await cb.message.answer(T[lang]["category_set"].format(name=T[lang]["complaint_name"]))
     elif action == "suggestion":
-        set_user_category(cb.from_user.id, "suggestion")
+        await set_user_category(cb.from_user.id, "suggestion")
         await cb.message.answer(T[lang]["category_set"].format(name=T[lang]["suggestion_name"]))
     elif action == "my":
-        rows = list_complaints(None, limit=10, offset=0, by_user=cb.from_user.id)
+        rows = await list_complaints(None, limit=10, offset=0, by_user=cb.from_user.id)
         if not rows:
             await cb.message.answer(T[lang]["my_empty"])
         else:
@@ -234,47 +300,28 @@ async def on_menu(cb: CallbackQuery):
         await cb.message.answer(T[lang]["about"])
     await cb.answer()
 
-# ===== Pinned buttons mapping =====
-def _btn_map(lang: str):
-    return {
-        "ru": {
-            "🟥 жалоба": "complaint",
-            "🟩 предложение": "suggestion",
-            "📜 мои": "my",
-            "ℹ️ о сервисе": "about",
-            "🌐 язык": "lang",
-        },
-        "uz": {
-            "🟥 shikoyat": "complaint",
-            "🟩 taklif": "suggestion",
-            "📜 mening": "my",
-            "ℹ️ xizmat haqida": "about",
-            "🌐 til": "lang",
-        }
-    }[lang]
-
 @dp.message(Command("menu"))
 async def cmd_menu(message: Message):
-    l = lang_of(message)
+    l = await lang_of(message)
     await say(message, WELCOME[l], reply_markup=kb_pinned(l))
     await say(message, T[l]["menu"])
 
 @dp.message(Command("complaint"))
 async def cmd_complaint(message: Message):
-    l = lang_of(message)
-    set_user_category(message.from_user.id, "complaint")
+    l = await lang_of(message)
+    await set_user_category(message.from_user.id, "complaint")
     await say(message, T[l]["category_set"].format(name=T[l]["complaint_name"]))
 
 @dp.message(Command("suggestion"))
 async def cmd_suggestion(message: Message):
-    l = lang_of(message)
-    set_user_category(message.from_user.id, "suggestion")
+    l = await lang_of(message)
+    await set_user_category(message.from_user.id, "suggestion")
     await say(message, T[l]["category_set"].format(name=T[l]["suggestion_name"]))
 
 @dp.message(Command("my"))
 async def cmd_my(message: Message):
-    l = lang_of(message)
-    rows = list_complaints(None, limit=10, offset=0, by_user=message.from_user.id)
+    l = await lang_of(message)
+    rows = await list_complaints(None, limit=10, offset=0, by_user=message.from_user.id)
     if not rows:
         await say(message, T[l]["my_empty"])
     else:
@@ -289,22 +336,17 @@ async def cmd_my(message: Message):
 
 @dp.message(Command("about"))
 async def cmd_about(message: Message):
-    l = lang_of(message)
+    l = await lang_of(message)
     await say(message, T[l]["about"])
 
-@dp.message(F.text)
+# команды сюда не попадают: их разбирают Command-хендлеры ниже.
+# Кнопка — один поиск в BUTTONS и вызов из ROUTES (внизу файла), без запроса языка;
+# быстрые кнопки админа у остальных пользователей — обычный текст.
+@dp.message(F.text & ~F.text.startswith("/"))
 async def handle_buttons_or_text(message: Message):
-    l = lang_of(message)
-    txt = (message.text or "").strip().lower()
-    m = _btn_map(l)
-
-    if txt in m:
-        action = m[txt]
-        if action == "complaint":  await cmd_complaint(message);  return
-        if action == "suggestion": await cmd_suggestion(message); return
-        if action == "my":         await cmd_my(message);         return
-        if action == "about":      await cmd_about(message);      return
-        if action == "lang":       await cmd_lang(message);       return
+    action = BUTTONS.get(message.text.strip().lower())
+    if action is not None and (not action.startswith("admin:") or is_admin(message)):
+        await ROUTES[action](message); return
 
     # Иначе — это обычный текст обращения
     await handle_payload(message, message.text)
@@ -322,10 +364,10 @@ def _extract_target_uid(message: Message) -> int | None:
 @dp.message(Command("users"))
 async def cmd_users(message: Message):
     if not is_admin(message): return
-    l = lang_of(message)
+    l = await lang_of(message)
     args = (message.text or "").split()
     page = int(args[1]) if len(args)>1 and args[1].isdigit() else 1
-    rows = list_users(limit=50, offset=(page-1)*50)
+    rows = await list_users(limit=50, offset=(page-1)*50)
     if not rows: await say(message, T[l]["users_empty"]); return
     lines = [T[l]["users_title"].format(page=page)]
     for uid, username, full_name, last, total in rows:
@@ -334,47 +376,115 @@ async def cmd_users(message: Message):
         lines.append(f"• <code>{uid}</code> | {un} | {fn} | msg: {total}")
     await say(message, "\n".join(lines))
 
-@dp.message(Command("complaints"))
-async def cmd_complaints(message: Message):
-    if not is_admin(message): return
-    l = lang_of(message)
-    args = (message.text or "").split()
-    page = int(args[1]) if len(args)>1 and args[1].isdigit() else 1
-    rows = list_complaints("complaint", limit=30, offset=(page-1)*30)
-    if not rows: await say(message, T[l]["complaints_empty"]); return
-    lines = [T[l]["complaints_title"].format(page=page)]
+# /complaints и /suggestions листаются курсором (кнопки ← →), номер страницы
+# в аргументе команды остаётся как fallback через OFFSET.
+PAGE_CAT = {"c": "complaint", "s": "suggestion"}
+
+def _complaints_text(l: str, category: str, page: int, rows, title: str | None = None) -> str:
+    lines = [title or T[l][f"{category}s_title"].format(page=page)]
     for r in rows:
-        _id, ticket, uid, un, fn, cat, textval, ftype, status, created = r
+        _id, ticket, uid, un, fn, cat, textval, ftype, status, created = r[:10]
         preview = (textval or "").replace("\n"," ")
         if len(preview) > 120: preview = preview[:117] + "…"
         un = f"@{un}" if un else "-"
         lines.append(f"{ticket} | <code>{uid}</code> {un} | {status} | {created:%Y-%m-%d %H:%M}\n— {preview}")
-    await say(message, "\n".join(lines))
+    return "\n".join(lines)
+
+def kb_pager(category: str, page: int, pg):
+    if not (pg.prev or pg.next):
+        return None
+    kb = InlineKeyboardBuilder()
+    if pg.prev: kb.button(text="←", callback_data=f"pg:{category[0]}:p:{page-1}:{pg.prev}")
+    if pg.next: kb.button(text="→", callback_data=f"pg:{category[0]}:n:{page+1}:{pg.next}")
+    return kb.as_markup()
+
+async def _send_complaints(message: Message, category: str):
+    l = await lang_of(message)
+    args = (message.text or "").split()
+    page = int(args[1]) if len(args)>1 and args[1].isdigit() else 1
+    pg = await list_complaints_page(category, limit=30, offset=(page-1)*30)
+    if not pg.rows: await say(message, T[l][f"{category}s_empty"]); return
+    await say(message, _complaints_text(l, category, page, pg.rows), reply_markup=kb_pager(category, page, pg))
+
+@dp.message(Command("complaints"))
+async def cmd_complaints(message: Message):
+    if not is_admin(message): return
+    await _send_complaints(message, "complaint")
 
 @dp.message(Command("suggestions"))
 async def cmd_suggestions(message: Message):
     if not is_admin(message): return
-    l = lang_of(message)
-    args = (message.text or "").split()
-    page = int(args[1]) if len(args)>1 and args[1].isdigit() else 1
-    rows = list_complaints("suggestion", limit=30, offset=(page-1)*30)
-    if not rows: await say(message, T[l]["suggestions_empty"]); return
-    lines = [T[l]["suggestions_title"].format(page=page)]
-    for r in rows:
-        _id, ticket, uid, un, fn, cat, textval, ftype, status, created = r
-        preview = (textval or "").replace("\n"," ")
-        if len(preview) > 120: preview = preview[:117] + "…"
-        un = f"@{un}" if un else "-"
-        lines.append(f"{ticket} | <code>{uid}</code> {un} | {status} | {created:%Y-%m-%d %H:%M}\n— {preview}")
-    await say(message, "\n".join(lines))
+    await _send_complaints(message, "suggestion")
+
+@dp.callback_query(F.data.startswith("pg:"))
+async def on_page(cb: CallbackQuery):
+    if cb.from_user.id not in ADMIN_IDS: await cb.answer(); return
+    lang = await get_user_lang(cb.from_user.id) or "ru"
+    _, code, direction, page, token = cb.data.split(":", 4)
+    category = PAGE_CAT.get(code, "complaint")
+    kw = {"after": token} if direction == "n" else {"before": token}
+    try:
+        pg = await list_complaints_page(category, limit=30, **kw)
+    except ValueError:
+        await cb.answer(); return
+    if not pg.rows: await cb.answer(T[lang][f"{category}s_empty"]); return
+    page = max(1, int(page))
+    await safe_edit_text(cb.message, _complaints_text(lang, category, page, pg.rows), reply_markup=kb_pager(category, page, pg))
+    await cb.answer()
+
+# /search <текст> — полнотекстовый поиск по всем обращениям, по релевантности.
+# Текст запроса в callback_data не помещается: кнопки несут короткий ключ,
+# сам запрос хранится в БД (search_queries, миграция 0018) — листание работает
+# в любой реплике и после перезапуска.
+def _search_text(l: str, q: str, page: int, pg) -> str:
+    out = _complaints_text(l, "complaint", page, pg.rows, T[l]["search_title"].format(q=html.escape(q), page=page))
+    return out + "\n\n" + T[l]["search_truncated"].format(n=SEARCH_WINDOW) if pg.truncated else out
+
+def kb_search_pager(key: str, page: int, pg):
+    if not (pg.prev or pg.next):
+        return None
+    kb = InlineKeyboardBuilder()
+    if pg.prev: kb.button(text="←", callback_data=f"sr:{key}:p:{page-1}:{pg.prev}")
+    if pg.next: kb.button(text="→", callback_data=f"sr:{key}:n:{page+1}:{pg.next}")
+    return kb.as_markup()
+
+@dp.message(Command("search"))
+async def cmd_search(message: Message):
+    if not is_admin(message): return
+    l = await lang_of(message)
+    parts = (message.text or "").split(maxsplit=1)
+    q = parts[1].strip() if len(parts) > 1 else ""
+    if not q: await message.reply(T[l]["search_usage"]); return
+    pg = await search_complaints_page(q, limit=20)
+    if not pg.rows: await say(message, T[l]["search_empty"]); return
+    key = await save_search_query(q) if pg.prev or pg.next else ""
+    await say(message, _search_text(l, q, 1, pg), reply_markup=kb_search_pager(key, 1, pg))
+
+@dp.callback_query(F.data.startswith("sr:"))
+async def on_search_page(cb: CallbackQuery):
+    if cb.from_user.id not in ADMIN_IDS: await cb.answer(); return
+    lang = await get_user_lang(cb.from_user.id) or "ru"
+    _, key, direction, page, token = cb.data.split(":", 4)
+    q = await get_search_query(key)
+    if q is None:
+        await cb.answer(T[lang]["search_usage"]); return
+    kw = {"after": token} if direction == "n" else {"before": token}
+    try:
+        pg = await search_complaints_page(q, limit=20, **kw)
+    except ValueError:
+        await cb.answer(); return
+    if not pg.rows: await cb.answer(T[lang]["search_empty"]); return
+    page = max(1, int(page))
+    await safe_edit_text(cb.message, _search_text(lang, q, page, pg), reply_markup=kb_search_pager(key, page, pg))
+    await cb.answer()
 
 @dp.message(Command("blocked"))
 async def cmd_blocked(message: Message):
     if not is_admin(message): return
-    l = lang_of(message)
+    l = await lang_of(message)
     args = (message.text or "").split()
     page = int(args[1]) if len(args)>1 and args[1].isdigit() else 1
-    rows = list_blocked(limit=50, offset=(page-1)*50)
+    rows = await list_blocked(limit=50, offset=(page-1)*50)
     if not rows: await say(message, T[l]["blocked_empty"]); return
     lines = [T[l]["blocked_list_title"].format(page=page)]
     for uid, reason, ts in rows:
@@ -385,170 +495,239 @@ async def cmd_blocked(message: Message):
 @dp.message(Command("block"))
 async def cmd_block(message: Message):
     if not is_admin(message): return
-    l = lang_of(message)
+    l = await lang_of(message)
     uid = _extract_target_uid(message)
     reason = None
     parts = (message.text or "").split(maxsplit=2)
     if len(parts) == 3: reason = parts[2]
     if not uid: await message.reply(T[l]["block_usage"]); return
     if uid in ADMIN_IDS: await message.reply(T[l]["cant_block_admin"]); return
-    block_user(uid, reason)
+    await block_user(uid, reason)
     await message.reply(T[l]["blocked_ok"].format(uid=uid, reason=reason or "-"))
 
 @dp.message(Command("unblock"))
 async def cmd_unblock(message: Message):
     if not is_admin(message): return
-    l = lang_of(message)
+    l = await lang_of(message)
     uid = _extract_target_uid(message)
     if not uid: await message.reply(T[l]["unblock_usage"]); return
-    unblock_user(uid)
+    await unblock_user(uid)
     await message.reply(T[l]["unblocked_ok"].format(uid=uid))
 
 @dp.message(Command("setstatus"))
 async def cmd_setstatus(message: Message):
     if not is_admin(message): return
-    l = lang_of(message)
+    l = await lang_of(message)
     parts = (message.text or "").split()
     if len(parts) != 3 or parts[2] not in ("new","in_progress","done"):
         await message.reply(T[l]["status_usage"]); return
     ticket, status = parts[1], parts[2]
-    row = get_by_ticket(ticket)
+    row = await get_by_ticket(ticket)
     if not row:
         await message.reply("Ticket not found"); return
-    _id, _ticket, uid, _st = row
-    set_status(ticket, status)
+    await set_status(ticket, status)
     await message.reply(T[l]["status_ok"].format(ticket=ticket, status=status))
-    try:
-        await bot.send_message(uid, T[l]["status_notify"].format(ticket=ticket, status=status))
-    except Exception:
-        pass
+    notifier.wake()  # уведомление автору уже в status_notices, дальше — через outbox
+
+@dp.message(Command("stats"))
+async def cmd_stats(message: Message):
+    if not is_admin(message): return
+    l = await lang_of(message)
+    await say(message, T[l]["stats"].format(**await stats_counts()))
+
+@dp.message(Command("cache"))
+async def cmd_cache(message: Message):
+    if not is_admin(message): return
+    lines = ["🗄 Cache:"]
+    for name, st in cache_stats().items():
+        lines.append(f"• {name}: hit {st['hit_rate']:.1%} ({st['hits']}/{st['hits']+st['misses']}), size {st['size']}, inv {st['invalidations']}")
+    await say(message, "\n".join(lines))
 
 @dp.message(Command("export"))
 async def cmd_export(message: Message):
     if not is_admin(message): return
-    l = lang_of(message)
+    l = await lang_of(message)
     parts = (message.text or "").split()
-    if len(parts) != 2 or parts[1] not in ("complaints","suggestions","users"):
+    opts = parts[2:]
+    fmt = next((o for o in opts if o in export.FORMATS), "csv")
+    gz = "gz" in opts
+    if len(parts) < 2 or parts[1] not in ("complaints","suggestions","users") or not set(opts) <= {*export.FORMATS, "gz"}:
         await message.reply(T[l]["export_usage"]); return
     what = parts[1]
     await message.reply(T[l]["export_done"])
-    buf = io.StringIO()
-    writer = csv.writer(buf)
-    filename = f"{what}_{datetime.datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.csv"
-    if what == "users":
-        rows = list_users(limit=100000, offset=0)
-        writer.writerow(["user_id","username","full_name","last_activity","total_messages"])
-        for uid, username, full_name, last, total in rows:
-            writer.writerow([uid, username or "", full_name or "", last, total])
-    else:
-        cat = "complaint" if what=="complaints" else "suggestion"
-        rows = list_complaints(cat, limit=100000, offset=0)
-        writer.writerow(["ticket_no","user_id","username","full_name","category","status","created_at","message_text","file_type"])
-        for r in rows:
-            _id, ticket, uid, un, fn, category, textval, ftype, status, created = r
-            writer.writerow([ticket, uid, un or "", fn or "", category, status, created, (textval or "").replace("\n"," "), ftype or ""])
-    data = buf.getvalue().encode("utf-8")
-    from tempfile import NamedTemporaryFile
-    with NamedTemporaryFile("wb", delete=False, suffix=".csv") as f:
-        f.write(data)
-        temp_path = f.name
-    await message.answer_document(FSInputFile(temp_path, filename=filename))
+    # выгрузка идёт потоком во временный файл (без лимита строк), файл удаляется после отправки
+    from tempfile import mkstemp
+    fd, temp_path = mkstemp(suffix=".export")
+    os.close(fd)
+    try:
+        size = await run_db(export.export_to_file, temp_path, what, fmt, gz)
+        if size > TG_UPLOAD_LIMIT:
+            await message.reply(T[l]["export_too_big"].format(mb=round(size / 2**20))); return
+        await message.answer_document(FSInputFile(temp_path, filename=export.filename(what, fmt, gz)))
+    finally:
+        os.remove(temp_path)
+
+# текст уходит как есть (без HTML-разметки), язык — по user_profile.lang
+@dp.message(Command("broadcast"))
+async def cmd_broadcast(message: Message):
+    if not is_admin(message): return
+    l = await lang_of(message)
+    parts = (message.text or "").split(maxsplit=1)
+    if len(parts) < 2:
+        rows = await list_broadcasts(5)
+        lines = [T[l]["broadcast_usage"]] + [
+            T[l]["broadcast_row"].format(id=r.id, status=r.status, queued=r.queued, delivered=r.delivered, failed=r.failed)
+            for r in rows]
+        await say(message, "\n".join(lines)); return
+    try:
+        bid = await create_broadcast(parse_texts(parts[1]), message.from_user.id)
+    except ValueError as e:
+        await message.reply(f"{html.escape(str(e))}\n{T[l]['broadcast_usage']}"); return
+    broadcaster.wake()
+    await message.reply(T[l]["broadcast_started"].format(id=bid))
+
+@dp.message(Command("broadcast_cancel"))
+async def cmd_broadcast_cancel(message: Message):
+    if not is_admin(message): return
+    l = await lang_of(message)
+    parts = (message.text or "").split()
+    if len(parts) != 2 or not parts[1].lstrip("#").isdigit():
+        await message.reply(T[l]["broadcast_usage"]); return
+    bid = int(parts[1].lstrip("#"))
+    ok = await cancel_broadcast(bid)
+    await message.reply(T[l]["broadcast_cancelled" if ok else "broadcast_not_running"].format(id=bid))
 
 # ===== Submissions =====
-async def handle_payload(message: Message, text_value: str, file_type=None, file_id=None):
-    l = lang_of(message)
+async def handle_payload(message: Message, text_value: str, file_type=None, file_id=None, file_unique_id=None):
+    l = await lang_of(message)
 
-    if is_blocked(message.from_user.id):
+    # блокировка берётся из кэша (NOTIFY сбрасывает его сразу), hotline_submit проверяет ещё раз
+    if await is_blocked(message.from_user.id):
+        metrics.REJECTIONS.labels("blocked").inc()
         await message.reply(T[l]["blocked"]); return
 
     if text_value and URL_RE.search(text_value):
+        metrics.REJECTIONS.labels("link").inc()
         await message.reply(T[l]["link_block"]); return
 
-    category = get_user_category(message.from_user.id)
+    uid = message.from_user.id
+    category = await get_user_category(uid)
     if category not in ("complaint", "suggestion"):
         await message.reply(T[l]["select_category"], reply_markup=kb_menu(l)); return
+    wait = await limiter.hit(uid, category)
+    if wait:
+        metrics.REJECTIONS.labels("rate_limited").inc()
+        await message.reply(T[l]["rate_limited"].format(sec=wait)); return
 
-    now = datetime.datetime.utcnow()
-    last = last_submit_time(message.from_user.id)
-    if last:
-        delta = (now - last).total_seconds()
-        if delta < RATE_LIMIT_SECONDS:
-            await message.reply(T[l]["rate_limited"].format(sec=int(RATE_LIMIT_SECONDS - delta))); return
-
-    file_url = None
-    if file_id and file_type in ("photo","document","voice","video"):
-        file_url = await tg_file_to_s3(file_id, key_prefix=f"{message.from_user.id}/{now.strftime('%Y%m%d')}")
-
-    ticket = insert_complaint(
-        user_id=message.from_user.id,
-        username=message.from_user.username,
-        full_name=f"{message.from_user.full_name}",
-        category=category,
-        message_text=text_value or "",
-        file_type=file_type,
-        file_id=file_id,
-        file_url=file_url
-    )
-    touch_rate_limit(message.from_user.id, now)
+    try:
+        res = await submit_complaint(
+            user_id=uid,
+            username=message.from_user.username,
+            full_name=f"{message.from_user.full_name}",
+            message_text=text_value or "",
+            file_type=file_type,
+            file_id=file_id,
+            file_unique_id=file_unique_id,
+            rate_limit_seconds=limiter.window_for(category) if limiter.durable else 0
+        )
+    except Exception:
+        await limiter.refund(uid, category)
+        raise
+    if res.outcome != "saved":
+        # попытка не состоялась (блокировка, категория сброшена) — слот возвращается
+        await limiter.refund(uid, category)
+        metrics.REJECTIONS.labels(res.outcome).inc()
+    if res.outcome == "blocked":
+        await message.reply(T[l]["blocked"]); return
+    if res.outcome == "no_category":
+        await message.reply(T[l]["select_category"], reply_markup=kb_menu(l)); return
+    if res.outcome == "rate_limited":
+        await message.reply(T[l]["rate_limited"].format(sec=res.wait_sec)); return
+    ticket, category = res.ticket, res.category
 
     await message.reply(T[l]["saved"].format(ticket=ticket))
+    if file_id:
+        media_worker.wake()  # задание уже в media_jobs (триггер), если файл не встречался раньше
     if MOD_CHAT_ID != 0:
-        try:
-            await message.send_copy(chat_id=MOD_CHAT_ID)
-        except Exception:
-            await bot.send_message(MOD_CHAT_ID, f"New {category} {ticket}:\n{text_value or ''}")
+        # копия модераторам — через outbox, ответ пользователю её не ждёт
+        await enqueue_outbox([OutboxMessage(MOD_CHAT_ID, "copy", {
+            "from_chat_id": message.chat.id, "message_id": message.message_id,
+            "fallback": f"New {category} {ticket}:\n{text_value or ''}"}, PRIORITY_NOTICE)])
+        outbox.wake()
 
 @dp.message(F.photo)
 async def handle_photo(message: Message):
-    file_id = message.photo[-1].file_id
+    photo = message.photo[-1]
     caption = message.caption or ""
-    await handle_payload(message, caption, file_type="photo", file_id=file_id)
+    await handle_payload(message, caption, file_type="photo", file_id=photo.file_id, file_unique_id=photo.file_unique_id)
 
 @dp.message(F.document)
 async def handle_doc(message: Message):
     name = message.document.file_name or ""
     caption = message.caption or name
-    await handle_payload(message, caption, file_type="document", file_id=message.document.file_id)
+    await handle_payload(message, caption, file_type="document", file_id=message.document.file_id,
+                         file_unique_id=message.document.file_unique_id)
 
 @dp.message(F.voice)
 async def handle_voice(message: Message):
-    await handle_payload(message, "voice", file_type="voice", file_id=message.voice.file_id)
+    await handle_payload(message, "voice", file_type="voice", file_id=message.voice.file_id,
+                         file_unique_id=message.voice.file_unique_id)
 
 @dp.message(F.video)
 async def handle_video(message: Message):
     caption = message.caption or "video"
-    await handle_payload(message, caption, file_type="video", file_id=message.video.file_id)
+    await handle_payload(message, caption, file_type="video", file_id=message.video.file_id,
+                         file_unique_id=message.video.file_unique_id)
+
+def render_status_notice(lang: str | None, items) -> str:
+    l = lang if lang in T else "ru"
+    if len(items) == 1:
+        return T[l]["status_notify"].format(ticket=items[0][0], status=items[0][1])
+    return T[l]["status_notify_many"].format(
+        lines="\n".join(f"• <b>{html.escape(ticket)}</b>: <b>{status}</b>" for ticket, status in items))
+
+notifier = StatusNotifier(render_status_notice, outbox)
+dp.startup.register(notifier.start)
+dp.shutdown.register(notifier.stop)
+
+def render_broadcast_done(lang: str | None, row) -> str:
+    l = lang if lang in T else "ru"
+    return T[l]["broadcast_done"].format(id=row.id, delivered=row.delivered, failed=row.failed, queued=row.queued)
+
+broadcaster = BroadcastRunner(render_broadcast_done, outbox)
+dp.startup.register(broadcaster.start)
+dp.shutdown.register(broadcaster.stop)
+
+# секции complaints наперёд (partitions.py); архивация — manage.py archive
+partition_keeper = PartitionKeeper()
+dp.startup.register(partition_keeper.start)
+dp.shutdown.register(partition_keeper.stop)
+
+# действие из BUTTONS -> обработчик; обработчики объявлены выше, таблица — после них
+ROUTES = MappingProxyType({
+    "complaint": cmd_complaint, "suggestion": cmd_suggestion, "my": cmd_my, "about": cmd_about, "lang": cmd_lang,
+    "admin:complaints": cmd_complaints, "admin:suggestions": cmd_suggestions,
+    "admin:users": cmd_users, "admin:stats": cmd_stats,
+})
+assert set(ROUTES) == set(BUTTONS.values()), "BUTTONS and ROUTES disagree"
+
+# после регистрации всех обработчиков: время и ошибки каждого (metrics.py)
+metrics.instrument_dispatcher(dp)
 
 async def on_startup():
-    wait_db()
-    init_db()
+    await wait_db()
+    await init_db()
+    start_cache_listener()
 
 def main():
     asyncio.run(on_startup())
-    dp.run_polling(bot)
+    metrics.serve()
+    if BOT_MODE == "webhook":
+        from webhook import run_webhook
+        run_webhook(dp, bot)
+    else:
+        dp.run_polling(bot)
 
 if __name__ == "__main__":
     main()
 
-
-# ===== Admin Quick Buttons (reply keyboard) =====
-@dp.message(F.text.in_({"📥 Жалобы", "📥 Shikoyatlar"}))
-async def goto_complaints(message: Message):
-    if not is_admin(message): return
-    # mimic /complaints
-    await cmd_complaints(message)
-
-@dp.message(F.text.in_({"💡 Предложения", "💡 Takliflar"}))
-async def goto_suggestions(message: Message):
-    if not is_admin(message): return
-    await cmd_suggestions(message)
-
-@dp.message(F.text.in_({"👥 Пользователи", "👥 Foydalanuvchilar"}))
-async def goto_users(message: Message):
-    if not is_admin(message): return
-    await cmd_users(message)
-
-@dp.message(F.text.in_({"📊 Статистика", "📊 Statistika"}))
-async def goto_stats(message: Message):
-    if not is_admin(message): return
-    await cmd_stats(message)
@@ -0,0 +1,146 @@
+import argparse
+
+import db, partitions
+
+def cmd_migrate(args):
+    db.wait_db()
+    applied = db.migrate(target=args.target)
+    print("applied:", ", ".join(f"{v:04d}" for v in applied) if applied else "nothing to do")
+
+def cmd_status(args):
+    db.wait_db()
+    with db.get_engine().connect() as conn:
+        try:
+            done = db.applied_versions(conn)
+        except Exception:
+            done = set()
+    for version, name, _ in db.list_migrations():
+        print(f"{version:04d} {name:<30} {'applied' if version in done else 'pending'}")
+
+def cmd_users_check(args):
+    db.wait_db()
+    rows = db.check_user_summary(limit=args.limit)
+    for uid, exp_total, act_total, exp_last, act_last in rows:
+        print(f"{uid}: total {act_total} (expected {exp_total}), last {act_last} (expected {exp_last})")
+    print("user_summary: OK" if not rows else f"user_summary: {len(rows)} mismatched users")
+    if rows and args.fix:
+        print("rebuilt:", db.rebuild_user_summary(), "users")
+    raise SystemExit(1 if rows and not args.fix else 0)
+
+def cmd_users_rebuild(args):
+    db.wait_db()
+    print("rebuilt:", db.rebuild_user_summary(), "users")
+
+def cmd_stats_rebuild(args):
+    db.wait_db()
+    print("rebuilt:", db.rebuild_stats(), "stats_daily rows")
+
+def cmd_media_status(args):
+    db.wait_db()
+    st = db.media_job_stats()
+    print(f"pending {st['pending']}, running {st['running']}, failed {st['failed']}, oldest {st['oldest_sec']}s")
+    for jid, ticket, uid, ftype, _fid, _fuid, attempts, _created, _st, _run, err, updated in db.list_media_jobs("failed", args.limit):
+        print(f"#{jid} {ticket} {ftype} user {uid}: {attempts} attempts, {updated}: {err}")
+    d = db.media_dedupe_stats()
+    print(f"media: {d['objects']} objects, {d['bytes_stored']} bytes; reused {d['reuses']} times "
+          f"({d['bytes_saved_transfer']} bytes not transferred), {d['dupes']} duplicates "
+          f"({d['bytes_saved_storage']} bytes not stored)")
+
+def cmd_media_retry(args):
+    db.wait_db()
+    print("retried:", db.retry_media_jobs(args.ids or None), "jobs")
+
+def cmd_partitions(args):
+    db.wait_db()
+    created = db.ensure_partitions(args.ahead)
+    print("created:", ", ".join(created) if created else "nothing to do")
+    for p in db.list_partitions():
+        rows = f"~{p.rows}" if p.rows >= 0 else "?"
+        print(f"{p.name} {'attached' if p.attached else 'DETACHED'}: {rows} rows, {p.size_bytes // 1024} KB")
+
+def cmd_archive(args):
+    db.wait_db()
+    try:
+        items = partitions.archive(args.keep_months, args.export_dir, args.drop, args.delete_media, args.dry_run)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    for it in items:
+        line = f"{it['name']}: {it['rows']} rows"
+        if args.dry_run:
+            line += ", to detach" if it["attached"] else ", detached earlier"
+        if it.get("file"):
+            line += f", exported to {it['file']}"
+        if "media_deleted" in it:
+            line += f", media deleted {it['media_deleted']}"
+            if it.get("media_failed"):
+                line += f" (S3 failed {it['media_failed']})"
+        if it.get("dropped"):
+            line += ", dropped"
+        print(line)
+    print(f"{len(items)} partitions" + (" (dry run)" if args.dry_run else ""))
+
+def cmd_replicas(args):
+    if not db.DATABASE_REPLICA_URLS:
+        raise SystemExit("DATABASE_REPLICA_URLS is not set")
+    db.wait_db()
+    bad = 0
+    for r in db.check_replicas():
+        if r.lag is None:
+            state, bad = f"unavailable: {r.error}", bad + 1
+        else:
+            state = f"lag {r.lag:.3f}s" + ("" if r.lag <= db.DB_REPLICA_MAX_LAG_SEC else
+                                          f", over DB_REPLICA_MAX_LAG_SEC={db.DB_REPLICA_MAX_LAG_SEC:g}")
+        print(f"{r.name}: {state}")
+    if bad:
+        raise SystemExit(1)
+
+def main():
+    ap = argparse.ArgumentParser(description="Hotline maintenance")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("migrate", help="применить миграции из bot/migrations")
+    p.add_argument("--target", type=int, default=None)
+    p.set_defaults(fn=cmd_migrate)
+
+    p = sub.add_parser("status", help="список миграций и их состояние")
+    p.set_defaults(fn=cmd_status)
+
+    p = sub.add_parser("users-check", help="сверить user_summary с complaints")
+    p.add_argument("--limit", type=int, default=100)
+    p.add_argument("--fix", action="store_true", help="пересобрать при расхождениях")
+    p.set_defaults(fn=cmd_users_check)
+
+    p = sub.add_parser("users-rebuild", help="пересобрать user_summary целиком")
+    p.set_defaults(fn=cmd_users_rebuild)
+
+    p = sub.add_parser("stats-rebuild", help="пересобрать дневной роллап stats_daily")
+    p.set_defaults(fn=cmd_stats_rebuild)
+
+    p = sub.add_parser("media-status", help="очередь загрузки вложений и упавшие задания")
+    p.add_argument("--limit", type=int, default=20)
+    p.set_defaults(fn=cmd_media_status)
+
+    p = sub.add_parser("media-retry", help="вернуть упавшие задания в очередь")
+    p.add_argument("ids", nargs="*", type=int, help="id заданий (по умолчанию все упавшие)")
+    p.set_defaults(fn=cmd_media_retry)
+
+    p = sub.add_parser("partitions", help="создать секции complaints наперёд и показать список")
+    p.add_argument("--ahead", type=int, default=db.PARTITIONS_AHEAD, help="месяцев вперёд")
+    p.set_defaults(fn=cmd_partitions)
+
+    p = sub.add_parser("archive", help="отсоединить и архивировать месяцы старше --keep-months")
+    p.add_argument("--keep-months", type=int, required=True, help="сколько прошлых месяцев оставить (кроме текущего)")
+    p.add_argument("--export-dir", default=None, help="выгрузить каждый месяц в DIR/complaints_YYYY_MM.csv.gz")
+    p.add_argument("--drop", action="store_true", help="удалить отсоединённые таблицы (нужен --export-dir)")
+    p.add_argument("--delete-media", action="store_true", help="удалить из S3 вложения архивных месяцев (нужен --drop)")
+    p.add_argument("--dry-run", action="store_true", help="только показать, что будет архивировано")
+    p.set_defaults(fn=cmd_archive)
+
+    p = sub.add_parser("replicas", help="проверить реплики из DATABASE_REPLICA_URLS: доступность и отставание")
+    p.set_defaults(fn=cmd_replicas)
+
+    args = ap.parse_args()
+    args.fn(args)
+
+if __name__ == "__main__":
+    main()
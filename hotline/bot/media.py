@@ -0,0 +1,289 @@
+import os, time, random, socket, asyncio, hashlib, logging
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+
+try:
+    from . import adb, metrics
+except ImportError:
+    import adb, metrics
+
+# Загрузка вложений в S3 вынесена из handle_payload в фоновые задания
+# (таблица media_jobs, создаются триггером при вставке обращения).
+# Воркер работает внутри процесса бота либо отдельно: python media.py
+# (нужны BOT_TOKEN и DATABASE_URL). Упавшие задания: manage.py media-status / media-retry.
+S3_ENDPOINT = os.getenv("S3_ENDPOINT")
+S3_BUCKET   = os.getenv("S3_BUCKET")
+S3_REGION   = os.getenv("S3_REGION")
+S3_ACCESS   = os.getenv("S3_ACCESS_KEY")
+S3_SECRET   = os.getenv("S3_SECRET_KEY")
+S3_USE_SSL  = os.getenv("S3_USE_SSL","true").lower() == "true"
+
+MEDIA_WORKERS      = int(os.getenv("MEDIA_WORKERS", "4"))
+MEDIA_POLL_SEC     = float(os.getenv("MEDIA_POLL_SEC", "5"))
+MEDIA_LEASE_SEC    = int(os.getenv("MEDIA_LEASE_SEC", "300"))
+MEDIA_MAX_ATTEMPTS = int(os.getenv("MEDIA_MAX_ATTEMPTS", "8"))
+MEDIA_BACKOFF_BASE = float(os.getenv("MEDIA_BACKOFF_BASE", "10"))
+MEDIA_BACKOFF_MAX  = float(os.getenv("MEDIA_BACKOFF_MAX", "3600"))
+MEDIA_DRAIN_SEC    = float(os.getenv("MEDIA_DRAIN_SEC", "20"))
+
+# Передача потоком: файл из Telegram читается кусками MEDIA_CHUNK_SIZE и
+# уходит в S3 частями multipart по MEDIA_PART_SIZE (минимум S3 — 5 МБ), не
+# больше MEDIA_PARTS_INFLIGHT частей одновременно. Память на одну передачу —
+# около MEDIA_PART_SIZE * (MEDIA_PARTS_INFLIGHT + 1) независимо от размера файла.
+MEDIA_CHUNK_SIZE      = int(os.getenv("MEDIA_CHUNK_SIZE", str(256 * 1024)))
+MEDIA_PART_SIZE       = max(5 * 1024 * 1024, int(os.getenv("MEDIA_PART_SIZE", str(8 * 1024 * 1024))))
+MEDIA_PARTS_INFLIGHT  = int(os.getenv("MEDIA_PARTS_INFLIGHT", "2"))
+MEDIA_DOWNLOAD_TIMEOUT = int(os.getenv("MEDIA_DOWNLOAD_TIMEOUT", "300"))
+
+log = logging.getLogger("hotline.media")
+
+def s3_enabled() -> bool:
+    return all([S3_ENDPOINT, S3_BUCKET, S3_ACCESS, S3_SECRET])
+
+def s3_key(job) -> str:
+    # file_unique_id одинаков для одного файла во всех чатах; старые задания без него — прежняя схема
+    if job.file_unique_id:
+        return f"media/{job.file_unique_id}"
+    return f"{job.user_id}/{job.created_at.strftime('%Y%m%d')}/{job.file_id}"
+
+def public_url(key: str) -> str:
+    return f"{S3_ENDPOINT.rstrip('/')}/{S3_BUCKET}/{key}"
+
+_s3 = None
+
+def get_s3():
+    # boto3-клиент потокобезопасен: один на процесс, а не новый на каждый файл.
+    # Пул соединений рассчитан на все воркеры с их частями в полёте.
+    global _s3
+    if _s3 is None:
+        import boto3
+        from botocore.config import Config
+        _s3 = boto3.client("s3", endpoint_url=S3_ENDPOINT, aws_access_key_id=S3_ACCESS, aws_secret_access_key=S3_SECRET,
+                           region_name=S3_REGION, use_ssl=S3_USE_SSL,
+                           config=Config(max_pool_connections=max(10, MEDIA_WORKERS * MEDIA_PARTS_INFLIGHT),
+                                         retries={"max_attempts": 3, "mode": "standard"}))
+    return _s3
+
+async def stream_telegram(bot: Bot, file_id: str, chunk_size: int = MEDIA_CHUNK_SIZE):
+    file = await bot.get_file(file_id)
+    url = bot.session.api.file_url(bot.token, file.file_path)
+    async for chunk in bot.session.stream_content(url, timeout=MEDIA_DOWNLOAD_TIMEOUT, chunk_size=chunk_size):
+        yield chunk
+
+class Digest:
+    # sha256 и размер считаются на лету, пока куски идут в S3
+    def __init__(self):
+        self.sha = hashlib.sha256()
+        self.size = 0
+
+    async def wrap(self, chunks):
+        async for chunk in chunks:
+            self.sha.update(chunk)
+            self.size += len(chunk)
+            yield chunk
+
+    def hexdigest(self) -> str:
+        return self.sha.hexdigest()
+
+async def delete_object(key: str):
+    await asyncio.to_thread(get_s3().delete_object, Bucket=S3_BUCKET, Key=key)
+
+def delete_objects(keys: list[str], batch: int = 1000) -> list[str]:
+    # DeleteObjects — до 1000 ключей за запрос (архивация, partitions.py); -> ключи, которые S3 не удалил
+    failed = []
+    for i in range(0, len(keys), batch):
+        resp = get_s3().delete_objects(Bucket=S3_BUCKET, Delete={"Objects": [{"Key": k} for k in keys[i:i + batch]],
+                                                                 "Quiet": True})
+        failed += [e["Key"] for e in resp.get("Errors", [])]
+    return failed
+
+async def upload_stream(chunks, key: str, part_size: int = MEDIA_PART_SIZE,
+                        inflight: int = MEDIA_PARTS_INFLIGHT) -> str:
+    # Файл меньше одной части уходит одним put_object, иначе — multipart;
+    # при любой ошибке незавершённая загрузка отменяется (abort), чтобы не копить части в бакете
+    s3 = get_s3()
+    buf = bytearray()
+    upload_id, number, parts, pending = None, 0, [], set()
+
+    async def send_part(data: bytes, n: int):
+        resp = await asyncio.to_thread(s3.upload_part, Bucket=S3_BUCKET, Key=key, UploadId=upload_id,
+                                       PartNumber=n, Body=data)
+        parts.append({"PartNumber": n, "ETag": resp["ETag"]})
+
+    async def submit(data: bytes):
+        nonlocal upload_id, number, pending
+        if upload_id is None:
+            resp = await asyncio.to_thread(s3.create_multipart_upload, Bucket=S3_BUCKET, Key=key, ACL="public-read")
+            upload_id = resp["UploadId"]
+        while len(pending) >= inflight:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                t.result()
+        number += 1
+        pending.add(asyncio.create_task(send_part(data, number)))
+
+    try:
+        async for chunk in chunks:
+            buf += chunk
+            while len(buf) >= part_size:
+                with memoryview(buf) as mv:
+                    data = bytes(mv[:part_size])
+                del buf[:part_size]
+                await submit(data)
+        if upload_id is None:
+            await asyncio.to_thread(s3.put_object, Bucket=S3_BUCKET, Key=key, Body=bytes(buf), ACL="public-read")
+        else:
+            if buf:
+                await submit(bytes(buf))
+            buf.clear()
+            for t in pending:
+                await t
+            pending = set()
+            await asyncio.to_thread(s3.complete_multipart_upload, Bucket=S3_BUCKET, Key=key, UploadId=upload_id,
+                                    MultipartUpload={"Parts": sorted(parts, key=lambda p: p["PartNumber"])})
+    except BaseException:
+        for t in pending:
+            t.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        if upload_id is not None:
+            try:
+                await asyncio.to_thread(s3.abort_multipart_upload, Bucket=S3_BUCKET, Key=key, UploadId=upload_id)
+            except Exception:
+                log.warning("abort_multipart_upload failed for %s", key)
+        raise
+    return public_url(key)
+
+def backoff(attempts: int) -> float:
+    delay = min(MEDIA_BACKOFF_MAX, MEDIA_BACKOFF_BASE * 2 ** max(0, attempts - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+class MediaWorker:
+    # fetch(file_id) -> async-итератор кусков, upload(chunks, key) -> url, remove(key);
+    # подменяются в проверках
+    def __init__(self, bot: Bot | None, workers: int = MEDIA_WORKERS, poll_sec: float = MEDIA_POLL_SEC,
+                 fetch=None, upload=None, remove=None, enabled=s3_enabled):
+        self.bot = bot
+        self.workers = workers
+        self.poll_sec = poll_sec
+        self.fetch = fetch or (lambda file_id: stream_telegram(self.bot, file_id))
+        self.upload = upload or upload_stream
+        self.remove = remove or delete_object
+        self.enabled = enabled
+        self.name = f"{socket.gethostname()}-{os.getpid()}"
+        self.uploaded = self.reused = self.deduped = self.retried = self.failed = 0
+        self._wake = asyncio.Event()
+        self._stopping = False
+        self._tasks: list[asyncio.Task] = []
+
+    def wake(self):
+        self._wake.set()
+
+    async def start(self):
+        self._stopping = False
+        self._tasks = [asyncio.create_task(self._loop(i), name=f"media-worker-{i}") for i in range(self.workers)]
+
+    async def stop(self, timeout: float = MEDIA_DRAIN_SEC):
+        # текущие загрузки доделываются; брошенное задание заберут заново по истечении lease
+        self._stopping = True
+        self._wake.set()
+        if not self._tasks:
+            return
+        _, pending = await asyncio.wait(self._tasks, timeout=timeout)
+        for t in pending:
+            t.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        self._tasks = []
+
+    async def _loop(self, i: int):
+        while not self._stopping:
+            try:
+                jobs = await adb.claim_media_jobs(f"{self.name}/{i}", 1, MEDIA_LEASE_SEC)
+            except Exception:
+                log.exception("claim_media_jobs failed")
+                jobs = []
+            if not jobs:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_sec)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self.process(jobs[0])
+            except Exception:
+                # задание остаётся running и вернётся в очередь по истечении аренды (MEDIA_LEASE_SEC)
+                log.exception("media job %s failed", jobs[0].id)
+
+    async def process(self, job):
+        if not self.enabled():
+            await adb.fail_media_job(job.id, "S3 is not configured", None)
+            self.failed += 1
+            metrics.MEDIA_JOBS.labels("failed").inc()
+            return
+        if job.file_unique_id:
+            ref = await adb.reuse_media(job.file_unique_id)
+            if ref:
+                await adb.complete_media_job(job.id, job.ticket_no, ref.id, ref.url)
+                self.reused += 1
+                metrics.MEDIA_JOBS.labels("reused").inc()
+                return
+        key, digest = s3_key(job), Digest()
+        t0 = time.perf_counter()
+        try:
+            url = await self.upload(digest.wrap(self.fetch(job.file_id)), key)
+        except TelegramBadRequest as e:
+            # файл больше 20 МБ или file_id недействителен — повтор не поможет
+            await adb.fail_media_job(job.id, f"{type(e).__name__}: {e}", None)
+            self.failed += 1
+            metrics.MEDIA_JOBS.labels("failed").inc()
+            return
+        except Exception as e:
+            final = job.attempts >= MEDIA_MAX_ATTEMPTS
+            await adb.fail_media_job(job.id, f"{type(e).__name__}: {e}", None if final else backoff(job.attempts))
+            if final:
+                self.failed += 1
+                log.warning("media job %s (%s) failed: %s", job.id, job.ticket_no, e)
+            else:
+                self.retried += 1
+                log.info("media job %s (%s) will retry: %s", job.id, job.ticket_no, e)
+            metrics.MEDIA_JOBS.labels("failed" if final else "retried").inc()
+            return
+        metrics.S3_SECONDS.observe(time.perf_counter() - t0)
+        metrics.S3_BYTES.observe(digest.size)
+        ref = await adb.register_media(digest.hexdigest(), digest.size, key, url, job.file_type, job.file_unique_id)
+        if not ref.inserted and ref.s3_key != key:
+            # то же содержимое уже хранится под другим ключом — свою копию удаляем
+            try:
+                await self.remove(key)
+            except Exception:
+                log.warning("failed to delete duplicate object %s", key)
+            self.deduped += 1
+            metrics.MEDIA_JOBS.labels("deduped").inc()
+        await adb.complete_media_job(job.id, job.ticket_no, ref.id, ref.url)
+        self.uploaded += 1
+        metrics.MEDIA_JOBS.labels("uploaded").inc()
+
+    def stats(self) -> dict:
+        return {"workers": len(self._tasks), "uploaded": self.uploaded, "reused": self.reused,
+                "deduped": self.deduped, "retried": self.retried, "failed": self.failed}
+
+async def main():
+    logging.basicConfig(level=logging.INFO)
+    await adb.wait_db()
+    await adb.init_db()
+    metrics.serve()
+    bot = Bot(token=os.environ["BOT_TOKEN"])
+    metrics.instrument_bot(bot)
+    worker = MediaWorker(bot)
+    await worker.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await worker.stop()
+        await bot.session.close()
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
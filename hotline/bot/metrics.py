@@ -0,0 +1,166 @@
+import os, sys, time
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest, start_http_server
+
+# Метрики Prometheus для бота и админки (один модуль, общий реестр процесса).
+# Бот отдаёт их отдельным слушателем на METRICS_PORT (serve(), 0 — выключен),
+# админка — на /metrics. Инструментирование:
+#   - обработчики aiogram — внутренний middleware (instrument_dispatcher);
+#   - запросы к Telegram — middleware сессии бота (instrument_bot);
+#   - SQL — события движка SQLAlchemy, метка — функция db.py, из которой
+#     выполнен запрос (instrument_engine); ожидание соединения из пула — TimedQueuePool;
+#     куда ушли чтения и отставание реплик — db.py (get_engine(readonly=True), check_replicas);
+#   - S3, outbox, отказы rate limit / блокировки — счётчики в местах вызова.
+# На апдейт — пара perf_counter и observe по заранее взятому потомку метки.
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9101"))
+METRICS_ADDR = os.getenv("METRICS_ADDR", "0.0.0.0")
+
+LATENCY_BUCKETS  = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+TRANSFER_BUCKETS = (.1, .25, .5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+SIZE_BUCKETS     = tuple(2 ** p for p in range(10, 31, 2))  # 1 КБ .. 1 ГБ
+
+HANDLER_SECONDS = Histogram("hotline_handler_seconds", "aiogram handler latency", ["handler"], buckets=LATENCY_BUCKETS)
+HANDLER_ERRORS  = Counter("hotline_handler_errors_total", "aiogram handler exceptions", ["handler", "error"])
+TG_SECONDS      = Histogram("hotline_tg_request_seconds", "Bot API request latency", ["method"], buckets=LATENCY_BUCKETS)
+TG_ERRORS       = Counter("hotline_tg_request_errors_total", "Bot API request errors", ["method", "error"])
+DB_SECONDS      = Histogram("hotline_db_query_seconds", "SQL statement time by db.py function", ["function"],
+                            buckets=LATENCY_BUCKETS)
+DB_ERRORS       = Counter("hotline_db_errors_total", "SQL statement errors by db.py function", ["function", "error"])
+DB_POOL_WAIT    = Histogram("hotline_db_pool_wait_seconds", "Time to check out a pooled connection", buckets=LATENCY_BUCKETS)
+DB_POOL_IN_USE  = Gauge("hotline_db_pool_checked_out", "Connections checked out of the pool")
+DB_READS        = Counter("hotline_db_reads_total", "Read-only db.py calls by target and routing reason",
+                          ["target", "reason"])
+DB_REPLICA_LAG  = Gauge("hotline_db_replica_lag_seconds", "Replica lag at the last check, NaN if unavailable",
+                        ["replica"])
+S3_SECONDS      = Histogram("hotline_s3_upload_seconds", "Attachment transfer to S3", buckets=TRANSFER_BUCKETS)
+S3_BYTES        = Histogram("hotline_s3_upload_bytes", "Uploaded attachment size", buckets=SIZE_BUCKETS)
+MEDIA_JOBS      = Counter("hotline_media_jobs_total", "Media jobs by result", ["result"])
+OUTBOX_SENDS    = Counter("hotline_outbox_total", "Outbox rows by result", ["result"])
+REJECTIONS      = Counter("hotline_rejections_total", "Submissions rejected before saving", ["reason"])
+HTTP_SECONDS    = Histogram("hotline_http_request_seconds", "Admin HTTP request latency", ["endpoint", "method", "status"],
+                            buckets=LATENCY_BUCKETS)
+
+def serve(port: int = METRICS_PORT, addr: str = METRICS_ADDR):
+    # отдельный поток с HTTP-сервером prometheus_client; event loop бота не трогает
+    if port:
+        start_http_server(port, addr)
+
+def render() -> tuple[bytes, str]:
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+# ===== SQLAlchemy =====
+class TimedQueuePool(QueuePool):
+    # _do_get — место, где QueuePool ждёт свободное соединение (или открывает новое)
+    def _do_get(self):
+        t0 = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_WAIT.observe(time.perf_counter() - t0)
+
+def _caller(owner: dict) -> str:
+    # ближайшая функция модуля owner (db.py) на стеке: _load_user_lang, claim_outbox, ...
+    f = sys._getframe(2)
+    while f is not None:
+        if f.f_globals is owner:
+            return f.f_code.co_name
+        f = f.f_back
+    return "other"
+
+def instrument_engine(engine, owner: dict, primary: bool = True):
+    if primary:
+        DB_POOL_IN_USE.set_function(lambda: engine.pool.checkedout())
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("hotline_t0", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _done(conn, cursor, statement, parameters, context, executemany):
+        t0 = conn.info["hotline_t0"].pop()
+        DB_SECONDS.labels(_caller(owner)).observe(time.perf_counter() - t0)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(ctx):
+        starts = ctx.connection.info.get("hotline_t0") if ctx.connection is not None else None
+        if starts:
+            starts.pop()
+        DB_ERRORS.labels(_caller(owner), type(ctx.original_exception).__name__).inc()
+
+# ===== aiogram =====
+def instrument_dispatcher(dp):
+    from aiogram import BaseMiddleware
+
+    class HandlerMetrics(BaseMiddleware):
+        # внутренний middleware: вызывается только для сработавшего обработчика, data["handler"] — он
+        def __init__(self):
+            self.children = {}
+
+        async def __call__(self, handler, event, data):
+            callback = data["handler"].callback
+            hist = self.children.get(callback)
+            if hist is None:
+                hist = self.children[callback] = HANDLER_SECONDS.labels(callback.__name__)
+            t0 = time.perf_counter()
+            try:
+                return await handler(event, data)
+            except Exception as e:
+                HANDLER_ERRORS.labels(callback.__name__, type(e).__name__).inc()
+                raise
+            finally:
+                hist.observe(time.perf_counter() - t0)
+
+    mw = HandlerMetrics()
+    for name, observer in dp.observers.items():
+        if name not in ("update", "error") and observer.handlers:
+            observer.middleware(mw)
+
+def instrument_bot(bot):
+    from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+
+    class RequestMetrics(BaseRequestMiddleware):
+        def __init__(self):
+            self.children = {}
+
+        async def __call__(self, make_request, bot, method):
+            name = method.__api_method__
+            hist = self.children.get(name)
+            if hist is None:
+                hist = self.children[name] = TG_SECONDS.labels(name)
+            t0 = time.perf_counter()
+            try:
+                return await make_request(bot, method)
+            except Exception as e:
+                TG_ERRORS.labels(name, type(e).__name__).inc()
+                raise
+            finally:
+                hist.observe(time.perf_counter() - t0)
+
+    bot.session.middleware(RequestMetrics())
+
+# ===== ASGI (админка) =====
+class HttpMetrics:
+    # чистый ASGI-middleware: метка — имя функции-обработчика FastAPI (scope["endpoint"]),
+    # а не путь — параметры пути не раздувают число рядов
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = 500
+        t0 = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            endpoint = scope.get("endpoint")
+            HTTP_SECONDS.labels(getattr(endpoint, "__name__", "unmatched"), scope["method"], str(status)) \
+                .observe(time.perf_counter() - t0)
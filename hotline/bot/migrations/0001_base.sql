@@ -0,0 +1,43 @@
+-- Базовая схема (бывший init_db). Все операторы идемпотентны, чтобы
+-- миграция спокойно применялась и к уже существующей базе.
+CREATE TABLE IF NOT EXISTS complaints(
+    id BIGSERIAL PRIMARY KEY,
+    ticket_no TEXT,
+    user_id BIGINT,
+    username TEXT,
+    full_name TEXT,
+    category TEXT CHECK (category in ('complaint','suggestion')) DEFAULT 'complaint',
+    message_text TEXT,
+    file_type TEXT,
+    file_id TEXT,
+    file_url TEXT,
+    status TEXT DEFAULT 'new',
+    created_at TIMESTAMP DEFAULT NOW()
+);
+ALTER TABLE complaints ADD COLUMN IF NOT EXISTS file_url TEXT;
+ALTER TABLE complaints ADD COLUMN IF NOT EXISTS status TEXT DEFAULT 'new';
+ALTER TABLE complaints ADD COLUMN IF NOT EXISTS ticket_no TEXT;
+
+CREATE TABLE IF NOT EXISTS user_state(
+    user_id BIGINT PRIMARY KEY,
+    category TEXT CHECK (category in ('complaint','suggestion')) DEFAULT 'complaint',
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS user_profile(
+    user_id BIGINT PRIMARY KEY,
+    lang TEXT CHECK (lang in ('ru','uz')) DEFAULT 'ru',
+    created_at TIMESTAMP DEFAULT NOW(),
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS blocked_users(
+    user_id BIGINT PRIMARY KEY,
+    reason TEXT,
+    blocked_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS rate_limiter(
+    user_id BIGINT PRIMARY KEY,
+    last_submit_at TIMESTAMP
+);
@@ -0,0 +1,47 @@
+-- Номера заявок: отдельный счётчик на каждый год. UPSERT берёт блокировку строки
+-- года, поэтому параллельные вставки получают разные номера без MAX(id).
+CREATE TABLE IF NOT EXISTS ticket_counters(
+    year INT PRIMARY KEY,
+    last_no BIGINT NOT NULL
+);
+CREATE OR REPLACE FUNCTION hotline_next_ticket(p_year INT) RETURNS TEXT
+LANGUAGE sql AS $fn$
+    WITH c AS (
+        INSERT INTO ticket_counters(year, last_no) VALUES (p_year, 1)
+        ON CONFLICT (year) DO UPDATE SET last_no = ticket_counters.last_no + 1
+        RETURNING last_no
+    )
+    SELECT p_year::text || '-' || repeat('0', GREATEST(0, 6 - length(last_no::text))) || last_no::text FROM c
+$fn$;
+
+-- Данные до счётчика: дубликаты (кроме самой ранней записи) и пустые номера
+-- получают новые номера из счётчика, затем уникальный индекс.
+DO $mig$
+BEGIN
+    IF to_regclass('complaints_ticket_no_uq') IS NOT NULL THEN
+        RETURN;
+    END IF;
+    LOCK TABLE complaints IN SHARE ROW EXCLUSIVE MODE;
+
+    UPDATE complaints SET ticket_no = NULL
+    WHERE id IN (
+        SELECT id FROM (
+            SELECT id, row_number() OVER (PARTITION BY ticket_no ORDER BY id) AS rn
+            FROM complaints WHERE ticket_no IS NOT NULL
+        ) d WHERE d.rn > 1
+    );
+
+    INSERT INTO ticket_counters(year, last_no)
+    SELECT split_part(ticket_no, '-', 1)::int, max(split_part(ticket_no, '-', 2)::bigint)
+    FROM complaints
+    WHERE ticket_no ~ '^[0-9]{4}-[0-9]+$'
+    GROUP BY 1
+    ON CONFLICT (year) DO UPDATE SET last_no = GREATEST(ticket_counters.last_no, EXCLUDED.last_no);
+
+    UPDATE complaints c SET ticket_no = hotline_next_ticket(extract(year FROM c.created_at)::int)
+    FROM (SELECT id FROM complaints WHERE ticket_no IS NULL ORDER BY id) n
+    WHERE c.id = n.id;
+
+    CREATE UNIQUE INDEX complaints_ticket_no_uq ON complaints(ticket_no);
+END
+$mig$;
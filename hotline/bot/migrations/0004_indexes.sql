@@ -0,0 +1,9 @@
+-- Вторичные индексы под запросы db.py:
+--   list_complaints: фильтр по category / user_id, сортировка created_at DESC, id DESC
+--   stats_counts: диапазоны по created_at
+--   get_by_ticket / set_status: complaints_ticket_no_uq (миграция 0002)
+--   list_blocked: сортировка blocked_at DESC
+CREATE INDEX IF NOT EXISTS complaints_category_created_idx ON complaints(category, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS complaints_user_created_idx ON complaints(user_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS complaints_created_idx ON complaints(created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS blocked_users_blocked_at_idx ON blocked_users(blocked_at DESC);
@@ -0,0 +1,3 @@
+-- Keyset-пагинация list_blocked идёт по (blocked_at, user_id): индекс с той же парой.
+DROP INDEX IF EXISTS blocked_users_blocked_at_idx;
+CREATE INDEX IF NOT EXISTS blocked_users_blocked_at_idx ON blocked_users(blocked_at DESC, user_id DESC);
@@ -0,0 +1,67 @@
+-- Агрегат по пользователям вместо GROUP BY по всей complaints в list_users.
+-- Поддерживается триггером на вставку; hotline_rebuild_user_summary()
+-- пересчитывает таблицу целиком (manage.py users-rebuild).
+CREATE TABLE IF NOT EXISTS user_summary(
+    user_id BIGINT PRIMARY KEY,
+    username TEXT,
+    full_name TEXT,
+    last_activity TIMESTAMP NOT NULL,
+    total_messages BIGINT NOT NULL DEFAULT 0,
+    complaints_count BIGINT NOT NULL DEFAULT 0,
+    suggestions_count BIGINT NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS user_summary_last_activity_idx ON user_summary(last_activity DESC, user_id DESC);
+
+CREATE OR REPLACE FUNCTION hotline_user_summary_ins() RETURNS trigger
+LANGUAGE plpgsql AS $fn$
+BEGIN
+    IF NEW.user_id IS NULL THEN
+        RETURN NULL;
+    END IF;
+    INSERT INTO user_summary AS s(user_id, username, full_name, last_activity,
+                                  total_messages, complaints_count, suggestions_count)
+    VALUES (NEW.user_id, NEW.username, NEW.full_name, COALESCE(NEW.created_at, now()), 1,
+            (NEW.category = 'complaint')::int, (NEW.category = 'suggestion')::int)
+    ON CONFLICT (user_id) DO UPDATE SET
+        username          = CASE WHEN EXCLUDED.last_activity >= s.last_activity THEN EXCLUDED.username ELSE s.username END,
+        full_name         = CASE WHEN EXCLUDED.last_activity >= s.last_activity THEN EXCLUDED.full_name ELSE s.full_name END,
+        last_activity     = GREATEST(s.last_activity, EXCLUDED.last_activity),
+        total_messages    = s.total_messages + 1,
+        complaints_count  = s.complaints_count + EXCLUDED.complaints_count,
+        suggestions_count = s.suggestions_count + EXCLUDED.suggestions_count;
+    RETURN NULL;
+END
+$fn$;
+
+DROP TRIGGER IF EXISTS complaints_user_summary_trg ON complaints;
+CREATE TRIGGER complaints_user_summary_trg AFTER INSERT ON complaints
+    FOR EACH ROW EXECUTE FUNCTION hotline_user_summary_ins();
+
+CREATE OR REPLACE FUNCTION hotline_rebuild_user_summary() RETURNS BIGINT
+LANGUAGE plpgsql AS $fn$
+DECLARE
+    n BIGINT;
+BEGIN
+    LOCK TABLE complaints IN SHARE MODE;
+    DELETE FROM user_summary;
+    INSERT INTO user_summary(user_id, username, full_name, last_activity,
+                             total_messages, complaints_count, suggestions_count)
+    SELECT a.user_id, l.username, l.full_name, a.last_activity, a.total, a.complaints, a.suggestions
+    FROM (
+        SELECT user_id, COALESCE(max(created_at), 'epoch') AS last_activity, COUNT(*) AS total,
+               COUNT(*) FILTER (WHERE category = 'complaint') AS complaints,
+               COUNT(*) FILTER (WHERE category = 'suggestion') AS suggestions
+        FROM complaints WHERE user_id IS NOT NULL
+        GROUP BY user_id
+    ) a
+    JOIN (
+        SELECT DISTINCT ON (user_id) user_id, username, full_name
+        FROM complaints WHERE user_id IS NOT NULL
+        ORDER BY user_id, created_at DESC, id DESC
+    ) l USING (user_id);
+    GET DIAGNOSTICS n = ROW_COUNT;
+    RETURN n;
+END
+$fn$;
+
+SELECT hotline_rebuild_user_summary();
@@ -0,0 +1,59 @@
+-- Дневной роллап для статистики: день × категория × статус. Триггер ведёт
+-- счётчики на вставку, смену статуса/категории и удаление, так что
+-- stats_counts читает O(дней) строк вместо COUNT(*) по complaints.
+CREATE TABLE IF NOT EXISTS stats_daily(
+    day DATE NOT NULL,
+    category TEXT NOT NULL,
+    status TEXT NOT NULL,
+    cnt BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, category, status)
+);
+
+CREATE OR REPLACE FUNCTION hotline_stats_bump(p_day DATE, p_category TEXT, p_status TEXT, p_delta INT) RETURNS void
+LANGUAGE sql AS $fn$
+    INSERT INTO stats_daily AS d(day, category, status, cnt)
+    VALUES (p_day, COALESCE(p_category, ''), COALESCE(p_status, ''), p_delta)
+    ON CONFLICT (day, category, status) DO UPDATE SET cnt = d.cnt + EXCLUDED.cnt
+$fn$;
+
+CREATE OR REPLACE FUNCTION hotline_stats_daily_trg() RETURNS trigger
+LANGUAGE plpgsql AS $fn$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM hotline_stats_bump(OLD.created_at::date, OLD.category, OLD.status, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM hotline_stats_bump(NEW.created_at::date, NEW.category, NEW.status, 1);
+    END IF;
+    RETURN NULL;
+END
+$fn$;
+
+DROP TRIGGER IF EXISTS complaints_stats_ins_trg ON complaints;
+CREATE TRIGGER complaints_stats_ins_trg AFTER INSERT OR DELETE ON complaints
+    FOR EACH ROW EXECUTE FUNCTION hotline_stats_daily_trg();
+DROP TRIGGER IF EXISTS complaints_stats_upd_trg ON complaints;
+CREATE TRIGGER complaints_stats_upd_trg AFTER UPDATE OF status, category, created_at ON complaints
+    FOR EACH ROW
+    WHEN (OLD.status IS DISTINCT FROM NEW.status
+          OR OLD.category IS DISTINCT FROM NEW.category
+          OR OLD.created_at IS DISTINCT FROM NEW.created_at)
+    EXECUTE FUNCTION hotline_stats_daily_trg();
+
+CREATE OR REPLACE FUNCTION hotline_rebuild_stats_daily() RETURNS BIGINT
+LANGUAGE plpgsql AS $fn$
+DECLARE
+    n BIGINT;
+BEGIN
+    LOCK TABLE complaints IN SHARE MODE;
+    DELETE FROM stats_daily;
+    INSERT INTO stats_daily(day, category, status, cnt)
+    SELECT created_at::date, COALESCE(category, ''), COALESCE(status, ''), COUNT(*)
+    FROM complaints
+    GROUP BY 1, 2, 3;
+    GET DIAGNOSTICS n = ROW_COUNT;
+    RETURN n;
+END
+$fn$;
+
+SELECT hotline_rebuild_stats_daily();
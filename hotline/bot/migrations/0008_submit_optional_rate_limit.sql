@@ -0,0 +1,41 @@
+-- Rate limit вынесен в подключаемый лимитер (bot/ratelimit.py). Таблица
+-- rate_limiter используется только бэкендом "table": при p_rate_sec <= 0
+-- hotline_submit её не читает и не пишет.
+CREATE OR REPLACE FUNCTION hotline_submit(
+    p_user_id BIGINT, p_username TEXT, p_full_name TEXT, p_text TEXT,
+    p_file_type TEXT, p_file_id TEXT, p_file_url TEXT, p_rate_sec INT,
+    OUT outcome TEXT, OUT ticket TEXT, OUT category TEXT, OUT wait_sec INT)
+LANGUAGE plpgsql AS $fn$
+DECLARE
+    v_now  TIMESTAMP := now() AT TIME ZONE 'utc';
+    v_last TIMESTAMP;
+BEGIN
+    IF EXISTS (SELECT 1 FROM blocked_users WHERE user_id = p_user_id) THEN
+        outcome := 'blocked'; RETURN;
+    END IF;
+
+    SELECT s.category INTO category FROM user_state s WHERE s.user_id = p_user_id;
+    IF category IS NULL OR category NOT IN ('complaint','suggestion') THEN
+        outcome := 'no_category'; RETURN;
+    END IF;
+
+    IF p_rate_sec > 0 THEN
+        INSERT INTO rate_limiter(user_id, last_submit_at) VALUES (p_user_id, NULL)
+        ON CONFLICT (user_id) DO NOTHING;
+        SELECT last_submit_at INTO v_last FROM rate_limiter WHERE user_id = p_user_id FOR UPDATE;
+        IF v_last IS NOT NULL AND extract(epoch FROM v_now - v_last) < p_rate_sec THEN
+            outcome := 'rate_limited';
+            wait_sec := floor(p_rate_sec - extract(epoch FROM v_now - v_last))::int;
+            RETURN;
+        END IF;
+    END IF;
+
+    ticket := hotline_next_ticket(extract(year FROM v_now)::int);
+    INSERT INTO complaints(ticket_no, user_id, username, full_name, category, message_text, file_type, file_id, file_url)
+    VALUES (ticket, p_user_id, p_username, p_full_name, category, p_text, p_file_type, p_file_id, p_file_url);
+    IF p_rate_sec > 0 THEN
+        UPDATE rate_limiter SET last_submit_at = v_now WHERE user_id = p_user_id;
+    END IF;
+    outcome := 'saved';
+END
+$fn$;
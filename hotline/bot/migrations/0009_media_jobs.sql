@@ -0,0 +1,42 @@
+-- Очередь загрузки вложений в S3. Задание создаётся триггером в той же
+-- транзакции, что и обращение, поэтому не теряется при падении бота между
+-- вставкой и загрузкой. Связь с complaints — по ticket_no, без внешнего ключа.
+CREATE TABLE IF NOT EXISTS media_jobs(
+    id BIGSERIAL PRIMARY KEY,
+    ticket_no TEXT NOT NULL,
+    user_id BIGINT,
+    file_type TEXT NOT NULL,
+    file_id TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending','running','done','failed')),
+    attempts INT NOT NULL DEFAULT 0,
+    run_after TIMESTAMP NOT NULL DEFAULT NOW(),
+    locked_by TEXT,
+    locked_at TIMESTAMP,
+    last_error TEXT,
+    file_url TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+-- выборка воркером: только незавершённые задания, по времени запуска
+CREATE INDEX IF NOT EXISTS media_jobs_queue_idx ON media_jobs(run_after, id)
+    WHERE status IN ('pending','running');
+CREATE INDEX IF NOT EXISTS media_jobs_failed_idx ON media_jobs(updated_at DESC, id DESC)
+    WHERE status = 'failed';
+CREATE INDEX IF NOT EXISTS media_jobs_ticket_idx ON media_jobs(ticket_no);
+
+CREATE OR REPLACE FUNCTION hotline_media_job_ins() RETURNS trigger
+LANGUAGE plpgsql AS $fn$
+BEGIN
+    IF NEW.file_id IS NOT NULL AND NEW.file_url IS NULL
+       AND NEW.file_type IN ('photo','document','voice','video') THEN
+        INSERT INTO media_jobs(ticket_no, user_id, file_type, file_id, created_at, run_after)
+        VALUES (NEW.ticket_no, NEW.user_id, NEW.file_type, NEW.file_id,
+                COALESCE(NEW.created_at, now()), now());
+    END IF;
+    RETURN NULL;
+END
+$fn$;
+
+DROP TRIGGER IF EXISTS complaints_media_job_trg ON complaints;
+CREATE TRIGGER complaints_media_job_trg AFTER INSERT ON complaints
+    FOR EACH ROW EXECUTE FUNCTION hotline_media_job_ins();
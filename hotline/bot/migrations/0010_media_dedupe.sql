@@ -0,0 +1,107 @@
+-- Дедупликация вложений. media — один объект в S3 на содержимое (sha256),
+-- media_aliases — все Telegram file_unique_id, под которыми он приходил.
+-- Обращение ссылается на media.id; повторное вложение с известным
+-- file_unique_id привязывается ещё до вставки (BEFORE-триггер) и не
+-- скачивается вовсе. complaints.file_url остаётся для старых строк.
+CREATE TABLE IF NOT EXISTS media(
+    id BIGSERIAL PRIMARY KEY,
+    sha256 TEXT NOT NULL UNIQUE,
+    s3_key TEXT NOT NULL,
+    url TEXT NOT NULL,
+    file_type TEXT,
+    size_bytes BIGINT NOT NULL DEFAULT 0,
+    reuse_count BIGINT NOT NULL DEFAULT 0,    -- повтор по file_unique_id: без скачивания и загрузки
+    dupe_count BIGINT NOT NULL DEFAULT 0,     -- то же содержимое под новым file_unique_id: лишний объект удалён
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    last_used_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS media_aliases(
+    file_unique_id TEXT PRIMARY KEY,
+    media_id BIGINT NOT NULL REFERENCES media(id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS media_aliases_media_idx ON media_aliases(media_id);
+
+ALTER TABLE complaints ADD COLUMN IF NOT EXISTS file_unique_id TEXT;
+ALTER TABLE complaints ADD COLUMN IF NOT EXISTS media_id BIGINT;
+ALTER TABLE media_jobs ADD COLUMN IF NOT EXISTS file_unique_id TEXT;
+ALTER TABLE media_jobs ADD COLUMN IF NOT EXISTS media_id BIGINT;
+
+CREATE OR REPLACE FUNCTION hotline_media_link() RETURNS trigger
+LANGUAGE plpgsql AS $fn$
+BEGIN
+    IF NEW.file_unique_id IS NOT NULL AND NEW.media_id IS NULL AND NEW.file_url IS NULL THEN
+        SELECT a.media_id INTO NEW.media_id FROM media_aliases a WHERE a.file_unique_id = NEW.file_unique_id;
+        IF NEW.media_id IS NOT NULL THEN
+            UPDATE media SET reuse_count = reuse_count + 1, last_used_at = now() WHERE id = NEW.media_id;
+        END IF;
+    END IF;
+    RETURN NEW;
+END
+$fn$;
+
+DROP TRIGGER IF EXISTS complaints_media_link_trg ON complaints;
+CREATE TRIGGER complaints_media_link_trg BEFORE INSERT ON complaints
+    FOR EACH ROW EXECUTE FUNCTION hotline_media_link();
+
+CREATE OR REPLACE FUNCTION hotline_media_job_ins() RETURNS trigger
+LANGUAGE plpgsql AS $fn$
+BEGIN
+    IF NEW.file_id IS NOT NULL AND NEW.file_url IS NULL AND NEW.media_id IS NULL
+       AND NEW.file_type IN ('photo','document','voice','video') THEN
+        INSERT INTO media_jobs(ticket_no, user_id, file_type, file_id, file_unique_id, created_at, run_after)
+        VALUES (NEW.ticket_no, NEW.user_id, NEW.file_type, NEW.file_id, NEW.file_unique_id,
+                COALESCE(NEW.created_at, now()), now());
+    END IF;
+    RETURN NULL;
+END
+$fn$;
+
+-- ссылка на вложение для чтения: новый путь через media, старые строки — file_url
+CREATE OR REPLACE VIEW complaint_files AS
+SELECT c.ticket_no, c.file_type, c.media_id, COALESCE(m.url, c.file_url) AS file_url
+FROM complaints c LEFT JOIN media m ON m.id = c.media_id
+WHERE c.file_id IS NOT NULL;
+
+-- hotline_submit принимает file_unique_id (новый последний параметр)
+DROP FUNCTION IF EXISTS hotline_submit(BIGINT, TEXT, TEXT, TEXT, TEXT, TEXT, TEXT, INT);
+CREATE OR REPLACE FUNCTION hotline_submit(
+    p_user_id BIGINT, p_username TEXT, p_full_name TEXT, p_text TEXT,
+    p_file_type TEXT, p_file_id TEXT, p_file_url TEXT, p_rate_sec INT, p_file_unique_id TEXT,
+    OUT outcome TEXT, OUT ticket TEXT, OUT category TEXT, OUT wait_sec INT)
+LANGUAGE plpgsql AS $fn$
+DECLARE
+    v_now  TIMESTAMP := now() AT TIME ZONE 'utc';
+    v_last TIMESTAMP;
+BEGIN
+    IF EXISTS (SELECT 1 FROM blocked_users WHERE user_id = p_user_id) THEN
+        outcome := 'blocked'; RETURN;
+    END IF;
+
+    SELECT s.category INTO category FROM user_state s WHERE s.user_id = p_user_id;
+    IF category IS NULL OR category NOT IN ('complaint','suggestion') THEN
+        outcome := 'no_category'; RETURN;
+    END IF;
+
+    IF p_rate_sec > 0 THEN
+        INSERT INTO rate_limiter(user_id, last_submit_at) VALUES (p_user_id, NULL)
+        ON CONFLICT (user_id) DO NOTHING;
+        SELECT last_submit_at INTO v_last FROM rate_limiter WHERE user_id = p_user_id FOR UPDATE;
+        IF v_last IS NOT NULL AND extract(epoch FROM v_now - v_last) < p_rate_sec THEN
+            outcome := 'rate_limited';
+            wait_sec := floor(p_rate_sec - extract(epoch FROM v_now - v_last))::int;
+            RETURN;
+        END IF;
+    END IF;
+
+    ticket := hotline_next_ticket(extract(year FROM v_now)::int);
+    INSERT INTO complaints(ticket_no, user_id, username, full_name, category, message_text,
+                           file_type, file_id, file_unique_id, file_url)
+    VALUES (ticket, p_user_id, p_username, p_full_name, category, p_text,
+            p_file_type, p_file_id, p_file_unique_id, p_file_url);
+    IF p_rate_sec > 0 THEN
+        UPDATE rate_limiter SET last_submit_at = v_now WHERE user_id = p_user_id;
+    END IF;
+    outcome := 'saved';
+END
+$fn$;
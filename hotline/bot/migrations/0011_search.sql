@@ -0,0 +1,23 @@
+-- Полнотекстовый поиск по message_text. search_tsv — словарь russian (стемминг)
+-- плюс simple (узбекская латиница и всё, чего нет в русском словаре).
+-- Колонка генерируемая: ADD COLUMN один раз перепишет таблицу, дальше её
+-- поддерживает сама БД, без триггера.
+ALTER TABLE complaints ADD COLUMN IF NOT EXISTS search_tsv tsvector
+    GENERATED ALWAYS AS (to_tsvector('russian', coalesce(message_text, ''))
+                         || to_tsvector('simple', coalesce(message_text, ''))) STORED;
+CREATE INDEX IF NOT EXISTS complaints_search_idx ON complaints USING GIN (search_tsv);
+
+-- Больше лексем в статистике: редкое слово оценивается как редкое, и
+-- планировщик берёт GIN, а не обратный проход по created_at (db.search_complaints)
+ALTER TABLE complaints ALTER COLUMN search_tsv SET STATISTICS 1000;
+
+-- Нечёткие совпадения (опечатки) — pg_trgm из contrib. В сборке без contrib
+-- расширение не ставится, и поиск работает только по search_tsv (db.has_trgm).
+DO $do$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') THEN
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        CREATE INDEX IF NOT EXISTS complaints_message_trgm_idx ON complaints USING GIN (message_text gin_trgm_ops);
+    END IF;
+END
+$do$;
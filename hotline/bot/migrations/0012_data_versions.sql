@@ -0,0 +1,36 @@
+-- Маркер изменений для условных ответов админки (ETag/Last-Modified на /api/*).
+-- version увеличивается триггером в той же транзакции, что и сами данные,
+-- поэтому опрос без изменений — одно чтение строки по первичному ключу.
+-- Триггеры уровня оператора: одна отправка обращения — одно обновление строки,
+-- как и строки stats_daily за сегодня, которые submit и так обновляет.
+CREATE TABLE IF NOT EXISTS data_versions(
+    name TEXT PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    changed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+INSERT INTO data_versions(name) VALUES ('complaints'), ('users') ON CONFLICT DO NOTHING;
+
+CREATE OR REPLACE FUNCTION hotline_data_version_bump() RETURNS trigger
+LANGUAGE plpgsql AS $fn$
+BEGIN
+    UPDATE data_versions SET version = version + 1, changed_at = now() WHERE name = TG_ARGV[0];
+    RETURN NULL;
+END
+$fn$;
+
+-- complaints: только колонки, которые видны в API. file_url и media_id
+-- пишет загрузчик вложений, на версию они не влияют.
+DROP TRIGGER IF EXISTS complaints_version_trg ON complaints;
+CREATE TRIGGER complaints_version_trg AFTER INSERT OR DELETE OR TRUNCATE ON complaints
+    FOR EACH STATEMENT EXECUTE FUNCTION hotline_data_version_bump('complaints');
+DROP TRIGGER IF EXISTS complaints_version_upd_trg ON complaints;
+CREATE TRIGGER complaints_version_upd_trg
+    AFTER UPDATE OF ticket_no, user_id, username, full_name, category, message_text, file_type, status, created_at
+    ON complaints
+    FOR EACH STATEMENT EXECUTE FUNCTION hotline_data_version_bump('complaints');
+
+-- user_summary ведётся триггером на вставку в complaints и пересобирается
+-- hotline_rebuild_user_summary(); оба пути проходят через этот триггер
+DROP TRIGGER IF EXISTS user_summary_version_trg ON user_summary;
+CREATE TRIGGER user_summary_version_trg AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON user_summary
+    FOR EACH STATEMENT EXECUTE FUNCTION hotline_data_version_bump('users');
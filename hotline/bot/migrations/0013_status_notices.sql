@@ -0,0 +1,10 @@
+-- Очередь уведомлений о смене статуса. Строки пишет тот же оператор, что
+-- меняет статус (db.set_statuses), бот забирает их пачками (notify.py) и
+-- отправляет по одному сообщению на пользователя, а не на заявку.
+CREATE TABLE IF NOT EXISTS status_notices(
+    id BIGSERIAL PRIMARY KEY,
+    user_id BIGINT NOT NULL,
+    ticket_no TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
@@ -0,0 +1,23 @@
+-- Исходящие сообщения бота: уведомления о статусе, копии в чат модераторов,
+-- рассылки. Строку забирает диспетчер (outbox.py) с lease, как media_jobs;
+-- после отправки строка удаляется, в таблице остаются очередь и failed.
+-- kind: text — payload {"text", "parse_mode"}; copy — {"from_chat_id",
+-- "message_id", "fallback"} (copyMessage, при ошибке — fallback текстом).
+CREATE TABLE IF NOT EXISTS outbox(
+    id BIGSERIAL PRIMARY KEY,
+    chat_id BIGINT NOT NULL,
+    kind TEXT NOT NULL CHECK (kind IN ('text','copy')),
+    payload JSONB NOT NULL,
+    priority SMALLINT NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending','sending','failed')),
+    attempts INT NOT NULL DEFAULT 0,
+    run_after TIMESTAMP NOT NULL DEFAULT NOW(),
+    locked_by TEXT,
+    locked_at TIMESTAMP,
+    last_error TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS outbox_queue_idx ON outbox(priority DESC, run_after, id)
+    WHERE status IN ('pending','sending');
+CREATE INDEX IF NOT EXISTS outbox_failed_idx ON outbox(created_at DESC, id DESC) WHERE status = 'failed';
+
@@ -0,0 +1,24 @@
+-- Рассылки по всем пользователям. texts — {"ru": ..., "uz": ...}, текст
+-- выбирается по user_profile.lang (нет своего языка — ru). Получатели не
+-- читаются разом: BroadcastRunner (broadcast.py) перекладывает их в outbox
+-- пачками по возрастанию user_id, и в той же транзакции сдвигает
+-- last_user_id — после падения рассылка продолжается с чекпоинта, без дублей
+-- и пропусков. queued/delivered/failed — счётчики строк outbox рассылки:
+-- delivered и failed увеличивает диспетчер, когда удаляет строку.
+CREATE TABLE IF NOT EXISTS broadcasts(
+    id BIGSERIAL PRIMARY KEY,
+    texts JSONB NOT NULL,
+    status TEXT NOT NULL DEFAULT 'running' CHECK (status IN ('running','done','cancelled')),
+    last_user_id BIGINT NOT NULL DEFAULT 0,
+    queued BIGINT NOT NULL DEFAULT 0,
+    delivered BIGINT NOT NULL DEFAULT 0,
+    failed BIGINT NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created_by BIGINT,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    finished_at TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS broadcasts_running_idx ON broadcasts(id) WHERE status = 'running';
+
+ALTER TABLE outbox ADD COLUMN IF NOT EXISTS broadcast_id BIGINT;
+CREATE INDEX IF NOT EXISTS outbox_broadcast_idx ON outbox(broadcast_id) WHERE broadcast_id IS NOT NULL;
@@ -0,0 +1,231 @@
+-- complaints секционируется по месяцам created_at: complaints_YYYY_MM.
+-- Списки идут по (created_at DESC, id DESC) и с LIMIT читают только
+-- последние секции (упорядоченный Append), выгрузки с датами и поиск по
+-- номеру заявки (в номере год) отсекают лишние секции, VACUUM работает с
+-- месяцем, а не со всей историей, старые месяцы отсоединяются целиком
+-- (bot/partitions.py, manage.py archive).
+--
+-- Секции по умолчанию нет намеренно: с ней планировщик не может читать
+-- секции по порядку. Секции создаются заранее — здесь, в init_db, в боте
+-- раз в сутки и manage.py partitions — на PARTITIONS_AHEAD месяцев вперёд.
+--
+-- Первичный ключ — (id, created_at). Уникальный индекс на секционированной
+-- таблице обязан включать ключ секционирования, поэтому уникальность номера
+-- заявки (0002) держит отдельная несекционированная complaint_tickets с
+-- первичным ключом ticket_no: её ведёт триггер на complaints, дубликат
+-- (ручная вставка, импорт, сброс счётчика) падает с unique_violation.
+-- Внешних ключей на complaints нет: media_jobs и status_notices ссылаются
+-- по ticket_no.
+-- Перенос строки между секциями (UPDATE created_at) выполняется как
+-- DELETE + INSERT и снова сработал бы триггерами на вставку — created_at
+-- после вставки не меняется.
+
+-- секция месяца p_month: CREATE TABLE LIKE + ATTACH берёт у родителя
+-- SHARE UPDATE EXCLUSIVE, а не ACCESS EXCLUSIVE, — вставки и чтения не ждут.
+-- Индексы и триггеры родителя ATTACH создаёт на секции сам.
+CREATE OR REPLACE FUNCTION hotline_complaints_partition(p_month DATE) RETURNS TEXT
+LANGUAGE plpgsql AS $fn$
+DECLARE
+    v_from DATE := date_trunc('month', p_month)::date;
+    v_name TEXT := 'complaints_' || to_char(p_month, 'YYYY_MM');
+BEGIN
+    IF to_regclass(v_name) IS NOT NULL THEN
+        RETURN NULL;  -- уже есть (или отсоединена архивацией и ждёт выгрузки)
+    END IF;
+    EXECUTE format('CREATE TABLE %I (LIKE complaints INCLUDING DEFAULTS INCLUDING GENERATED INCLUDING CONSTRAINTS)',
+                   v_name);
+    EXECUTE format('ALTER TABLE complaints ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                   v_name, v_from, (v_from + interval '1 month')::date);
+    RETURN v_name;
+END
+$fn$;
+
+-- текущий месяц и p_ahead следующих (по часам БД, как created_at DEFAULT now());
+-- p_since — ещё и прошлые месяцы начиная с него (импорт истории, засев бенчмарков)
+CREATE OR REPLACE FUNCTION hotline_ensure_complaints_partitions(p_ahead INT, p_since DATE DEFAULT NULL)
+RETURNS SETOF TEXT
+LANGUAGE plpgsql AS $fn$
+DECLARE
+    m DATE;
+    v_name TEXT;
+BEGIN
+    FOR m IN
+        SELECT generate_series(date_trunc('month', LEAST(COALESCE(p_since, now()), now())),
+                               date_trunc('month', now()) + make_interval(months => p_ahead), interval '1 month')::date
+    LOOP
+        v_name := hotline_complaints_partition(m);
+        IF v_name IS NOT NULL THEN
+            RETURN NEXT v_name;
+        END IF;
+    END LOOP;
+END
+$fn$;
+
+CREATE TABLE IF NOT EXISTS complaint_tickets(
+    ticket_no TEXT PRIMARY KEY,
+    created_at TIMESTAMP NOT NULL
+);
+
+CREATE OR REPLACE FUNCTION hotline_complaint_ticket_trg() RETURNS trigger
+LANGUAGE plpgsql AS $fn$
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        TRUNCATE complaint_tickets;
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.ticket_no IS NOT NULL THEN
+        DELETE FROM complaint_tickets WHERE ticket_no = OLD.ticket_no;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.ticket_no IS NOT NULL THEN
+        INSERT INTO complaint_tickets(ticket_no, created_at) VALUES (NEW.ticket_no, NEW.created_at);
+    END IF;
+    RETURN NULL;
+END
+$fn$;
+
+-- Отсоединение месяца перед архивацией. Производные таблицы приводятся к
+-- тому, что было бы после DELETE этих строк (DETACH триггеров не вызывает):
+-- user_summary — минус их счётчики (last_activity не меняется: оставшиеся
+-- строки пользователя новее), stats_daily — без дней этого месяца,
+-- media_jobs — без заданий этих заявок, complaint_tickets — без их номеров.
+-- Возвращает число строк в секции.
+CREATE OR REPLACE FUNCTION hotline_detach_complaints_partition(p_name TEXT) RETURNS BIGINT
+LANGUAGE plpgsql AS $fn$
+DECLARE
+    v_from DATE;
+    n BIGINT;
+BEGIN
+    IF p_name !~ '^complaints_\d{4}_\d{2}$' OR NOT EXISTS (
+        SELECT 1 FROM pg_inherits WHERE inhparent = 'complaints'::regclass AND inhrelid = to_regclass(p_name)
+    ) THEN
+        RAISE EXCEPTION 'not a partition of complaints: %', p_name;
+    END IF;
+    v_from := to_date(right(p_name, 7), 'YYYY_MM');
+    EXECUTE format('LOCK TABLE %I IN SHARE MODE', p_name);  -- смена статуса в этом месяце подождёт
+
+    EXECUTE format($q$
+        UPDATE user_summary s SET total_messages = s.total_messages - a.total,
+               complaints_count = s.complaints_count - a.complaints,
+               suggestions_count = s.suggestions_count - a.suggestions
+        FROM (
+            SELECT user_id, COUNT(*) AS total,
+                   COUNT(*) FILTER (WHERE category = 'complaint') AS complaints,
+                   COUNT(*) FILTER (WHERE category = 'suggestion') AS suggestions
+            FROM %I WHERE user_id IS NOT NULL
+            GROUP BY user_id
+        ) a
+        WHERE s.user_id = a.user_id
+    $q$, p_name);
+    DELETE FROM user_summary WHERE total_messages <= 0;
+    DELETE FROM stats_daily WHERE day >= v_from AND day < (v_from + interval '1 month')::date;
+    EXECUTE format('DELETE FROM media_jobs WHERE ticket_no IN (SELECT ticket_no FROM %I)', p_name);
+    EXECUTE format('DELETE FROM complaint_tickets WHERE ticket_no IN (SELECT ticket_no FROM %I)', p_name);
+    EXECUTE format('SELECT COUNT(*) FROM %I', p_name) INTO n;
+
+    EXECUTE format('ALTER TABLE complaints DETACH PARTITION %I', p_name);
+    UPDATE data_versions SET version = version + 1, changed_at = now() WHERE name = 'complaints';
+    RETURN n;
+END
+$fn$;
+
+-- ===== перестройка таблицы =====
+LOCK TABLE complaints IN ACCESS EXCLUSIVE MODE;
+DROP VIEW IF EXISTS complaint_files;
+ALTER TABLE complaints RENAME TO complaints_heap;
+
+CREATE TABLE complaints(
+    id BIGINT NOT NULL DEFAULT nextval('complaints_id_seq'),
+    ticket_no TEXT,
+    user_id BIGINT,
+    username TEXT,
+    full_name TEXT,
+    category TEXT DEFAULT 'complaint' CHECK (category IN ('complaint','suggestion')),
+    message_text TEXT,
+    file_type TEXT,
+    file_id TEXT,
+    file_url TEXT,
+    status TEXT DEFAULT 'new',
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    file_unique_id TEXT,
+    media_id BIGINT,
+    search_tsv tsvector GENERATED ALWAYS AS (to_tsvector('russian', coalesce(message_text, ''))
+                                             || to_tsvector('simple', coalesce(message_text, ''))) STORED
+) PARTITION BY RANGE (created_at);
+ALTER TABLE complaints ALTER COLUMN search_tsv SET STATISTICS 1000;
+ALTER SEQUENCE complaints_id_seq OWNED BY complaints.id;
+
+-- секции: от первого месяца с данными до PARTITIONS_AHEAD (3) месяцев вперёд
+DO $do$
+DECLARE
+    m DATE;
+BEGIN
+    FOR m IN
+        SELECT generate_series(date_trunc('month', min(created_at)), date_trunc('month', max(created_at)),
+                               interval '1 month')::date
+        FROM complaints_heap
+    LOOP
+        PERFORM hotline_complaints_partition(m);
+    END LOOP;
+    PERFORM hotline_ensure_complaints_partitions(3);
+END
+$do$;
+
+-- перенос до индексов и триггеров: вставка идёт без них, производные таблицы уже посчитаны
+INSERT INTO complaints(id, ticket_no, user_id, username, full_name, category, message_text, file_type, file_id,
+                       file_url, status, created_at, file_unique_id, media_id)
+SELECT id, ticket_no, user_id, username, full_name, category, message_text, file_type, file_id,
+       file_url, status, COALESCE(created_at, now()), file_unique_id, media_id
+FROM complaints_heap;
+DROP TABLE complaints_heap;
+INSERT INTO complaint_tickets(ticket_no, created_at)
+SELECT ticket_no, created_at FROM complaints WHERE ticket_no IS NOT NULL;
+
+ALTER TABLE complaints ADD PRIMARY KEY (id, created_at);
+CREATE INDEX complaints_ticket_no_idx ON complaints(ticket_no);
+CREATE INDEX complaints_category_created_idx ON complaints(category, created_at DESC, id DESC);
+CREATE INDEX complaints_user_created_idx ON complaints(user_id, created_at DESC, id DESC);
+CREATE INDEX complaints_created_idx ON complaints(created_at DESC, id DESC);
+CREATE INDEX complaints_search_idx ON complaints USING GIN (search_tsv);
+DO $do$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') THEN
+        CREATE INDEX complaints_message_trgm_idx ON complaints USING GIN (message_text gin_trgm_ops);
+    END IF;
+END
+$do$;
+
+-- триггеры те же, что в 0006, 0007, 0009, 0010, 0012; на секционированной
+-- таблице строковые триггеры наследуются всеми секциями
+CREATE TRIGGER complaints_media_link_trg BEFORE INSERT ON complaints
+    FOR EACH ROW EXECUTE FUNCTION hotline_media_link();
+CREATE TRIGGER complaints_user_summary_trg AFTER INSERT ON complaints
+    FOR EACH ROW EXECUTE FUNCTION hotline_user_summary_ins();
+CREATE TRIGGER complaints_stats_ins_trg AFTER INSERT OR DELETE ON complaints
+    FOR EACH ROW EXECUTE FUNCTION hotline_stats_daily_trg();
+CREATE TRIGGER complaints_stats_upd_trg AFTER UPDATE OF status, category, created_at ON complaints
+    FOR EACH ROW
+    WHEN (OLD.status IS DISTINCT FROM NEW.status
+          OR OLD.category IS DISTINCT FROM NEW.category
+          OR OLD.created_at IS DISTINCT FROM NEW.created_at)
+    EXECUTE FUNCTION hotline_stats_daily_trg();
+CREATE TRIGGER complaints_media_job_trg AFTER INSERT ON complaints
+    FOR EACH ROW EXECUTE FUNCTION hotline_media_job_ins();
+-- UPDATE строки между секциями — тоже UPDATE (или DELETE + INSERT): номер переписывается с новым created_at
+CREATE TRIGGER complaints_ticket_trg AFTER INSERT OR DELETE OR UPDATE OF ticket_no, created_at ON complaints
+    FOR EACH ROW EXECUTE FUNCTION hotline_complaint_ticket_trg();
+CREATE TRIGGER complaints_ticket_truncate_trg AFTER TRUNCATE ON complaints
+    FOR EACH STATEMENT EXECUTE FUNCTION hotline_complaint_ticket_trg();
+CREATE TRIGGER complaints_version_trg AFTER INSERT OR DELETE OR TRUNCATE ON complaints
+    FOR EACH STATEMENT EXECUTE FUNCTION hotline_data_version_bump('complaints');
+CREATE TRIGGER complaints_version_upd_trg
+    AFTER UPDATE OF ticket_no, user_id, username, full_name, category, message_text, file_type, status, created_at
+    ON complaints
+    FOR EACH STATEMENT EXECUTE FUNCTION hotline_data_version_bump('complaints');
+
+-- created_at — чтобы поиск по номеру заявки отсекал секции (db.get_file_url)
+CREATE VIEW complaint_files AS
+SELECT c.ticket_no, c.file_type, c.media_id, COALESCE(m.url, c.file_url) AS file_url, c.created_at
+FROM complaints c LEFT JOIN media m ON m.id = c.media_id
+WHERE c.file_id IS NOT NULL;
+
+ANALYZE complaints;
@@ -0,0 +1,9 @@
+-- Живые диспетчеры outbox (outbox.py): каждый раз в OUTBOX_POLL_SEC
+-- обновляет seen_at и делит общий OUTBOX_RATE на число записей моложе
+-- OUTBOX_ALIVE_SEC — несколько реплик бота вместе не превышают лимит
+-- Telegram на бота. Остановленный диспетчер удаляет свою запись сам,
+-- упавший — выпадает по seen_at.
+CREATE TABLE IF NOT EXISTS outbox_dispatchers(
+    name TEXT PRIMARY KEY,
+    seen_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
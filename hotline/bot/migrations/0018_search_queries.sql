@@ -0,0 +1,9 @@
+-- Запросы /search для кнопок листания (main.py): текст в callback_data не
+-- помещается, кнопка несёт ключ — хэш запроса. В таблице, а не в памяти
+-- процесса: нажатие может прийти в другую реплику (webhook) или после
+-- перезапуска. Старше SEARCH_KEEP_DAYS удаляются при сохранении новых.
+CREATE TABLE IF NOT EXISTS search_queries(
+    key TEXT PRIMARY KEY,
+    query TEXT NOT NULL,
+    used_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
@@ -0,0 +1,78 @@
+import os, asyncio, logging
+
+try:
+    from . import adb
+    from .db import OutboxMessage
+    from .outbox import PRIORITY_NOTICE
+except ImportError:
+    import adb
+    from db import OutboxMessage
+    from outbox import PRIORITY_NOTICE
+
+# Уведомления о смене статуса: смена статуса (в том числе массовая из админки)
+# пишет их в status_notices, StatusNotifier забирает очередь пачками по
+# NOTIFY_BATCH, склеивает по пользователю — одно сообщение на все его заявки
+# из пачки — и в той же транзакции перекладывает в outbox. Отправкой и
+# лимитами Telegram занимается OutboxDispatcher (outbox.py).
+NOTIFY_BATCH    = int(os.getenv("NOTIFY_BATCH", "500"))
+NOTIFY_POLL_SEC = float(os.getenv("NOTIFY_POLL_SEC", "5"))
+
+log = logging.getLogger("hotline.notify")
+
+def group_notices(rows) -> list[tuple[int, str | None, list[tuple[str, str]]]]:
+    # (user_id, lang, [(ticket, status), ...]); для заявки остаётся последний статус
+    users: dict[int, tuple[str | None, dict[str, str]]] = {}
+    for uid, ticket, status, lang in rows:
+        users.setdefault(uid, (lang, {}))[1][ticket] = status
+    return [(uid, lang, list(items.items())) for uid, (lang, items) in users.items()]
+
+class StatusNotifier:
+    # render(lang, [(ticket, status), ...]) -> текст; outbox — диспетчер, которого будим после пачки
+    def __init__(self, render, outbox=None, batch: int = NOTIFY_BATCH, poll_sec: float = NOTIFY_POLL_SEC):
+        self.render = render
+        self.outbox = outbox
+        self.batch = batch
+        self.poll_sec = poll_sec
+        self.queued = 0
+        self._wake = asyncio.Event()
+        self._stopping = False
+        self._task: asyncio.Task | None = None
+
+    def wake(self):
+        self._wake.set()
+
+    async def start(self):
+        self._stopping = False
+        self._task = asyncio.create_task(self._loop(), name="status-notifier")
+
+    async def stop(self):
+        self._stopping = True
+        self._wake.set()
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self):
+        while not self._stopping:
+            try:
+                n = await self.drain_once()
+            except Exception:
+                log.exception("status notices failed")
+                n = 0
+            if n < self.batch:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_sec)
+                except asyncio.TimeoutError:
+                    pass
+
+    def build(self, rows) -> list[OutboxMessage]:
+        return [OutboxMessage(uid, "text", {"text": self.render(lang, items)}, PRIORITY_NOTICE)
+                for uid, lang, items in group_notices(rows)]
+
+    async def drain_once(self) -> int:
+        n = await adb.drain_status_notices(self.build, self.batch)
+        if n and self.outbox is not None:
+            self.outbox.wake()
+        self.queued += n
+        return n
@@ -0,0 +1,256 @@
+import os, time, socket, random, asyncio, logging
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest
+
+try:
+    from . import adb, metrics
+except ImportError:
+    import adb, metrics
+
+# Всё, что бот отправляет сам (уведомления о статусе, копии в чат модераторов,
+# рассылки), идёт через таблицу outbox (миграция 0014): обработчик ставит
+# строку в очередь и сразу отвечает пользователю, а OutboxDispatcher шлёт
+# в темпе, который выдерживает Telegram. Два уровня token bucket: общий на
+# бота (OUTBOX_RATE/с) и на чат — личный OUTBOX_CHAT_RATE/с, группа
+# OUTBOX_GROUP_RATE/с (лимиты Telegram: ~30/с на бота, 1/с в чат, 20/мин в группу).
+# 429 (retry_after) приостанавливает чат и общий поток на указанное время.
+#
+# Диспетчеров может быть несколько (реплики бота в режиме webhook).
+# OUTBOX_RATE и OUTBOX_BURST — на всего бота: живые диспетчеры отмечаются в
+# outbox_dispatchers (миграция 0017) и делят их поровну, новый сосед
+# учитывается в пределах OUTBOX_POLL_SEC. Чат забирает один диспетчер за раз
+# (db.claim_outbox), поэтому темп чата и порядок держит его ведро. Ведро чата
+# в памяти процесса: чат, перешедший к соседу между пачками, может получить
+# у него до OUTBOX_CHAT_BURST сообщений подряд.
+OUTBOX_RATE         = float(os.getenv("OUTBOX_RATE", "25"))
+OUTBOX_BURST        = int(os.getenv("OUTBOX_BURST", "5"))  # за любую секунду — не больше RATE + BURST
+OUTBOX_CHAT_RATE    = float(os.getenv("OUTBOX_CHAT_RATE", "1"))
+OUTBOX_GROUP_RATE   = float(os.getenv("OUTBOX_GROUP_RATE", str(20 / 60)))
+OUTBOX_CHAT_BURST   = int(os.getenv("OUTBOX_CHAT_BURST", "3"))
+OUTBOX_BATCH        = int(os.getenv("OUTBOX_BATCH", "100"))
+OUTBOX_LEASE_SEC    = int(os.getenv("OUTBOX_LEASE_SEC", "120"))
+OUTBOX_POLL_SEC     = float(os.getenv("OUTBOX_POLL_SEC", "1"))
+OUTBOX_DEFER_SEC    = float(os.getenv("OUTBOX_DEFER_SEC", "3"))  # чат не держит пачку дольше — остаток в очередь
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+OUTBOX_BACKOFF_BASE = float(os.getenv("OUTBOX_BACKOFF_BASE", "5"))
+OUTBOX_BACKOFF_MAX  = float(os.getenv("OUTBOX_BACKOFF_MAX", "600"))
+OUTBOX_DRAIN_SEC    = float(os.getenv("OUTBOX_DRAIN_SEC", "10"))
+OUTBOX_ALIVE_SEC    = float(os.getenv("OUTBOX_ALIVE_SEC", "5"))  # диспетчер без отметки дольше — выбыл
+
+# приоритет в очереди: уведомления и копии модераторам обгоняют рассылку
+PRIORITY_NOTICE    = 10
+PRIORITY_BROADCAST = 0
+
+log = logging.getLogger("hotline.outbox")
+
+class TokenBucket:
+    # GCRA (virtual scheduling): tat — момент, к которому ведро снова полное.
+    # reserve(at) выдаёт момент отправки не раньше at: burst подряд, дальше —
+    # раз в 1/rate. Слоты считаются по времени фактической отправки, поэтому
+    # отправка, задержанная общим ведром, не даёт чату потом выстрелить пачкой.
+    def __init__(self, rate: float, burst: int = 1):
+        self.set_rate(rate, burst)
+        self.tat = 0.0
+        self.paused_until = 0.0
+
+    def set_rate(self, rate: float, burst: int = 1):
+        self.interval = 1 / rate
+        self.tolerance = (max(1, burst) - 1) * self.interval
+
+    def reserve(self, at: float = 0.0) -> float:
+        start = max(at, time.monotonic(), self.paused_until, self.tat - self.tolerance)
+        self.tat = max(self.tat, start) + self.interval
+        return start
+
+    def settle(self, sent_at: float):
+        # последний слот ушёл позже выданного (ждали другое ведро) — сдвигаем расписание
+        self.tat = max(self.tat - self.interval, sent_at) + self.interval
+
+    def cancel(self):
+        self.tat -= self.interval
+
+    def pause(self, sec: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + sec)
+
+    def paused_for(self) -> float:
+        return max(0.0, self.paused_until - time.monotonic())
+
+    def idle(self) -> bool:
+        now = time.monotonic()
+        return self.tat <= now and self.paused_until <= now
+
+def backoff(attempts: int) -> float:
+    delay = min(OUTBOX_BACKOFF_MAX, OUTBOX_BACKOFF_BASE * 2 ** max(0, attempts - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+class OutboxDispatcher:
+    def __init__(self, bot: Bot, rate: float = OUTBOX_RATE, burst: int = OUTBOX_BURST, chat_rate: float = OUTBOX_CHAT_RATE,
+                 group_rate: float = OUTBOX_GROUP_RATE, batch: int = OUTBOX_BATCH, poll_sec: float = OUTBOX_POLL_SEC,
+                 name: str | None = None):
+        self.bot = bot
+        self.rate = rate
+        self.burst = burst
+        self.dispatchers = 1
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.batch = batch
+        self.poll_sec = poll_sec
+        self.bucket = TokenBucket(rate, burst)
+        self.chats: dict[int, TokenBucket] = {}
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self.sent = self.failed = self.retried = self.throttled = self.deferred = 0
+        self._wake = asyncio.Event()
+        self._stopping = False
+        self._task: asyncio.Task | None = None
+        self._beat_task: asyncio.Task | None = None
+
+    def wake(self):
+        self._wake.set()
+
+    async def start(self):
+        self._stopping = False
+        try:
+            await self._beat()
+        except Exception:
+            log.exception("outbox heartbeat failed")  # до первой отметки — полный темп
+        self._task = asyncio.create_task(self._loop(), name="outbox")
+        self._beat_task = asyncio.create_task(self._beat_loop(), name="outbox-beat")
+
+    async def stop(self, timeout: float = OUTBOX_DRAIN_SEC):
+        # текущая пачка доотправляется; недосланное заберут заново по истечении lease
+        self._stopping = True
+        self._wake.set()
+        if self._task is None:
+            return
+        _, pending = await asyncio.wait([self._task], timeout=timeout)
+        for t in pending:
+            t.cancel()
+        self._beat_task.cancel()
+        await asyncio.gather(*pending, self._beat_task, return_exceptions=True)
+        self._task = self._beat_task = None
+        try:
+            await adb.outbox_leave(self.name)  # соседи заберут долю темпа, не дожидаясь OUTBOX_ALIVE_SEC
+        except Exception:
+            log.exception("outbox_leave failed")
+
+    async def _beat(self):
+        # общий темп делится поровну между живыми диспетчерами
+        n = max(1, await adb.outbox_heartbeat(self.name, OUTBOX_ALIVE_SEC))
+        if n != self.dispatchers:
+            log.info("outbox dispatchers: %d, rate %.2f/s", n, self.rate / n)
+        self.dispatchers = n
+        self.bucket.set_rate(self.rate / n, max(1, self.burst // n))
+
+    async def _beat_loop(self):
+        while True:
+            await asyncio.sleep(min(self.poll_sec, OUTBOX_ALIVE_SEC / 3))
+            try:
+                await self._beat()
+            except Exception:
+                log.exception("outbox heartbeat failed")
+
+    async def _loop(self):
+        while not self._stopping:
+            try:
+                rows = await adb.claim_outbox(self.name, self.claim_size(), OUTBOX_LEASE_SEC)
+            except Exception:
+                log.exception("claim_outbox failed")
+                rows = []
+            if not rows:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_sec)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self.process(rows)
+            except Exception:
+                log.exception("outbox batch failed")
+
+    def claim_size(self) -> int:
+        # пачка должна уйти за половину lease и при доле темпа, иначе её заберёт сосед и отправит ещё раз
+        return max(1, min(self.batch, int(self.rate / self.dispatchers * OUTBOX_LEASE_SEC / 2)))
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        b = self.chats.get(chat_id)
+        if b is None:
+            if len(self.chats) >= 10_000:
+                self.chats = {k: v for k, v in self.chats.items() if not v.idle()}
+            b = self.chats[chat_id] = TokenBucket(self.chat_rate if chat_id > 0 else self.group_rate,
+                                                  OUTBOX_CHAT_BURST)
+        return b
+
+    async def process(self, rows):
+        # чаты обрабатываются параллельно, внутри чата — по порядку очереди
+        by_chat: dict[int, list] = {}
+        for row in rows:
+            by_chat.setdefault(row.chat_id, []).append(row)
+        done: list[int] = []
+        deadline = time.monotonic() + OUTBOX_DEFER_SEC
+        try:
+            await asyncio.gather(*(self._send_chat(chat_id, items, done, deadline) for chat_id, items in by_chat.items()))
+        finally:
+            # и при остановке посреди пачки: отправленное не уйдёт повторно после lease
+            await adb.complete_outbox(done)
+
+    async def _send_chat(self, chat_id: int, rows, done: list[int], deadline: float):
+        chat = self._chat_bucket(chat_id)
+        for i, row in enumerate(rows):
+            now = time.monotonic()
+            at = max(chat.reserve(), now + self.bucket.paused_for())
+            if at > max(now, deadline):
+                # медленный чат (группа, пауза после 429) не держит пачку: остаток уходит обратно в очередь
+                chat.cancel()
+                await adb.defer_outbox([r.id for r in rows[i:]], at - now)
+                self.deferred += len(rows) - i
+                metrics.OUTBOX_SENDS.labels("deferred").inc(len(rows) - i)
+                return
+            send_at = self.bucket.reserve(at)
+            chat.settle(send_at)
+            if send_at > now:
+                await asyncio.sleep(send_at - now)
+            try:
+                await self.deliver(row.chat_id, row.kind, row.payload)
+            except TelegramRetryAfter as e:
+                self.throttled += 1
+                metrics.OUTBOX_SENDS.labels("throttled").inc()
+                chat.pause(e.retry_after)
+                self.bucket.pause(e.retry_after)
+                await adb.pause_outbox_chat(chat_id, [r.id for r in rows[i:]], e.retry_after)
+                return
+            except (TelegramForbiddenError, TelegramBadRequest) as e:
+                # бот заблокирован пользователем, чат не найден, битый текст — повтор не поможет
+                await adb.fail_outbox(row.id, f"{type(e).__name__}: {e}", None)
+                self.failed += 1
+                metrics.OUTBOX_SENDS.labels("failed").inc()
+            except Exception as e:
+                final = row.attempts >= OUTBOX_MAX_ATTEMPTS
+                await adb.fail_outbox(row.id, f"{type(e).__name__}: {e}", None if final else backoff(row.attempts))
+                if final:
+                    self.failed += 1
+                    log.warning("outbox %s to %s failed: %s", row.id, row.chat_id, e)
+                else:
+                    self.retried += 1
+                metrics.OUTBOX_SENDS.labels("failed" if final else "retried").inc()
+            else:
+                done.append(row.id)
+                self.sent += 1
+                metrics.OUTBOX_SENDS.labels("sent").inc()
+
+    async def deliver(self, chat_id: int, kind: str, payload: dict):
+        if kind == "copy":
+            try:
+                await self.bot.copy_message(chat_id, payload["from_chat_id"], payload["message_id"])
+                return
+            except TelegramBadRequest:
+                # исходное сообщение удалено или тип не копируется — шлём текстом
+                if not payload.get("fallback"):
+                    raise
+                payload = {"text": payload["fallback"], "parse_mode": None}
+        kw = {"parse_mode": payload["parse_mode"]} if "parse_mode" in payload else {}
+        await self.bot.send_message(chat_id, payload["text"], **kw)
+
+    def stats(self) -> dict:
+        return {"sent": self.sent, "failed": self.failed, "retried": self.retried, "throttled": self.throttled,
+                "deferred": self.deferred, "chats": len(self.chats), "dispatchers": self.dispatchers}
@@ -0,0 +1,136 @@
+import os, gzip, asyncio, logging, datetime
+
+try:
+    from . import db, adb
+except ImportError:
+    import db, adb
+
+# Секции complaints по месяцам (миграция 0016). PartitionKeeper в процессе
+# бота раз в PARTITIONS_CHECK_SEC создаёт секции наперёд (db.ensure_partitions):
+# секции по умолчанию нет, и вставка в месяц без секции упала бы.
+#
+# archive() — хранение (manage.py archive). Месяцы старше keep_months
+# отсоединяются (user_summary и stats_daily вычитаются в той же транзакции),
+# затем с каждой отсоединённой таблицей по очереди: выгрузка в
+# <export_dir>/complaints_YYYY_MM.csv.gz (COPY, все колонки, кроме
+# генерируемой search_tsv), удаление из S3 вложений, которыми не пользуются
+# живые обращения, DROP TABLE. Каждый шаг повторяем: прерванная архивация
+# продолжается следующим запуском с оставшихся отсоединённых таблиц.
+#
+# Вернуть месяц: CREATE TABLE complaints_YYYY_MM (LIKE complaints INCLUDING DEFAULTS
+# INCLUDING GENERATED INCLUDING CONSTRAINTS), COPY ... FROM выгрузки (CSV, HEADER),
+# ALTER TABLE complaints ATTACH PARTITION ..., затем manage.py users-rebuild и stats-rebuild.
+PARTITIONS_CHECK_SEC = float(os.getenv("PARTITIONS_CHECK_SEC", str(6 * 3600)))
+ARCHIVE_GZIP_LEVEL   = int(os.getenv("ARCHIVE_GZIP_LEVEL", "6"))
+
+ARCHIVE_COLS = ["id", "ticket_no", "user_id", "username", "full_name", "category", "message_text", "file_type",
+                "file_id", "file_url", "status", "created_at", "file_unique_id", "media_id"]
+
+log = logging.getLogger("hotline.partitions")
+
+def add_months(d: datetime.date, n: int) -> datetime.date:
+    y, m = divmod(d.year * 12 + d.month - 1 + n, 12)
+    return datetime.date(y, m + 1, 1)
+
+def archive_cutoff(keep_months: int, today: datetime.date | None = None) -> datetime.date:
+    # остаются текущий месяц и keep_months предыдущих; архивируются секции, кончившиеся до границы
+    today = today or datetime.date.today()
+    return add_months(today.replace(day=1), -keep_months)
+
+def export_table(name: str, directory: str) -> tuple[str, int | None]:
+    # -> (путь, строк); файл пишется во временный и переименовывается после сверки
+    # с COUNT(*), так что готовый файл — всегда полный, и повторный запуск его не
+    # перезаписывает (строк — None)
+    path = os.path.join(directory, f"{name}.csv.gz")
+    if os.path.exists(path):
+        return path, None
+    os.makedirs(directory, exist_ok=True)
+    tmp = path + ".part"
+    raw = db.get_engine().raw_connection()
+    try:
+        cur = raw.cursor()
+        cur.execute("SET LOCAL statement_timeout = 0")
+        with gzip.open(tmp, "wb", compresslevel=ARCHIVE_GZIP_LEVEL) as f:
+            cur.copy_expert(f"COPY (SELECT {', '.join(ARCHIVE_COLS)} FROM {name} ORDER BY created_at, id) "
+                            "TO STDOUT WITH (FORMAT csv, HEADER)", f)
+        rows = cur.rowcount
+        cur.execute(f"SELECT COUNT(*) FROM {name}")
+        expected = cur.fetchone()[0]
+        raw.commit()
+    finally:
+        raw.close()
+    if rows != expected:
+        os.remove(tmp)
+        raise RuntimeError(f"{name}: exported {rows} rows of {expected}")
+    os.replace(tmp, path)
+    return path, rows
+
+def archive(keep_months: int, export_dir: str | None = None, drop: bool = False, delete_media: bool = False,
+            dry_run: bool = False, today: datetime.date | None = None) -> list[dict]:
+    if drop and not export_dir:
+        raise ValueError("--drop needs --export-dir: the rows would be lost")
+    if delete_media and not drop:
+        raise ValueError("--delete-media needs --drop: the archived rows still point to the files")
+    url_prefix = None
+    if delete_media and not dry_run:
+        import media
+        if not media.s3_enabled():
+            raise ValueError("--delete-media: S3 is not configured")
+        url_prefix = media.public_url("")
+    cutoff = archive_cutoff(keep_months, today)
+    out = []
+    for p in db.list_partitions():
+        if p.attached and add_months(p.month, 1) > cutoff:
+            continue
+        item = dict(name=p.name, month=p.month.isoformat(), attached=p.attached, rows=max(p.rows, 0))
+        out.append(item)
+        if dry_run:
+            continue
+        if p.attached:
+            item["rows"] = db.detach_partition(p.name)
+            log.info("detached %s: %s rows", p.name, item["rows"])
+        if export_dir:
+            item["file"], _ = export_table(p.name, export_dir)
+        if delete_media:
+            keys = db.delete_partition_media(p.name, url_prefix)
+            failed = media.delete_objects(keys)
+            item["media_deleted"] = len(keys) - len(failed)
+            if failed:
+                # строки media уже удалены — объекты остаются в бакете, повторный запуск их не найдёт
+                log.warning("%s: S3 did not delete %s objects: %s", p.name, len(failed), ", ".join(failed[:20]))
+                item["media_failed"] = len(failed)
+        if drop:
+            db.drop_partition(p.name)
+            item["dropped"] = True
+            log.info("dropped %s", p.name)
+    return out
+
+class PartitionKeeper:
+    def __init__(self, ahead: int = db.PARTITIONS_AHEAD, interval: float = PARTITIONS_CHECK_SEC):
+        self.ahead = ahead
+        self.interval = interval
+        self._stop = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    async def start(self):
+        self._stop.clear()
+        self._task = asyncio.create_task(self._loop(), name="partitions")
+
+    async def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self):
+        while not self._stop.is_set():
+            try:
+                created = await adb.ensure_partitions(self.ahead)
+                if created:
+                    log.info("created partitions: %s", ", ".join(created))
+            except Exception:
+                log.exception("partition maintenance failed")
+            try:
+                await asyncio.wait_for(self._stop.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,143 @@
+import os, abc, math, time, uuid
+from collections import deque
+
+# Лимит — скользящее окно: не больше `burst` обращений за `window` секунд.
+# Окно и burst можно задать отдельно для категории:
+#   RATE_LIMIT_SECONDS=30 RATE_LIMIT_BURST=1
+#   RATE_LIMIT_SECONDS_SUGGESTION=10 RATE_LIMIT_BURST_SUGGESTION=3
+# Счётчик один на пользователя во всех бэкендах, как rate_limiter у table:
+# категория выбирает окно и burst, с которыми проверяются все его обращения,
+# а не отдельный счётчик — чередование категорий не даёт лишних попыток.
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_SECONDS = int(os.getenv("RATE_LIMIT_SECONDS", "30"))
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "1"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+def policy_for(category: str | None) -> tuple[int, int]:
+    suffix = (category or "").upper()
+    window = int(os.getenv(f"RATE_LIMIT_SECONDS_{suffix}", RATE_LIMIT_SECONDS)) if suffix else RATE_LIMIT_SECONDS
+    burst = int(os.getenv(f"RATE_LIMIT_BURST_{suffix}", RATE_LIMIT_BURST)) if suffix else RATE_LIMIT_BURST
+    return window, max(1, burst)
+
+def widest_policy() -> tuple[int, int]:
+    # самое длинное окно и самый большой burst: сколько истории держать на пользователя
+    policies = [policy_for(c) for c in (None, "complaint", "suggestion")]
+    return max(w for w, _ in policies), max(b for _, b in policies)
+
+def wait_for(times, now: float, window: int, burst: int) -> float:
+    # times — моменты попыток по возрастанию; 0 — можно, иначе сколько секунд ждать
+    recent = [t for t in times if t > now - window]
+    return 0 if len(recent) < burst else recent[-burst] + window - now
+
+class RateLimiter(abc.ABC):
+    # hit() списывает одну попытку и возвращает, сколько секунд ждать (0 — можно);
+    # refund() возвращает попытку, если обращение так и не сохранилось.
+    # durable=True: решение принимает сама hotline_submit в транзакции вставки.
+    durable = False
+
+    @abc.abstractmethod
+    async def hit(self, user_id: int, category: str | None) -> int: ...
+
+    @abc.abstractmethod
+    async def refund(self, user_id: int, category: str | None): ...
+
+    def window_for(self, category: str | None) -> int:
+        return policy_for(category)[0]
+
+    async def close(self):
+        pass
+
+class MemoryLimiter(RateLimiter):
+    # Скользящее окно в памяти процесса. Подходит для одной реплики бота.
+    def __init__(self, max_keys: int = 200_000, clock=time.monotonic):
+        self.max_keys = max_keys
+        self.clock = clock
+        self._log: dict[tuple, deque] = {}
+
+    def check(self, user_id: int, category: str | None) -> int:
+        window, burst = policy_for(category)
+        longest, most = widest_policy()
+        now = self.clock()
+        q = self._log.get(user_id)
+        if q is None:
+            if len(self._log) >= self.max_keys:
+                self._sweep(now, longest)
+            q = self._log[user_id] = deque(maxlen=most)
+        while q and q[0] <= now - longest:
+            q.popleft()
+        wait = wait_for(q, now, window, burst)
+        if not wait:
+            q.append(now)
+            return 0
+        return max(1, math.ceil(wait))
+
+    async def hit(self, user_id: int, category: str | None) -> int:
+        return self.check(user_id, category)
+
+    async def refund(self, user_id: int, category: str | None):
+        q = self._log.get(user_id)
+        if q:
+            q.pop()
+
+    def _sweep(self, now: float, longest: int):
+        for key in [k for k, q in self._log.items() if not q or q[-1] <= now - longest]:
+            del self._log[key]
+
+# Lua: атомарное скользящее окно на sorted set, одна команда на решение.
+# История хранится за самое длинное окно (longest), считается — за окно категории.
+_REDIS_SCRIPT = """
+local key     = KEYS[1]
+local now     = tonumber(ARGV[1])
+local window  = tonumber(ARGV[2])
+local burst   = tonumber(ARGV[3])
+local longest = tonumber(ARGV[5])
+redis.call('ZREMRANGEBYSCORE', key, '-inf', now - longest)
+if redis.call('ZCOUNT', key, '(' .. (now - window), '+inf') < burst then
+    redis.call('ZADD', key, now, ARGV[4])
+    redis.call('PEXPIRE', key, math.ceil(longest * 1000))
+    return '0'
+end
+local nth = redis.call('ZREVRANGEBYSCORE', key, '+inf', '(' .. (now - window), 'WITHSCORES', 'LIMIT', burst - 1, 1)
+return tostring(tonumber(nth[2]) + window - now)
+"""
+
+class RedisLimiter(RateLimiter):
+    # Общий лимит для нескольких реплик бота (Redis или совместимый сервер).
+    def __init__(self, client=None, url: str = REDIS_URL, prefix: str = "hotline:rl:"):
+        if client is None:
+            import redis.asyncio as redis
+            client = redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+        self._script = client.register_script(_REDIS_SCRIPT)
+
+    async def hit(self, user_id: int, category: str | None) -> int:
+        window, burst = policy_for(category)
+        args = [time.time(), window, burst, uuid.uuid4().hex, widest_policy()[0]]
+        wait = float(await self._script(keys=[f"{self.prefix}{user_id}"], args=args))
+        return max(1, math.ceil(wait)) if wait > 0 else 0
+
+    async def refund(self, user_id: int, category: str | None):
+        # последняя попытка в окне — самая новая по времени
+        await self.client.zpopmax(f"{self.prefix}{user_id}")
+
+    async def close(self):
+        await self.client.aclose()
+
+class TableLimiter(RateLimiter):
+    # Старое поведение: rate_limiter в Postgres, проверка внутри hotline_submit.
+    # Переживает рестарты; burst не поддерживается (одно обращение на окно).
+    durable = True
+
+    async def hit(self, user_id: int, category: str | None) -> int:
+        return 0
+
+    async def refund(self, user_id: int, category: str | None):
+        pass  # hotline_submit пишет rate_limiter только при сохранении
+
+BACKENDS = {"memory": MemoryLimiter, "redis": RedisLimiter, "table": TableLimiter}
+
+def get_limiter(backend: str = RATE_LIMIT_BACKEND) -> RateLimiter:
+    if backend not in BACKENDS:
+        raise RuntimeError(f"Unknown RATE_LIMIT_BACKEND: {backend}")
+    return BACKENDS[backend]()
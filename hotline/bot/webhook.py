@@ -0,0 +1,130 @@
+import os, hmac, asyncio, logging
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from pydantic import ValidationError
+
+# Режим webhook: Telegram шлёт POST с Update, мы кладём его в ограниченную
+# очередь и сразу отвечаем 200. Обработку ведут WEBHOOK_WORKERS задач.
+# Если очередь полна — 503, Telegram повторит доставку (в т.ч. на другую реплику).
+#   BOT_MODE=webhook WEBHOOK_URL=https://bot.example.com WEBHOOK_SECRET=... python main.py
+# Без WEBHOOK_URL setWebhook не вызывается — удобно для локальной проверки
+# (bench/webhook_replay.py шлёт записанные Update на http://localhost:8080).
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").rstrip("/")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/tg/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "32"))
+WEBHOOK_QUEUE = int(os.getenv("WEBHOOK_QUEUE", "1000"))
+WEBHOOK_DRAIN_SEC = float(os.getenv("WEBHOOK_DRAIN_SEC", "25"))
+
+log = logging.getLogger("hotline.webhook")
+
+class UpdateQueue:
+    def __init__(self, dp: Dispatcher, bot: Bot, workers: int = WEBHOOK_WORKERS, maxsize: int = WEBHOOK_QUEUE):
+        self.dp = dp
+        self.bot = bot
+        self.workers = workers
+        self.queue: asyncio.Queue[Update] = asyncio.Queue(maxsize=maxsize)
+        self.accepting = False
+        self.processed = self.failed = self.rejected = 0
+        self._tasks: list[asyncio.Task] = []
+
+    def start(self):
+        self.accepting = True
+        self._tasks = [asyncio.create_task(self._worker(), name=f"update-worker-{i}") for i in range(self.workers)]
+
+    def offer(self, update: Update) -> bool:
+        if not self.accepting:
+            self.rejected += 1
+            return False
+        try:
+            self.queue.put_nowait(update)
+            return True
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+
+    async def _worker(self):
+        while True:
+            update = await self.queue.get()
+            try:
+                await self.dp.feed_update(self.bot, update)
+                self.processed += 1
+            except Exception:
+                self.failed += 1
+                log.exception("update %s failed", update.update_id)
+            finally:
+                self.queue.task_done()
+
+    async def drain(self, timeout: float = WEBHOOK_DRAIN_SEC):
+        # перестаём принимать, дожидаемся очереди и обработки в работе, затем гасим воркеров
+        self.accepting = False
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            log.warning("drain timeout: %s updates left in queue", self.queue.qsize())
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "accepting": self.accepting, "queued": self.queue.qsize(), "maxsize": self.queue.maxsize,
+            "workers": self.workers, "processed": self.processed, "failed": self.failed, "rejected": self.rejected,
+        }
+
+def check_secret(request: web.Request, secret: str) -> bool:
+    if not secret:
+        return True
+    return hmac.compare_digest(request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), secret)
+
+def build_app(dp: Dispatcher, bot: Bot, secret: str = WEBHOOK_SECRET, path: str = WEBHOOK_PATH,
+              workers: int = WEBHOOK_WORKERS, maxsize: int = WEBHOOK_QUEUE) -> web.Application:
+    updates = UpdateQueue(dp, bot, workers, maxsize)
+    app = web.Application()
+    app["updates"] = updates
+
+    async def handle(request: web.Request):
+        if not check_secret(request, secret):
+            return web.Response(status=401)
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": bot})
+        except (ValueError, ValidationError):
+            return web.Response(status=400)
+        if not updates.offer(update):
+            return web.Response(status=503, headers={"Retry-After": "1"})
+        return web.Response()
+
+    async def health(request: web.Request):
+        return web.json_response(updates.stats(), status=200 if updates.accepting else 503)
+
+    async def on_startup(app):
+        updates.start()
+        await dp.emit_startup(bot=bot, dispatcher=dp)
+        if WEBHOOK_URL:
+            await bot.set_webhook(
+                WEBHOOK_URL + path, secret_token=secret or None,
+                allowed_updates=dp.resolve_used_update_types(),
+                max_connections=min(100, max(1, workers)),
+            )
+
+    async def on_shutdown(app):
+        # сокет уже закрыт (AppRunner сначала останавливает сайты), новых запросов нет.
+        # Webhook не удаляем: другие реплики продолжают работать.
+        await updates.drain()
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
+        await bot.session.close()
+
+    app.router.add_post(path, handle)
+    app.router.add_get("/healthz", health)
+    app.on_startup.append(on_startup)
+    app.on_shutdown.append(on_shutdown)
+    return app
+
+def run_webhook(dp: Dispatcher, bot: Bot):
+    if not WEBHOOK_SECRET:
+        log.warning("WEBHOOK_SECRET is not set: webhook requests are not authenticated")
+    web.run_app(build_app(dp, bot), host=WEBHOOK_HOST, port=WEBHOOK_PORT,
+                shutdown_timeout=WEBHOOK_DRAIN_SEC + 5, print=None)